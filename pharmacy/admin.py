@@ -1,5 +1,80 @@
+from datetime import datetime, timedelta
+
 from django.contrib import admin
-from .models import Supplier, Medicine, Customer, Sale, SaleItem
+from django.db.models import Q, QuerySet
+from django.utils import timezone
+
+from .models import Branch, Supplier, Product, Medicine, Customer, Promotion, Sale, SaleItem
+from .pagination import CappedCountPaginator
+
+def _period_start(value, kind):
+    if kind == 'year':
+        return value.replace(month=1, day=1)
+    if kind == 'month':
+        return value.replace(day=1)
+    return value
+
+def _next_period(start, kind):
+    if kind == 'year':
+        return start.replace(year=start.year + 1)
+    if kind == 'month':
+        return start.replace(year=start.year + start.month // 12, month=start.month % 12 + 1)
+    return start + timedelta(days=1)
+
+class IndexedDatesQuerySet(QuerySet):
+    """Lists the date hierarchy's years, months or days with index seeks.
+
+    Django finds them with a ``SELECT DISTINCT`` over the truncated date,
+    which SQLite computes row by row across the whole table. Here each
+    period is found by reading the first row after the previous period in
+    index order, one seek per year, month or day that has rows.
+    """
+
+    def dates(self, field_name, kind, order='ASC'):
+        if kind not in ('year', 'month', 'day'):
+            return super().dates(field_name, kind, order)
+        return self._periods(field_name, kind, order, lambda value: value, lambda day: day)
+
+    def datetimes(self, field_name, kind, order='ASC', tzinfo=None):
+        if kind not in ('year', 'month', 'day'):
+            return super().datetimes(field_name, kind, order, tzinfo)
+        tz = tzinfo or timezone.get_current_timezone()
+        return self._periods(
+            field_name, kind, order,
+            lambda value: timezone.localtime(value, tz).date(),
+            lambda day: timezone.make_aware(datetime.combine(day, datetime.min.time()), tz),
+        )
+
+    def _periods(self, field_name, kind, order, to_date, from_date):
+        values = self.order_by(field_name).values_list(field_name, flat=True)
+        periods = []
+        value = values.first()
+        while value is not None:
+            start = _period_start(to_date(value), kind)
+            periods.append(from_date(start))
+            value = values.filter(**{f'{field_name}__gte': from_date(_next_period(start, kind))}).first()
+        return periods[::-1] if order == 'DESC' else periods
+
+class LargeTableAdmin(admin.ModelAdmin):
+    """Changelist settings for tables that grow with every sale.
+
+    Pages run a fixed number of queries: related objects shown in the list
+    come from ``list_select_related`` joins, the count stops at
+    ``CappedCountPaginator.count_limit`` and the unfiltered total is not
+    counted at all. The date hierarchy seeks its periods on the date's index.
+    """
+    paginator = CappedCountPaginator
+    show_full_result_count = False
+
+    def get_queryset(self, request):
+        queryset = super().get_queryset(request)
+        return IndexedDatesQuerySet(model=queryset.model, query=queryset.query, using=queryset._db,
+                                    hints=queryset._hints)
+
+@admin.register(Branch)
+class BranchAdmin(admin.ModelAdmin):
+    list_display = ['name', 'code', 'created_at']
+    search_fields = ['name', 'code']
 
 @admin.register(Supplier)
 class SupplierAdmin(admin.ModelAdmin):
@@ -7,14 +82,37 @@ class SupplierAdmin(admin.ModelAdmin):
     search_fields = ['name', 'contact_person', 'phone']
     list_filter = ['created_at']
 
+class MedicineInline(admin.TabularInline):
+    model = Medicine
+    fields = ['batch_number', 'supplier', 'expiry_date', 'purchase_price', 'selling_price', 'stock_quantity', 'minimum_stock']
+    autocomplete_fields = ['supplier']
+    extra = 0
+
+@admin.register(Product)
+class ProductAdmin(admin.ModelAdmin):
+    list_display = ['name', 'generic_name', 'category', 'manufacturer', 'updated_at']
+    search_fields = ['name', 'generic_name', 'manufacturer']
+    # No manufacturer filter: listing its values is a DISTINCT over every
+    # product on each page view. Search finds a manufacturer instead.
+    list_filter = ['category']
+    ordering = ['name']
+    inlines = [MedicineInline]
+
 @admin.register(Medicine)
-class MedicineAdmin(admin.ModelAdmin):
-    list_display = ['name', 'category', 'manufacturer', 'batch_number', 'stock_quantity', 'selling_price', 'expiry_date', 'is_low_stock']
-    search_fields = ['name', 'generic_name', 'manufacturer', 'batch_number']
-    list_filter = ['category', 'manufacturer', 'supplier', 'expiry_date']
+class MedicineAdmin(LargeTableAdmin):
+    list_display = ['product', 'batch_number', 'stock_quantity', 'selling_price', 'expiry_date', 'is_low_stock']
+    search_fields = ['product__name', 'product__generic_name', 'product__manufacturer', 'batch_number']
+    list_filter = ['product__category', 'needs_reorder', 'supplier', 'branch']
     list_editable = ['stock_quantity', 'selling_price']
-    ordering = ['name']
-    
+    list_select_related = ['product']
+    ordering = ['product__name', 'expiry_date']
+    date_hierarchy = 'expiry_date'
+    autocomplete_fields = ['product', 'supplier']
+
+    def get_queryset(self, request):
+        # Autocomplete results print the product name too.
+        return super().get_queryset(request).select_related('product')
+
     def is_low_stock(self, obj):
         return obj.is_low_stock
     is_low_stock.boolean = True
@@ -22,13 +120,22 @@ class MedicineAdmin(admin.ModelAdmin):
 
 class SaleItemInline(admin.TabularInline):
     model = SaleItem
+    autocomplete_fields = ['medicine']
     extra = 0
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('medicine__product')
+
 @admin.register(Sale)
-class SaleAdmin(admin.ModelAdmin):
-    list_display = ['id', 'customer', 'cashier', 'final_amount', 'payment_method', 'created_at']
-    list_filter = ['payment_method', 'created_at', 'cashier']
-    search_fields = ['customer__name', 'customer__phone']
+class SaleAdmin(LargeTableAdmin):
+    list_display = ['id', 'customer', 'cashier', 'branch', 'final_amount', 'payment_method', 'created_at']
+    list_filter = ['payment_method', 'cashier', 'branch']
+    list_select_related = ['customer', 'cashier', 'branch']
+    date_hierarchy = 'created_at'
+    # Newest first along sale_created_id_idx, which also serves the date filters.
+    ordering = ['-created_at', '-id']
+    search_fields = ['=id', 'customer__name', 'customer__phone']
+    autocomplete_fields = ['customer', 'cashier', 'branch']
     inlines = [SaleItemInline]
     readonly_fields = ['created_at']
 
@@ -38,8 +145,38 @@ class CustomerAdmin(admin.ModelAdmin):
     search_fields = ['name', 'phone', 'email']
     list_filter = ['created_at']
 
+@admin.register(Promotion)
+class PromotionAdmin(admin.ModelAdmin):
+    list_display = ['name', 'kind', 'product', 'category', 'manufacturer', 'supplier', 'percent',
+                    'buy_quantity', 'free_quantity', 'starts_on', 'ends_on', 'is_active']
+    list_filter = ['kind', 'is_active', 'category']
+    list_select_related = ['product', 'supplier']
+    list_editable = ['is_active']
+    search_fields = ['name', 'manufacturer', 'product__name']
+    autocomplete_fields = ['product', 'supplier']
+
 @admin.register(SaleItem)
-class SaleItemAdmin(admin.ModelAdmin):
-    list_display = ['sale', 'medicine', 'quantity', 'unit_price', 'total_price']
-    list_filter = ['sale__created_at']
-    search_fields = ['medicine__name', 'sale__id']
\ No newline at end of file
+class SaleItemAdmin(LargeTableAdmin):
+    list_display = ['sale', 'medicine', 'quantity', 'unit_price', 'discount_amount', 'total_price']
+    list_select_related = ['sale', 'medicine__product']
+    date_hierarchy = 'sale__created_at'
+    search_fields = ['medicine__product__name', '=sale__id']
+    autocomplete_fields = ['sale', 'medicine']
+
+    def get_ordering(self, request):
+        # With a date picked, walk that range of sale_created_id_idx. Without
+        # one, SQLite only avoids sorting every item when the order follows
+        # the item table's own sale index; sale ids grow with time anyway.
+        if any(param.startswith('sale__created_at__') for param in request.GET):
+            return ['-sale__created_at', '-sale__id', '-id']
+        return ['-sale_id', '-id']
+
+    def get_search_results(self, request, queryset, search_term):
+        # Find the matching batches first and reach their items through the
+        # medicine index; the default search joins every item to its product.
+        for word in search_term.split():
+            matches = Q(medicine__in=Medicine.objects.filter(product__name__icontains=word).values('id'))
+            if word.isdigit():
+                matches |= Q(sale_id=int(word))
+            queryset = queryset.filter(matches)
+        return queryset, False
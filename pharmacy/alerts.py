@@ -0,0 +1,104 @@
+"""Incremental low stock and expiry alerts.
+
+``scan`` keeps ``StockAlert`` in step with the batches: a batch gets an
+open low stock alert while it is at or under its minimum, and an expiring
+or expired alert once its expiry date comes within ``EXPIRY_HORIZON_DAYS``
+or passes. The dashboard and ``manage_pharmacy`` statistics count open
+alerts instead of filtering every batch.
+
+A scan only looks at batches written since the previous scan, plus batches
+whose expiry date crossed the horizon or today's date since the day of the
+previous scan. The first scan looks at everything. Run it from cron with
+``manage.py scan_alerts``; figures are as fresh as the last run.
+"""
+from datetime import timedelta
+from itertools import islice
+
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import AlertScan, Medicine, StockAlert
+from .stats import EXPIRING_SOON_DAYS, invalidate_inventory_stats
+
+EXPIRY_HORIZON_DAYS = EXPIRING_SOON_DAYS
+# Like catalog sync, re-read a little before the watermark for writes that
+# committed after the previous scan read past them.
+WATERMARK_OVERLAP = timedelta(seconds=5)
+SCAN_RETENTION = timedelta(days=7)
+RESOLVED_RETENTION = timedelta(days=30)
+CHUNK_SIZE = 500
+
+
+def wanted_alerts(needs_reorder, expiry_date, today):
+    kinds = set()
+    if needs_reorder:
+        kinds.add(StockAlert.LOW_STOCK)
+    if expiry_date < today:
+        kinds.add(StockAlert.EXPIRED)
+    elif expiry_date <= today + timedelta(days=EXPIRY_HORIZON_DAYS):
+        kinds.add(StockAlert.EXPIRING)
+    return kinds
+
+
+def _candidates(last, today):
+    batches = Medicine.objects.order_by()
+    if last is None:
+        return batches
+    changed = Q(updated_at__gt=last.started_at - WATERMARK_OVERLAP)
+    if last.day < today:
+        horizon = timedelta(days=EXPIRY_HORIZON_DAYS)
+        changed |= Q(expiry_date__gte=last.day, expiry_date__lt=today)
+        changed |= Q(expiry_date__gt=last.day + horizon, expiry_date__lte=today + horizon)
+    return batches.filter(changed)
+
+
+def _apply(chunk, now):
+    """Open and resolve alerts for ``{batch id: wanted kinds}``."""
+    current = {}
+    for alert_id, medicine_id, kind in (
+        StockAlert.objects.filter(resolved_at__isnull=True, medicine_id__in=list(chunk)).values_list('id', 'medicine_id', 'kind')
+    ):
+        current[medicine_id, kind] = alert_id
+    to_open = [
+        StockAlert(medicine_id=medicine_id, kind=kind, opened_at=now)
+        for medicine_id, kinds in chunk.items() for kind in kinds
+        if (medicine_id, kind) not in current
+    ]
+    to_resolve = [
+        alert_id for (medicine_id, kind), alert_id in current.items()
+        if kind not in chunk[medicine_id]
+    ]
+    StockAlert.objects.bulk_create(to_open)
+    if to_resolve:
+        StockAlert.objects.filter(pk__in=to_resolve).update(resolved_at=now)
+    return len(to_open), len(to_resolve)
+
+
+def scan(now=None):
+    """Bring the open alerts up to date; returns the saved ``AlertScan``."""
+    now = now or timezone.now()
+    today = timezone.localdate(now)
+    with transaction.atomic():
+        # One scan at a time, and no checkout in between its reads and writes.
+        last = AlertScan.objects.order_by('-started_at').first()
+        run = AlertScan(started_at=now, day=today)
+        rows = (
+            _candidates(last, today).values_list('id', 'needs_reorder', 'expiry_date')
+            .iterator(chunk_size=CHUNK_SIZE)
+        )
+        while chunk := {
+            medicine_id: wanted_alerts(needs_reorder, expiry_date, today)
+            for medicine_id, needs_reorder, expiry_date in islice(rows, CHUNK_SIZE)
+        }:
+            opened, resolved = _apply(chunk, now)
+            run.checked += len(chunk)
+            run.opened += opened
+            run.resolved += resolved
+        run.save()
+
+        AlertScan.objects.filter(started_at__lt=now - SCAN_RETENTION).delete()
+        StockAlert.objects.filter(resolved_at__lt=now - RESOLVED_RETENTION).delete()
+        if run.opened or run.resolved:
+            transaction.on_commit(invalidate_inventory_stats)
+    return run
@@ -1,6 +1,24 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_migrate
+
+
+def install_search_index(sender, using, **kwargs):
+    from django.db import connections, router
+    from . import search
+
+    if router.allow_migrate(using, sender.label):
+        search.install(connections[using])
+
 
 class PharmacyConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'pharmacy'
-    verbose_name = 'Pharmacy Management'
\ No newline at end of file
+    verbose_name = 'Pharmacy Management'
+
+    def ready(self):
+        from . import signals  # noqa: F401
+        from .db import configure_sqlite
+
+        post_migrate.connect(install_search_index, sender=self)
+        connection_created.connect(configure_sqlite)
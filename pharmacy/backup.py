@@ -0,0 +1,260 @@
+"""Streaming backups of the pharmacy tables.
+
+A backup is a directory holding one gzip-compressed NDJSON file per model
+plus a ``manifest.json``. Rows are streamed from a server-side iterator and
+written line by line, so memory use stays flat however large the tables get.
+
+Incremental backups only contain rows created or updated since the previous
+backup's watermark, by their ``updated_at``; sale items go by their sale's,
+which saving an item moves. Deletions are not tracked; restore a full
+backup to drop rows.
+
+Restores upsert by primary key in batches and load independent tables in
+parallel. Rows are written with plain ``INSERT ... ON CONFLICT`` statements
+rather than ``bulk_create`` so that ``auto_now``/``auto_now_add`` timestamps
+keep their backed-up values.
+"""
+import gzip
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from django.core.management.color import no_style
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.db.models.constants import OnConflict
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .db import read_transaction
+from .models import Branch, Customer, Medicine, Product, Promotion, Sale, SaleItem, Supplier
+
+BACKUP_FORMAT = 1
+MANIFEST_NAME = 'manifest.json'
+CHUNK_SIZE = 2000
+BATCH_SIZE = 1000
+
+# Tables in the same level have no foreign keys to each other and can be
+# restored concurrently; each level waits for the previous one.
+LOAD_LEVELS = [
+    [Supplier, Customer, Product, Branch],
+    [Medicine, Sale, Promotion],
+    [SaleItem],
+]
+BACKUP_MODELS = [model for level in LOAD_LEVELS for model in level]
+
+# Lookup selecting the rows changed since a watermark.
+CHANGED_SINCE = {
+    Supplier: 'updated_at__gte',
+    Branch: 'updated_at__gte',
+    Customer: 'updated_at__gte',
+    Product: 'updated_at__gte',
+    Medicine: 'updated_at__gte',
+    Sale: 'updated_at__gte',
+    Promotion: 'updated_at__gte',
+    SaleItem: 'sale__updated_at__gte',
+}
+
+
+class BackupError(Exception):
+    pass
+
+
+class BackupJSONEncoder(DjangoJSONEncoder):
+    """DjangoJSONEncoder rounds datetimes to milliseconds; keep them exact."""
+
+    def default(self, o):
+        if isinstance(o, datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+def _label(model):
+    return model._meta.label_lower
+
+
+def _file_name(model):
+    return f'{_label(model)}.ndjson.gz'
+
+
+def read_manifest(path):
+    try:
+        with open(os.path.join(path, MANIFEST_NAME)) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError) as e:
+        raise BackupError(f'{path} is not a pharmacy backup: {e}')
+    if manifest.get('format') != BACKUP_FORMAT:
+        raise BackupError(f'{path} has unsupported backup format {manifest.get("format")!r}')
+    return manifest
+
+
+def find_backups(root):
+    """Backups under ``root``, oldest watermark first."""
+    backups = []
+    if not os.path.isdir(root):
+        return backups
+    for name in os.listdir(root):
+        path = os.path.join(root, name)
+        if os.path.isfile(os.path.join(path, MANIFEST_NAME)):
+            try:
+                backups.append((read_manifest(path)['watermark'], path))
+            except BackupError:
+                continue
+    return [path for _, path in sorted(backups)]
+
+
+def last_watermark(root):
+    backups = find_backups(root)
+    if not backups:
+        return None
+    return parse_datetime(read_manifest(backups[-1])['watermark'])
+
+
+def _dump_model(model, path, since, chunk_size, using):
+    fields = [field.attname for field in model._meta.concrete_fields]
+    queryset = model._base_manager.using(using).order_by('pk')
+    if since is not None:
+        queryset = queryset.filter(**{CHANGED_SINCE[model]: since})
+
+    rows = 0
+    with gzip.open(path, 'wt', encoding='utf-8', compresslevel=6) as f:
+        for values in queryset.values_list(*fields).iterator(chunk_size=chunk_size):
+            f.write(json.dumps(dict(zip(fields, values)), cls=BackupJSONEncoder))
+            f.write('\n')
+            rows += 1
+    return rows
+
+
+def create_backup(root, incremental=False, since=None, chunk_size=CHUNK_SIZE,
+                  using=DEFAULT_DB_ALIAS, progress=None):
+    """Write a backup directory under ``root`` and return its path.
+
+    With ``incremental`` the rows changed since the newest backup in ``root``
+    (or since ``since``, when given) are written; without an earlier backup
+    an incremental run falls back to a full one.
+    """
+    # Taken before reading anything so rows written during the backup are
+    # picked up again by the next incremental run.
+    watermark = timezone.now()
+    if incremental and since is None:
+        since = last_watermark(root)
+    kind = 'incremental' if since is not None else 'full'
+
+    name = f'pharmacy_backup_{watermark.strftime("%Y%m%d_%H%M%S_%f")}_{kind}'
+    path = os.path.join(root, name)
+    os.makedirs(path)
+
+    manifest = {
+        'format': BACKUP_FORMAT,
+        'kind': kind,
+        'watermark': watermark.isoformat(),
+        'since': since.isoformat() if since else None,
+        'models': {},
+    }
+    # One read transaction gives every table the same snapshot, so no sale
+    # item can point at a sale that missed the dump; it takes no write lock,
+    # so checkouts carry on meanwhile.
+    with read_transaction(using=using):
+        for model in BACKUP_MODELS:
+            file_name = _file_name(model)
+            rows = _dump_model(model, os.path.join(path, file_name), since, chunk_size, using)
+            manifest['models'][_label(model)] = {'file': file_name, 'rows': rows}
+            if progress:
+                progress(model, rows)
+
+    with open(os.path.join(path, MANIFEST_NAME), 'w') as f:
+        json.dump(manifest, f, indent=2)
+    return path
+
+
+def _upsert_sql(model, conn):
+    fields = model._meta.concrete_fields
+    pk = model._meta.pk
+    ops = conn.ops
+    columns = ', '.join(ops.quote_name(field.column) for field in fields)
+    placeholders = ', '.join(['%s'] * len(fields))
+    suffix = ops.on_conflict_suffix_sql(
+        fields,
+        OnConflict.UPDATE,
+        [field.column for field in fields if field is not pk],
+        [pk.column],
+    )
+    return (
+        f'INSERT INTO {ops.quote_name(model._meta.db_table)} ({columns}) '
+        f'VALUES ({placeholders}) {suffix}'
+    )
+
+
+def _load_model(model, path, batch_size, using):
+    conn = connections[using]
+    fields = model._meta.concrete_fields
+    sql = _upsert_sql(model, conn)
+
+    def flush(batch):
+        with transaction.atomic(using=using), conn.cursor() as cursor:
+            cursor.executemany(sql, batch)
+
+    rows = 0
+    batch = []
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        for line in f:
+            data = json.loads(line)
+            # Columns added since the backup was taken get their default.
+            batch.append([
+                field.get_db_prep_save(
+                    field.to_python(data[field.attname]) if field.attname in data else field.get_default(),
+                    conn,
+                )
+                for field in fields
+            ])
+            if len(batch) >= batch_size:
+                flush(batch)
+                rows += len(batch)
+                batch = []
+    if batch:
+        flush(batch)
+        rows += len(batch)
+    return rows
+
+
+def _load_model_in_thread(*args):
+    try:
+        return _load_model(*args)
+    finally:
+        connections.close_all()
+
+
+def restore_backup(path, workers=4, batch_size=BATCH_SIZE, using=DEFAULT_DB_ALIAS,
+                   progress=None):
+    """Upsert every row of the backup at ``path``; returns rows per model."""
+    manifest = read_manifest(path)
+    restored = {}
+    for level in LOAD_LEVELS:
+        jobs = [
+            (model, os.path.join(path, manifest['models'][_label(model)]['file']))
+            for model in level if _label(model) in manifest['models']
+        ]
+        if workers > 1 and len(jobs) > 1:
+            with ThreadPoolExecutor(max_workers=min(workers, len(jobs))) as executor:
+                futures = [
+                    (model, executor.submit(_load_model_in_thread, model, file, batch_size, using))
+                    for model, file in jobs
+                ]
+                counts = [(model, future.result()) for model, future in futures]
+        else:
+            counts = [(model, _load_model(model, file, batch_size, using)) for model, file in jobs]
+
+        for model, rows in counts:
+            restored[_label(model)] = rows
+            if progress:
+                progress(model, rows)
+
+    # Explicit primary keys leave sequences behind on backends that have them.
+    conn = connections[using]
+    statements = conn.ops.sequence_reset_sql(no_style(), BACKUP_MODELS)
+    if statements:
+        with conn.cursor() as cursor:
+            for statement in statements:
+                cursor.execute(statement)
+    return restored
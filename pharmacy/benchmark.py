@@ -0,0 +1,142 @@
+"""View benchmarks with committed SQL query budgets.
+
+Every scenario drives one view through the test client and records its
+latency and the number of SQL queries it ran. Latency depends on the
+machine, so only query counts are budgeted: ``query_budgets.json`` holds
+the most queries each scenario may run, and since a view's query count
+should not grow with the data, the same budget applies at every size. An
+N+1 shows up as a scenario going over budget at the larger sizes.
+"""
+import json
+import math
+import os
+import time
+from datetime import date, timedelta
+from urllib.parse import urlencode
+
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import Count
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from .models import Medicine, Product, Sale
+
+BUDGETS_FILE = os.path.join(os.path.dirname(__file__), 'query_budgets.json')
+
+# Options passed to ``generate_load_data`` for each dataset size.
+DATASET_SIZES = {
+    'small': {'medicines': 200, 'customers': 200, 'sales': 1000},
+    'medium': {'medicines': 2000, 'customers': 2000, 'sales': 20000},
+    'large': {'medicines': 20000, 'customers': 20000, 'sales': 200000},
+}
+BENCHMARK_STOCK = 10 ** 9
+
+
+def seed_dataset(size, seed=42, workers=1):
+    """Fill the current database with a ``size`` dataset from ``DATASET_SIZES``."""
+    with open(os.devnull, 'w') as devnull:
+        call_command('generate_load_data', seed=seed, workers=workers, cashiers=3,
+                     stdout=devnull, **DATASET_SIZES[size])
+
+
+def build_scenarios():
+    """Return ``(name, method, url, payload)`` for every benchmarked request."""
+    medicine = Medicine.objects.select_related('product').order_by('id').first()
+    # The POST scenario sells the same product on every iteration; keep one
+    # of its batches stocked and in date.
+    Medicine.objects.filter(pk=medicine.pk).update(
+        stock_quantity=BENCHMARK_STOCK, expiry_date=date.today() + timedelta(days=365),
+    )
+    receipt = (
+        Sale.objects.annotate(line_count=Count('items'))
+        .order_by('-line_count', 'id').first()
+    )
+    search_term = medicine.name.split()[0][:4]
+    checkout = {
+        'items': [{'product_id': medicine.product_id, 'quantity': 1}],
+        'payment_method': 'cash',
+    }
+
+    scenarios = [
+        ('dashboard', 'get', reverse('pharmacy:dashboard'), None),
+        ('search_medicine', 'get', reverse('pharmacy:search_medicine'), None),
+        ('search_medicine:query', 'get',
+         reverse('pharmacy:search_medicine') + f'?query={search_term}', None),
+        ('create_sale', 'get', reverse('pharmacy:create_sale'), None),
+        ('create_sale:post', 'post', reverse('pharmacy:create_sale'), checkout),
+        ('sales_history', 'get', reverse('pharmacy:sales_history'), None),
+        ('sales_history:filtered', 'get',
+         reverse('pharmacy:sales_history') + '?payment_method=card', None),
+        ('sales_report', 'get', reverse('pharmacy:sales_report'), None),
+        ('medicine_details', 'get', reverse('pharmacy:medicine_details', args=[medicine.id]), None),
+        ('medicine_details:batch', 'get', reverse('pharmacy:medicine_details_batch') + '?ids=' + ','.join(
+            str(pk) for pk in Product.objects.order_by('id').values_list('id', flat=True)[:30]), None),
+        ('medicine_typeahead', 'get',
+         reverse('pharmacy:medicine_typeahead') + f'?q={search_term}', None),
+        ('customer_lookup', 'get', reverse('pharmacy:customer_lookup') + '?q=a', None),
+        ('catalog_sync', 'get', reverse('pharmacy:catalog_sync') + '?' + urlencode(
+            {'since': (timezone.now() - timedelta(hours=1)).isoformat()}), None),
+    ]
+    if receipt is not None:
+        scenarios.append(
+            ('print_receipt', 'get', reverse('pharmacy:print_receipt', args=[receipt.id]), None)
+        )
+    return scenarios
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of ``values``."""
+    ordered = sorted(values)
+    rank = max(math.ceil(pct / 100 * len(ordered)), 1)
+    return ordered[rank - 1]
+
+
+def run_scenarios(user, scenarios, iterations=20):
+    """Request every scenario ``iterations`` times as ``user``.
+
+    Returns ``{name: {'p50_ms', 'p95_ms', 'queries'}}``; ``queries`` is the
+    most any single request ran, which includes cold caches on the first one.
+    """
+    client = Client()
+    client.force_login(user)
+    results = {}
+    for name, method, url, payload in scenarios:
+        timings = []
+        queries = 0
+        for _ in range(iterations):
+            with CaptureQueriesContext(connection) as captured:
+                started = time.perf_counter()
+                if method == 'post':
+                    response = client.post(url, json.dumps(payload), content_type='application/json')
+                else:
+                    response = client.get(url)
+                timings.append((time.perf_counter() - started) * 1000)
+            if response.status_code != 200:
+                raise AssertionError(f'{name}: {url} returned {response.status_code}')
+            queries = max(queries, len(captured))
+        results[name] = {
+            'p50_ms': round(percentile(timings, 50), 2),
+            'p95_ms': round(percentile(timings, 95), 2),
+            'queries': queries,
+        }
+    return results
+
+
+def load_budgets(path=BUDGETS_FILE):
+    with open(path) as f:
+        return json.load(f)
+
+
+def check_budgets(results, budgets):
+    """Return a message for every scenario that ran more queries than budgeted."""
+    violations = []
+    for name, result in results.items():
+        budget = budgets.get(name)
+        if budget is None:
+            violations.append(f'{name}: no query budget')
+        elif result['queries'] > budget:
+            violations.append(f'{name}: {result["queries"]} queries, budget is {budget}')
+    return violations
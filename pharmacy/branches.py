@@ -0,0 +1,47 @@
+"""The branch this server sells for.
+
+Branches can share one database: sales and batches record their branch,
+and a server names the branch it serves by code in ``PHARMACY_BRANCH``.
+Checkout then sells that branch's batches only and stamps its sales with
+it, and stock figures count its batches only. Rows without a branch belong
+to the main pharmacy, which is what a server without ``PHARMACY_BRANCH``
+serves, so a single-site install never has to create a branch.
+
+A branch can also keep a database of its own: ``PHARMACY_BRANCH_DATABASES``
+(``code=path,...`` in the environment) maps branch codes to SQLite files,
+and the settings make the file of ``PHARMACY_BRANCH`` the ``default``
+database. Its receipt cache, uploads and cache keys are then kept apart
+from the other databases', whose sale and job ids overlap with its own.
+"""
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models import Q
+
+from .models import Branch
+
+_branches = {}
+
+
+def current_branch():
+    """The ``Branch`` named by ``PHARMACY_BRANCH``, or ``None`` for the main pharmacy.
+
+    The row is created on first use and then kept for the life of the process.
+    """
+    code = getattr(settings, 'PHARMACY_BRANCH', '')
+    if not code:
+        return None
+    branch = _branches.get(code)
+    if branch is None:
+        # On the primary: a replica may not have the row yet.
+        branch, _ = Branch.objects.using(DEFAULT_DB_ALIAS).get_or_create(code=code, defaults={'name': code})
+        _branches[code] = branch
+    return branch
+
+
+def forget():
+    _branches.clear()
+
+
+def branch_q(prefix=''):
+    """Filter for the rows of the current branch, ``prefix`` leading to the branch field."""
+    return Q(**{f'{prefix}branch': current_branch()})
@@ -0,0 +1,86 @@
+"""In-process caches shared by the read-heavy endpoints."""
+import threading
+import time
+from collections import OrderedDict
+
+from django.core.cache import cache
+
+
+class LRUCache:
+    """A small thread-safe least-recently-used mapping.
+
+    ``generation_key`` ties the local entries to a counter kept in Django's
+    cache: ``invalidate()`` bumps the counter, and every process drops its
+    local entries the next time it notices the counter moved. A counter
+    evicted from (or cleared out of) Django's cache starts again from the
+    current time, which also counts as a move. With the default
+    local-memory cache this is simply per process.
+
+    A value computed while an invalidation happens must not be stored
+    afterwards: take ``version()`` before computing it and pass it to
+    ``set``, which then drops the value if the cache was invalidated in
+    between. With ``ttl`` set, entries also expire that many seconds after
+    they were stored.
+    """
+
+    def __init__(self, maxsize=1024, generation_key=None, ttl=None):
+        self.maxsize = maxsize
+        self.generation_key = generation_key
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self._generation = None
+        self._version = 0
+
+    def _check_generation(self):
+        if not self.generation_key:
+            return
+        generation = cache.get(self.generation_key)
+        if generation is None:
+            cache.add(self.generation_key, time.time_ns(), None)
+            generation = cache.get(self.generation_key)
+        if generation != self._generation:
+            with self._lock:
+                self._data.clear()
+                self._generation = generation
+                self._version += 1
+
+    def version(self):
+        self._check_generation()
+        return self._version
+
+    def get(self, key, default=None):
+        self._check_generation()
+        with self._lock:
+            try:
+                self._data.move_to_end(key)
+            except KeyError:
+                return default
+            expires, value = self._data[key]
+            if expires is not None and expires <= time.monotonic():
+                del self._data[key]
+                return default
+            return value
+
+    def set(self, key, value, version=None):
+        expires = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            if version is not None and version != self._version:
+                return
+            self._data[key] = (expires, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def invalidate(self):
+        with self._lock:
+            self._data.clear()
+            self._version += 1
+        if self.generation_key:
+            try:
+                cache.incr(self.generation_key)
+            except ValueError:
+                cache.set(self.generation_key, time.time_ns(), None)
+
+    def __len__(self):
+        return len(self._data)
@@ -0,0 +1,284 @@
+from collections import OrderedDict
+from decimal import Decimal, InvalidOperation
+
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Value, When
+from django.utils import timezone
+
+from .branches import current_branch
+from .models import Customer, Medicine, Product, Sale, SaleItem, reorder_after_sale
+from .receipts import warm_receipt
+from . import promotions, rollups, stats
+
+
+class CheckoutError(Exception):
+    """Raised when a cart cannot be checked out.
+
+    ``errors`` holds one dict per offending cart line so the POS can point
+    the cashier at the exact row that needs fixing.
+    """
+
+    def __init__(self, message, errors=None):
+        super().__init__(message)
+        self.errors = errors or []
+
+
+def parse_int(value):
+    """``value`` if it is a JSON integer that fits a database id, else ``None``.
+
+    Floats are not truncated and ``true`` is not 1.
+    """
+    if isinstance(value, int) and not isinstance(value, bool) and -2**63 <= value < 2**63:
+        return value
+    return None
+
+
+def parse_cart(items):
+    """Validate the raw cart payload and merge duplicate product lines.
+
+    Returns an ordered mapping of product id -> {'quantity', 'lines'}.
+    """
+    if not isinstance(items, list):
+        raise CheckoutError('Invalid cart')
+    if not items:
+        raise CheckoutError('No items in cart')
+
+    cart = OrderedDict()
+    errors = []
+    for index, item in enumerate(items):
+        product_id = parse_int(item.get('product_id')) if isinstance(item, dict) else None
+        quantity = parse_int(item.get('quantity')) if isinstance(item, dict) else None
+        if product_id is None or quantity is None:
+            errors.append({'line': index, 'error': 'Invalid product or quantity'})
+            continue
+        if quantity <= 0:
+            errors.append({'line': index, 'product_id': product_id,
+                           'error': 'Quantity must be at least 1'})
+            continue
+        entry = cart.setdefault(product_id, {'quantity': 0, 'lines': []})
+        entry['quantity'] += quantity
+        entry['lines'].append(index)
+
+    if errors:
+        raise CheckoutError('Invalid cart lines', errors)
+    return cart
+
+
+def parse_percent(value, field):
+    """A discount or tax rate between 0 and 100; raises ``CheckoutError``."""
+    try:
+        percent = Decimal(str(value or 0))
+    except (InvalidOperation, ValueError):
+        raise CheckoutError(f'Invalid {field}')
+    if not percent.is_finite() or not 0 <= percent <= 100:
+        raise CheckoutError(f'{field.capitalize()} must be between 0 and 100')
+    return percent
+
+
+def parse_payment_method(value):
+    if value not in dict(Sale._meta.get_field('payment_method').choices):
+        raise CheckoutError('Invalid payment method')
+    return value
+
+
+def allocate(cart, batches):
+    """Split every cart line over batches, first expiry first out.
+
+    ``batches`` maps product id to the product's sellable batches in FEFO
+    order. Returns ``(allocations, errors)`` with ``allocations`` a list of
+    ``(batch, quantity)``; stock is not touched.
+    """
+    allocations = []
+    errors = []
+    for product_id, entry in cart.items():
+        remaining = entry['quantity']
+        for batch in batches.get(product_id, []):
+            if not batch.stock_quantity:
+                continue
+            quantity = min(remaining, batch.stock_quantity)
+            allocations.append((batch, quantity))
+            remaining -= quantity
+            if not remaining:
+                break
+        if remaining:
+            available = entry['quantity'] - remaining
+            errors.append({'line': entry['lines'][0], 'product_id': product_id,
+                           'available': available})
+    return allocations, errors
+
+
+class Order:
+    """A validated checkout waiting to be written, see ``record_sales``."""
+    __slots__ = ('cashier', 'cart', 'customer_id', 'discount', 'tax', 'payment_method')
+
+    def __init__(self, cashier, cart, customer_id=None, discount=Decimal('0'), tax=Decimal('0'),
+                 payment_method='cash'):
+        self.cashier = cashier
+        self.cart = cart
+        self.customer_id = customer_id
+        self.discount = discount
+        self.tax = tax
+        self.payment_method = payment_method
+
+
+def make_order(cashier, items, customer_id=None, discount=0, tax=0, payment_method='cash'):
+    """Validate a raw checkout request; raises ``CheckoutError``."""
+    if customer_id is not None and parse_int(customer_id) is None:
+        raise CheckoutError('Invalid customer')
+    return Order(cashier, parse_cart(items), customer_id, parse_percent(discount, 'discount'),
+                 parse_percent(tax, 'tax'), parse_payment_method(payment_method))
+
+
+def process_checkout(cashier, items, customer_id=None, discount=0, tax=0,
+                     payment_method='cash'):
+    """Create a sale for ``items`` in a single transaction.
+
+    Each cart line names a product; its quantity is taken from the product's
+    unexpired batches at this branch, earliest expiry first, and becomes one sale item per
+    batch used. Prices and promotions come from the database, not from the
+    client.
+    """
+    order = make_order(cashier, items, customer_id, discount, tax, payment_method)
+    # Choosing batches means reading stock before writing it; the
+    # transaction holds the write lock from the start (see ``db``), so no
+    # other checkout can sell the same units in between.
+    with transaction.atomic():
+        result, = record_sales([order])
+        if isinstance(result, CheckoutError):
+            raise result
+    return result
+
+
+def _shortage_error(shortage, products):
+    product = products.get(shortage['product_id'])
+    if product is None:
+        error = 'Product not found'
+    else:
+        error = f'Only {shortage["available"]} of {product.name} in stock'
+    return {'line': shortage['line'], 'product_id': shortage['product_id'], 'error': error}
+
+
+def record_sales(orders):
+    """Write the sales for ``orders``; returns a ``Sale`` or ``CheckoutError`` per order.
+
+    Must run inside a transaction that holds the write lock. Orders are
+    served in turn, so an earlier order gets the stock first; an order that
+    cannot be sold writes nothing and does not stop the others. The query
+    count does not depend on the number of orders or lines: the batches of
+    every product come from one indexed query, promotions from
+    ``promotions.active_index`` (a version check while they are unchanged),
+    sales and sale items are
+    bulk-inserted and stock is decremented with one conditional ``UPDATE``.
+    """
+    promotion_index = promotions.active_index()
+    branch = current_branch()
+    batches = {}
+    for batch in (
+        Medicine.objects.select_for_update()
+        .filter(product__in={product_id for order in orders for product_id in order.cart},
+                branch=branch, stock_quantity__gt=0, expiry_date__gte=timezone.localdate())
+        .select_related('product')
+        .order_by('product', 'expiry_date', 'id')
+    ):
+        batches.setdefault(batch.product_id, []).append(batch)
+    customer_ids = {order.customer_id for order in orders if order.customer_id}
+    customers = Customer.objects.in_bulk(customer_ids) if customer_ids else {}
+
+    results = [None] * len(orders)
+    shortages = {}
+    sales = []
+    sold = {}
+    for index, order in enumerate(orders):
+        allocations, errors = allocate(order.cart, batches)
+        if errors:
+            shortages[index] = errors
+            continue
+        customer = None
+        if order.customer_id:
+            customer = customers.get(order.customer_id)
+            if customer is None:
+                results[index] = CheckoutError('Customer not found')
+                continue
+
+        sale_items = []
+        total_amount = Decimal('0')
+        pricing = promotions.price(allocations, promotion_index)
+        for (batch, quantity), (promotion, promotion_discount) in zip(allocations, pricing):
+            line_total = batch.selling_price * quantity - promotion_discount
+            total_amount += line_total
+            sale_items.append(SaleItem(
+                medicine=batch,
+                quantity=quantity,
+                unit_price=batch.selling_price,
+                promotion=promotion,
+                discount_amount=promotion_discount,
+                total_price=line_total,
+            ))
+            batch.stock_quantity -= quantity
+            sold[batch.pk] = sold.get(batch.pk, 0) + quantity
+
+        discount_amount = (total_amount * order.discount) / 100
+        tax_amount = ((total_amount - discount_amount) * order.tax) / 100
+        sale = Sale(
+            customer=customer,
+            cashier=order.cashier,
+            branch=branch,
+            total_amount=total_amount,
+            discount=order.discount,
+            tax=order.tax,
+            final_amount=total_amount - discount_amount + tax_amount,
+            payment_method=order.payment_method,
+        )
+        sales.append((sale, sale_items))
+        results[index] = sale
+
+    if shortages:
+        products = Product.objects.in_bulk(
+            {e['product_id'] for errors in shortages.values() for e in errors}
+        )
+        for index, errors in shortages.items():
+            results[index] = CheckoutError(
+                'Some items could not be sold', [_shortage_error(e, products) for e in errors]
+            )
+    if not sales:
+        return results
+
+    Sale.objects.bulk_create([sale for sale, _ in sales])
+    for sale, sale_items in sales:
+        for sale_item in sale_items:
+            sale_item.sale = sale
+    SaleItem.objects.bulk_create([item for _, sale_items in sales for item in sale_items])
+    rollups.add_sales([sale for sale, _ in sales],
+                      [item for _, sale_items in sales for item in sale_items])
+
+    # The guard repeats the stock check in the UPDATE itself, so even a
+    # backend without row locks cannot drive stock negative.
+    updated = Medicine.objects.filter(
+        pk__in=list(sold),
+        stock_quantity__gte=Case(
+            *[When(pk=pk, then=Value(quantity)) for pk, quantity in sold.items()],
+            output_field=IntegerField(),
+        ),
+    ).update(
+        stock_quantity=Case(
+            *[When(pk=pk, then=F('stock_quantity') - quantity) for pk, quantity in sold.items()],
+            output_field=IntegerField(),
+        ),
+        needs_reorder=reorder_after_sale(sold),
+        # A queryset update skips auto_now; catalog sync and incremental
+        # backups go by this timestamp.
+        updated_at=timezone.now(),
+    )
+    if updated != len(sold):
+        raise CheckoutError('Stock changed during checkout, please retry')
+
+    # bulk_create sends no post_save, so refresh the dashboard figures here.
+    transaction.on_commit(stats.invalidate_sales_stats)
+    for sale, sale_items in sales:
+        # Everything the receipt shows is already in memory, so the cashier's
+        # print does not have to query anything. A failure here only costs
+        # the first print a render.
+        transaction.on_commit(lambda sale=sale, items=sale_items: warm_receipt(sale, items),
+                              robust=True)
+
+    return results
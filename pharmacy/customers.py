@@ -0,0 +1,55 @@
+"""Customer lookup for the POS.
+
+A query starting with a digit or ``+`` is a phone number prefix; anything
+else is a prefix of the customer's name, compared in ``normalize_name``
+form. Both are answered as range scans of an index (the unique ``phone``
+index and ``customer_name_norm_idx``): ``LIKE 'abc%'`` cannot use them on
+SQLite, where ``LIKE`` ignores case, but ``>= 'abc' AND < 'abc\\U0010ffff'``
+can anywhere.
+"""
+from .models import Customer, normalize_name
+
+CUSTOMER_LOOKUP_LIMIT = 10
+CUSTOMER_LOOKUP_MAX_LIMIT = 50
+NORMALIZE_BATCH_SIZE = 2000
+
+# Sorts after every character a name or phone number holds.
+_PREFIX_END = '\U0010ffff'
+
+
+def _prefix(field, prefix):
+    return {f'{field}__gte': prefix, f'{field}__lt': prefix + _PREFIX_END}
+
+
+def customer_data(customer):
+    return {'id': customer.id, 'name': customer.name, 'phone': customer.phone}
+
+
+def lookup(query, limit=CUSTOMER_LOOKUP_LIMIT):
+    """Up to ``limit`` customers matching ``query``, as plain dicts."""
+    query = query.strip()
+    if not query:
+        return []
+    if query[0].isdigit() or query[0] == '+':
+        customers = Customer.objects.filter(**_prefix('phone', query)).order_by('phone')
+    else:
+        prefix = normalize_name(query)
+        customers = Customer.objects.filter(**_prefix('name_normalized', prefix)).order_by('name_normalized', 'id')
+    return [customer_data(customer) for customer in customers.only('id', 'name', 'phone')[:limit]]
+
+
+def normalize_names(customers=None):
+    """Recompute ``name_normalized`` for rows written behind ``save()``; returns the count."""
+    if customers is None:
+        customers = Customer.objects.filter(name_normalized='')
+    batch = []
+    count = 0
+    for customer in customers.only('id', 'name').iterator(chunk_size=NORMALIZE_BATCH_SIZE):
+        customer.name_normalized = normalize_name(customer.name)
+        batch.append(customer)
+        if len(batch) >= NORMALIZE_BATCH_SIZE:
+            Customer.objects.bulk_update(batch, ['name_normalized'])
+            count += len(batch)
+            batch = []
+    Customer.objects.bulk_update(batch, ['name_normalized'])
+    return count + len(batch)
@@ -0,0 +1,98 @@
+"""SQLite connection tuning for several terminals writing at once.
+
+Every new SQLite connection gets the pragmas below through the
+``connection_created`` signal:
+
+* ``journal_mode=WAL`` lets readers carry on while a checkout writes.
+* ``busy_timeout`` makes a writer wait for the lock instead of failing with
+  "database is locked".
+* ``synchronous=NORMAL`` is durable in WAL mode except on power loss, and
+  skips an fsync on every commit.
+* ``cache_size`` and ``mmap_size`` keep the hot pages in memory.
+
+Each pragma can be overridden with a ``PHARMACY_SQLITE_<PRAGMA>``
+environment variable, e.g. ``PHARMACY_SQLITE_BUSY_TIMEOUT=10000``; an empty
+value leaves that pragma at the SQLite default. ``PHARMACY_SQLITE_TUNING=off``
+turns the tuning off altogether. A database whose settings contain a
+``SQLITE_PRAGMAS`` dict uses exactly those pragmas instead, and one with
+``SQLITE_JOURNAL_MODE`` uses that journal mode by default instead of WAL.
+
+The ``default`` database begins its transactions ``IMMEDIATE`` (its
+``transaction_mode`` option in the settings). A transaction that reads stock
+and then writes it holds the write lock from the start, waiting for it like
+any other write, instead of failing with "database is locked" when it has
+to upgrade its read lock after another connection wrote. Long reads that
+need one snapshot but write nothing use ``read_transaction``.
+"""
+import os
+import re
+from contextlib import contextmanager
+
+from django.core.exceptions import ImproperlyConfigured
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+
+DEFAULT_PRAGMAS = {
+    'journal_mode': 'wal',
+    'busy_timeout': 5000,
+    'synchronous': 'normal',
+    'cache_size': -20000,  # KiB, so 20 MB
+    'mmap_size': 256 * 1024 * 1024,
+    'temp_store': 'memory',
+}
+ENV_PREFIX = 'PHARMACY_SQLITE_'
+PRAGMA_VALUE = re.compile(r'^-?[A-Za-z0-9_]+$')
+
+
+def sqlite_pragmas(environ=None, **defaults):
+    """The pragmas to apply, ``defaults`` replacing ``DEFAULT_PRAGMAS``, after environment overrides."""
+    environ = os.environ if environ is None else environ
+    if environ.get(f'{ENV_PREFIX}TUNING', '').lower() in ('0', 'off', 'false', 'no'):
+        return {}
+    pragmas = {}
+    for name, default in {**DEFAULT_PRAGMAS, **defaults}.items():
+        value = environ.get(f'{ENV_PREFIX}{name.upper()}', default)
+        if value != '':
+            pragmas[name] = value
+    return pragmas
+
+
+def apply_pragmas(connection, pragmas):
+    with connection.cursor() as cursor:
+        for name, value in pragmas.items():
+            if not PRAGMA_VALUE.match(str(value)):
+                raise ImproperlyConfigured(f'Invalid value for SQLite pragma {name}: {value!r}')
+            cursor.execute(f'PRAGMA {name} = {value}')
+
+
+def configure_sqlite(sender, connection, **kwargs):
+    if connection.vendor != 'sqlite':
+        return
+    pragmas = connection.settings_dict.get('SQLITE_PRAGMAS')
+    if pragmas is None:
+        journal_mode = connection.settings_dict.get('SQLITE_JOURNAL_MODE')
+        pragmas = sqlite_pragmas(**({'journal_mode': journal_mode} if journal_mode else {}))
+    apply_pragmas(connection, pragmas)
+
+
+@contextmanager
+def read_transaction(using=DEFAULT_DB_ALIAS):
+    """An atomic block that reads one snapshot without taking the write lock.
+
+    A backup reading every table in an ``IMMEDIATE`` transaction would stall
+    every checkout until it finished; this one begins ``DEFERRED``. Nested in
+    another atomic block it is a savepoint, as usual.
+    """
+    connection = connections[using]
+    if connection.vendor != 'sqlite' or connection.in_atomic_block:
+        with transaction.atomic(using=using):
+            yield
+        return
+    connection.ensure_connection()
+    mode = connection.transaction_mode
+    connection.transaction_mode = None
+    try:
+        with transaction.atomic(using=using):
+            connection.transaction_mode = mode
+            yield
+    finally:
+        connection.transaction_mode = mode
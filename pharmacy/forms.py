@@ -1,15 +1,35 @@
 from django import forms
-from .models import Medicine, Customer, Sale, Supplier
+from django.contrib.auth.models import User
+from .models import Branch, Medicine, Product, Customer, Sale, Supplier
 
 class MedicineForm(forms.ModelForm):
+    """A new batch; its product is reused when one with the same name and manufacturer exists."""
+    name = forms.CharField(max_length=200)
+    generic_name = forms.CharField(max_length=200, required=False)
+    category = forms.ChoiceField(choices=Product.CATEGORY_CHOICES)
+    manufacturer = forms.CharField(max_length=100)
+    description = forms.CharField(widget=forms.Textarea(attrs={'rows': 3}), required=False)
+
     class Meta:
         model = Medicine
-        fields = '__all__'
+        exclude = ['product', 'branch', 'needs_reorder']
         widgets = {
             'expiry_date': forms.DateInput(attrs={'type': 'date'}),
-            'description': forms.Textarea(attrs={'rows': 3}),
         }
 
+    def save(self, commit=True):
+        data = self.cleaned_data
+        self.instance.product, _ = Product.objects.get_or_create(
+            name=data['name'],
+            manufacturer=data['manufacturer'],
+            defaults={
+                'generic_name': data['generic_name'],
+                'category': data['category'],
+                'description': data['description'],
+            },
+        )
+        return super().save(commit)
+
 class CustomerForm(forms.ModelForm):
     class Meta:
         model = Customer
@@ -43,7 +63,55 @@ class MedicineSearchForm(forms.Form):
         })
     )
     category = forms.ChoiceField(
-        choices=[('', 'All Categories')] + Medicine.CATEGORY_CHOICES,
+        choices=[('', 'All Categories')] + Product.CATEGORY_CHOICES,
+        required=False,
+        widget=forms.Select(attrs={'class': 'form-control'})
+    )
+
+class SalesHistoryFilterForm(forms.Form):
+    date_from = forms.DateField(
+        required=False,
+        widget=forms.DateInput(attrs={'type': 'date', 'class': 'form-control'})
+    )
+    date_to = forms.DateField(
+        required=False,
+        widget=forms.DateInput(attrs={'type': 'date', 'class': 'form-control'})
+    )
+    cashier = forms.ModelChoiceField(
+        queryset=User.objects.filter(is_active=True).order_by('username'),
+        required=False,
+        empty_label='All Cashiers',
+        widget=forms.Select(attrs={'class': 'form-control'})
+    )
+    payment_method = forms.ChoiceField(
+        choices=[('', 'All Payments')] + Sale._meta.get_field('payment_method').choices,
         required=False,
         widget=forms.Select(attrs={'class': 'form-control'})
-    )
\ No newline at end of file
+    )
+    branch = forms.ModelChoiceField(
+        queryset=Branch.objects.order_by('name'),
+        required=False,
+        empty_label='All Branches',
+        widget=forms.Select(attrs={'class': 'form-control'})
+    )
+
+class SalesReportForm(forms.Form):
+    date_from = forms.DateField(
+        required=False,
+        widget=forms.DateInput(attrs={'type': 'date', 'class': 'form-control'})
+    )
+    date_to = forms.DateField(
+        required=False,
+        widget=forms.DateInput(attrs={'type': 'date', 'class': 'form-control'})
+    )
+
+class StockImportForm(forms.Form):
+    file = forms.FileField(
+        widget=forms.ClearableFileInput(attrs={'class': 'form-control', 'accept': '.csv,text/csv'})
+    )
+    supplier = forms.ModelChoiceField(
+        queryset=Supplier.objects.order_by('name'),
+        required=False,
+        empty_label='Named on each line',
+        widget=forms.Select(attrs={'class': 'form-control'})
+    )
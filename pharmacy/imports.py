@@ -0,0 +1,331 @@
+"""Streaming import of supplier delivery notes and price lists.
+
+A CSV file is read in chunks of ``CHUNK_SIZE`` lines and every chunk is
+written in one transaction: products and batches the chunk names are looked
+up with one query each, new products are bulk-created, and batches are
+written with one ``executemany`` ``INSERT`` and one ``UPDATE`` that
+increments existing stock (``stock_quantity + quantity``) and replaces any
+given prices, expiry or minimum, followed by one ``UPDATE`` of the
+updated batches' ``needs_reorder``. The job's ``lines_done`` is saved in the same transaction, so after a failure
+the job resumes right after the last committed chunk.
+
+Columns, in any order, with a header row:
+
+* ``name`` and ``batch_number`` (required) pick one of the batches of
+  this server's branch (see ``branches``); a product is matched by name.
+* ``quantity``: units received, added to stock (default 0).
+* ``purchase_price``, ``selling_price``, ``expiry_date`` (YYYY-MM-DD),
+  ``minimum_stock``: replace the batch's values when present. A new batch
+  needs the prices and the expiry date.
+* ``supplier``: supplier name for new batches, defaulting to the job's.
+* ``generic_name``, ``category``, ``manufacturer``: used for new products.
+
+Lines that cannot be imported are skipped and recorded on the job.
+"""
+import csv
+import os
+from datetime import date
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.utils import timezone
+
+from .branches import current_branch
+from .models import ImportJob, Medicine, Product, Supplier, reorder_after_sale
+from .search import typeahead_cache
+from . import stats
+
+CHUNK_SIZE = 1000
+MAX_LINE_ERRORS = 100
+DEFAULT_MINIMUM_STOCK = 10
+
+REQUIRED_COLUMNS = ('name', 'batch_number')
+BATCH_FIELDS = ('purchase_price', 'selling_price', 'expiry_date', 'minimum_stock')
+NEW_BATCH_FIELDS = ('purchase_price', 'selling_price', 'expiry_date')
+CATEGORIES = {code for code, _ in Product.CATEGORY_CHOICES}
+
+
+class StockImportError(Exception):
+    pass
+
+
+def _decimal(value, column):
+    try:
+        amount = Decimal(value)
+    except InvalidOperation:
+        raise StockImportError(f'Invalid {column} {value!r}')
+    if not amount.is_finite() or amount < 0:
+        raise StockImportError(f'Invalid {column} {value!r}')
+    return amount
+
+
+def _integer(value, column):
+    try:
+        number = int(value)
+    except ValueError:
+        raise StockImportError(f'Invalid {column} {value!r}')
+    if number < 0:
+        raise StockImportError(f'Invalid {column} {value!r}')
+    return number
+
+
+def _date(value, column):
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise StockImportError(f'Invalid {column} {value!r}, expected YYYY-MM-DD')
+
+
+PARSERS = {
+    'quantity': _integer,
+    'purchase_price': _decimal,
+    'selling_price': _decimal,
+    'expiry_date': _date,
+    'minimum_stock': _integer,
+}
+
+
+def parse_row(row):
+    """Clean one CSV row (a dict); raises ``StockImportError``."""
+    values = {column: (value or '').strip() for column, value in row.items() if column}
+    data = {
+        'name': values.get('name', ''),
+        'batch_number': values.get('batch_number', ''),
+        'supplier': values.get('supplier', ''),
+        'generic_name': values.get('generic_name', ''),
+        'category': values.get('category', '').lower() or 'other',
+        'manufacturer': values.get('manufacturer', ''),
+    }
+    if not data['name'] or not data['batch_number']:
+        raise StockImportError('name and batch_number are required')
+    if data['category'] not in CATEGORIES:
+        raise StockImportError(f'Unknown category {data["category"]!r}')
+    for column, parse in PARSERS.items():
+        value = values.get(column, '')
+        data[column] = parse(value, column) if value else None
+    data['quantity'] = data['quantity'] or 0
+    return data
+
+
+def _merge(rows, errors):
+    """Parse a chunk and merge repeated batches; later lines win, quantities add up."""
+    entries = {}
+    for line, row in rows:
+        try:
+            data = parse_row(row)
+        except StockImportError as e:
+            errors.append({'line': line, 'error': str(e)})
+            continue
+        data['line'] = line
+        entry = entries.get((data['name'], data['batch_number']))
+        if entry is None:
+            entries[data['name'], data['batch_number']] = data
+            continue
+        quantity = entry['quantity'] + data['quantity']
+        entry.update((field, value) for field, value in data.items() if value not in (None, ''))
+        entry['quantity'] = quantity
+    return entries
+
+
+INSERT_COLUMNS = ('product', 'supplier', 'branch', 'batch_number') + NEW_BATCH_FIELDS + (
+    'stock_quantity', 'minimum_stock', 'needs_reorder', 'created_at', 'updated_at',
+)
+
+
+def _insert_sql(conn):
+    qn = conn.ops.quote_name
+    return 'INSERT INTO {} ({}) VALUES ({})'.format(
+        qn(Medicine._meta.db_table),
+        ', '.join(qn(Medicine._meta.get_field(name).column) for name in INSERT_COLUMNS),
+        ', '.join(['%s'] * len(INSERT_COLUMNS)),
+    )
+
+
+def _update_sql(conn):
+    """``UPDATE`` of one existing batch; an empty (``NULL``) value keeps the old one.
+
+    Stock is incremented in the statement itself, so units sold while the
+    file imports are not lost. ``needs_reorder`` is set afterwards, for all
+    the updated batches at once.
+    """
+    qn = conn.ops.quote_name
+    column = {name: qn(Medicine._meta.get_field(name).column)
+              for name in BATCH_FIELDS + ('supplier', 'stock_quantity', 'updated_at', 'id')}
+    keep = ', '.join(f'{column[name]} = COALESCE(%s, {column[name]})'
+                     for name in BATCH_FIELDS + ('supplier',))
+    return (
+        f'UPDATE {qn(Medicine._meta.db_table)} SET '
+        f'{column["stock_quantity"]} = {column["stock_quantity"]} + %s, '
+        f'{keep}, {column["updated_at"]} = %s WHERE {column["id"]} = %s'
+    )
+
+
+def import_chunk(rows, default_supplier=None, now=None):
+    """Write one chunk of ``(line, row)`` pairs; returns ``(created, updated, errors)``.
+
+    Must run inside a transaction.
+    """
+    now = now or timezone.now()
+    errors = []
+    entries = _merge(rows, errors)
+    if not entries:
+        return 0, 0, errors
+
+    branch = current_branch()
+    products = {}
+    for product_id, name in (
+        Product.objects.filter(name__in={name for name, _ in entries}).order_by('id')
+        .values_list('id', 'name')
+    ):
+        products.setdefault(name, product_id)
+    batches = {
+        (product_id, batch_number): batch_id
+        for batch_id, product_id, batch_number in Medicine.objects.filter(
+            product__in=list(products.values()), branch=branch,
+            batch_number__in={batch_number for _, batch_number in entries},
+        ).values_list('id', 'product_id', 'batch_number')
+    }
+    supplier_names = {entry['supplier'] for entry in entries.values() if entry['supplier']}
+    suppliers = {}
+    if supplier_names:
+        for supplier in Supplier.objects.filter(name__in=supplier_names).order_by('id'):
+            suppliers.setdefault(supplier.name, supplier)
+
+    conn = connections[DEFAULT_DB_ALIAS]
+    prepare = {field: Medicine._meta.get_field(field).get_db_prep_save for field in BATCH_FIELDS}
+    prepared_now = Medicine._meta.get_field('updated_at').get_db_prep_save(now, conn)
+    new_batches = []
+    updates = []
+    for (name, batch_number), entry in entries.items():
+        supplier = default_supplier
+        if entry['supplier']:
+            supplier = suppliers.get(entry['supplier'])
+            if supplier is None:
+                errors.append({'line': entry['line'], 'error': f'Unknown supplier {entry["supplier"]!r}'})
+                continue
+        batch_id = batches.get((products.get(name), batch_number))
+
+        if batch_id is None:
+            missing = [field for field in NEW_BATCH_FIELDS if entry[field] is None]
+            if supplier is None:
+                missing.append('supplier')
+            if missing:
+                errors.append({'line': entry['line'],
+                               'error': f'New batch needs {", ".join(missing)}'})
+                continue
+            minimum_stock = entry['minimum_stock']
+            if minimum_stock is None:
+                minimum_stock = DEFAULT_MINIMUM_STOCK
+            # Parameters of _insert_sql; the product is filled in below.
+            new_batches.append((entry, [
+                None, supplier.pk, branch and branch.pk, batch_number,
+                *(prepare[field](entry[field], conn) for field in NEW_BATCH_FIELDS),
+                entry['quantity'], minimum_stock, entry['quantity'] <= minimum_stock,
+                prepared_now, prepared_now,
+            ]))
+            continue
+
+        # Parameters of _update_sql; a None keeps the batch's current value.
+        updates.append([
+            entry['quantity'],
+            *(None if entry[field] is None else prepare[field](entry[field], conn)
+              for field in BATCH_FIELDS),
+            supplier.pk if entry['supplier'] else None,
+            prepared_now,
+            batch_id,
+        ])
+
+    new_products = {}
+    for entry, _ in new_batches:
+        if entry['name'] not in products and entry['name'] not in new_products:
+            new_products[entry['name']] = Product(
+                name=entry['name'], generic_name=entry['generic_name'],
+                category=entry['category'], manufacturer=entry['manufacturer'],
+            )
+    Product.objects.bulk_create(new_products.values())
+    products.update((name, product.pk) for name, product in new_products.items())
+    for entry, params in new_batches:
+        params[0] = products[entry['name']]
+    with conn.cursor() as cursor:
+        if new_batches:
+            cursor.executemany(_insert_sql(conn), [params for _, params in new_batches])
+        if updates:
+            cursor.executemany(_update_sql(conn), updates)
+    if updates:
+        Medicine.objects.filter(pk__in=[params[-1] for params in updates]).update(
+            needs_reorder=reorder_after_sale(),
+        )
+
+    transaction.on_commit(typeahead_cache.invalidate)
+    if new_products:
+        # The dashboard's product total; its batch figures follow the alert scan.
+        transaction.on_commit(stats.invalidate_inventory_stats)
+    return len(new_batches), len(updates), errors
+
+
+def import_dir():
+    return str(getattr(settings, 'IMPORT_DIR', os.path.join(settings.BASE_DIR, 'imports')))
+
+
+def save_upload(upload, **fields):
+    """Store an uploaded file under ``IMPORT_DIR`` and create its pending job."""
+    job = ImportJob.objects.create(original_name=upload.name, **fields)
+    os.makedirs(import_dir(), exist_ok=True)
+    job.path = os.path.join(import_dir(), f'import_{job.pk}.csv')
+    with open(job.path, 'wb') as f:
+        for chunk in upload.chunks():
+            f.write(chunk)
+    job.save(update_fields=['path'])
+    return job
+
+
+def _rows(path, skip):
+    """Yield ``(line number, row)`` for the data rows after the first ``skip``."""
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        reader = csv.DictReader(f)
+        missing = [column for column in REQUIRED_COLUMNS if column not in (reader.fieldnames or [])]
+        if missing:
+            raise StockImportError(f'Missing columns: {", ".join(missing)}')
+        for row in islice(reader, skip, None):
+            yield reader.line_num, row
+
+
+def run_import(job, chunk_size=CHUNK_SIZE, progress=None):
+    """Import ``job``'s file, or the rest of it after a failure.
+
+    ``progress`` is called with the job after every committed chunk. On
+    failure the job is marked failed and ``StockImportError`` is raised.
+    """
+    if job.status == ImportJob.DONE:
+        raise StockImportError(f'Import #{job.pk} has already finished')
+    job.status = ImportJob.RUNNING
+    job.error = ''
+    job.save(update_fields=['status', 'error', 'updated_at'])
+    try:
+        rows = _rows(job.path, job.lines_done)
+        while chunk := list(islice(rows, chunk_size)):
+            with transaction.atomic():
+                created, updated, errors = import_chunk(chunk, job.supplier)
+                job.lines_done += len(chunk)
+                job.created += created
+                job.updated += updated
+                job.skipped += len(errors)
+                job.line_errors = (job.line_errors + errors)[:MAX_LINE_ERRORS]
+                job.save(update_fields=['lines_done', 'created', 'updated', 'skipped',
+                                        'line_errors', 'updated_at'])
+            if progress:
+                progress(job)
+    except Exception as e:
+        # Counters of a chunk that rolled back were never committed.
+        job.refresh_from_db(fields=['lines_done', 'created', 'updated', 'skipped', 'line_errors'])
+        job.status = ImportJob.FAILED
+        job.error = str(e) or type(e).__name__
+        job.save(update_fields=['status', 'error', 'updated_at'])
+        if isinstance(e, StockImportError):
+            raise
+        raise StockImportError(f'Import #{job.pk} failed after {job.lines_done} lines: {job.error}') from e
+    job.status = ImportJob.DONE
+    job.save(update_fields=['status', 'updated_at'])
+    return job
@@ -0,0 +1,49 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_datetime
+
+from pharmacy import backup
+
+
+class Command(BaseCommand):
+    help = 'Stream pharmacy data into a compressed (gzip NDJSON) backup'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--output-dir',
+            default='backups',
+            help='Directory that holds the backups (default: backups)'
+        )
+        parser.add_argument(
+            '--incremental',
+            action='store_true',
+            help='Only back up rows changed since the newest backup in the output directory'
+        )
+        parser.add_argument(
+            '--since',
+            help='ISO timestamp to use as the incremental watermark instead of the last backup'
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=backup.CHUNK_SIZE,
+            help=f'Rows fetched per database round trip (default: {backup.CHUNK_SIZE})'
+        )
+
+    def handle(self, *args, **options):
+        since = None
+        if options['since']:
+            since = parse_datetime(options['since'])
+            if since is None:
+                raise CommandError(f'Invalid --since timestamp: {options["since"]}')
+
+        self.stdout.write(self.style.SUCCESS('💾 Creating backup...'))
+        path = backup.create_backup(
+            options['output_dir'],
+            incremental=options['incremental'] or since is not None,
+            since=since,
+            chunk_size=options['chunk_size'],
+            progress=lambda model, rows: self.stdout.write(f'   • {model._meta.verbose_name_plural}: {rows}'),
+        )
+        manifest = backup.read_manifest(path)
+        self.stdout.write(self.style.SUCCESS(f'✅ {manifest["kind"].capitalize()} backup created: {path}'))
+        self.stdout.write(f'To restore: python manage.py restore_pharmacy {path}')
@@ -0,0 +1,119 @@
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+
+from pharmacy import benchmark
+from pharmacy.receipts import receipt_cache
+import json
+import tempfile
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the pharmacy views on a throwaway database and check query budgets'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes',
+            nargs='+',
+            choices=list(benchmark.DATASET_SIZES),
+            default=['small', 'medium'],
+            help='Dataset sizes to benchmark (default: small medium)'
+        )
+        parser.add_argument(
+            '--iterations',
+            type=int,
+            default=20,
+            help='Requests per view and size (default: 20)'
+        )
+        parser.add_argument('--seed', type=int, default=42, help='Dataset seed (default: 42)')
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=1,
+            help='Processes used to generate each dataset (default: 1)'
+        )
+        parser.add_argument(
+            '--budgets',
+            default=benchmark.BUDGETS_FILE,
+            help='Query budget file (default: pharmacy/query_budgets.json)'
+        )
+        parser.add_argument(
+            '--update-budgets',
+            action='store_true',
+            help='Write the measured query counts to the budget file instead of checking them'
+        )
+        parser.add_argument('--json', action='store_true', help='Print the results as JSON')
+
+    def handle(self, *args, **options):
+        if options['iterations'] < 1:
+            raise CommandError('--iterations must be positive')
+
+        results = {}
+        setup_test_environment(debug=False)
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        # Receipts rendered for the throwaway sales must not land in the real cache.
+        receipts_dir = tempfile.TemporaryDirectory()
+        receipts = override_settings(RECEIPT_CACHE_DIR=receipts_dir.name)
+        receipts.enable()
+        try:
+            for size in options['sizes']:
+                if not options['json']:
+                    self.stdout.write(self.style.SUCCESS(f'⏱️  Benchmarking {size} dataset...'))
+                results[size] = self.benchmark_size(size, options)
+                if not options['json']:
+                    self.show_results(results[size])
+        finally:
+            receipts.disable()
+            receipts_dir.cleanup()
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+
+        if options['update_budgets']:
+            self.update_budgets(results, options['budgets'])
+            return
+
+        violations = []
+        budgets = benchmark.load_budgets(options['budgets'])
+        for size, size_results in results.items():
+            violations.extend(f'[{size}] {message}'
+                              for message in benchmark.check_budgets(size_results, budgets))
+        if violations:
+            for message in violations:
+                self.stderr.write(f'❌ {message}')
+            raise CommandError(f'{len(violations)} query budget(s) exceeded')
+        if not options['json']:
+            self.stdout.write(self.style.SUCCESS('✅ All views within their query budgets'))
+
+    def benchmark_size(self, size, options):
+        """Reseed the test database with a dataset of ``size`` and run every scenario"""
+        call_command('flush', interactive=False, verbosity=0)
+        cache.clear()
+        receipt_cache.clear()
+        benchmark.seed_dataset(size, seed=options['seed'], workers=options['workers'])
+        user = User.objects.create_user('benchmark')
+        return benchmark.run_scenarios(user, benchmark.build_scenarios(), options['iterations'])
+
+    def show_results(self, results):
+        """Print one line per scenario"""
+        self.stdout.write(f'   {"view":<26}{"p50 ms":>10}{"p95 ms":>10}{"queries":>10}')
+        for name, result in results.items():
+            self.stdout.write(
+                f'   {name:<26}{result["p50_ms"]:>10}{result["p95_ms"]:>10}{result["queries"]:>10}'
+            )
+
+    def update_budgets(self, results, path):
+        """Store the highest query count seen per scenario as its budget"""
+        budgets = {}
+        for size_results in results.values():
+            for name, result in size_results.items():
+                budgets[name] = max(budgets.get(name, 0), result['queries'])
+        with open(path, 'w') as f:
+            json.dump(dict(sorted(budgets.items())), f, indent=2)
+            f.write('\n')
+        self.stdout.write(self.style.SUCCESS(f'💾 Query budgets written to {path}'))
@@ -1,6 +1,6 @@
 from django.core.management.base import BaseCommand
 from django.contrib.auth.models import User
-from pharmacy.models import Supplier, Medicine, Customer
+from pharmacy.models import Supplier, Medicine, Product, Customer
 from datetime import date, timedelta
 from decimal import Decimal
 
@@ -108,9 +108,15 @@ class Command(BaseCommand):
             }
         ]
 
+        product_fields = ('name', 'generic_name', 'category', 'manufacturer', 'description')
         for med_data in medicines_data:
+            product_data = {field: med_data.pop(field) for field in product_fields}
+            product, _ = Product.objects.get_or_create(
+                name=product_data.pop('name'),
+                defaults=product_data
+            )
             Medicine.objects.get_or_create(
-                name=med_data['name'],
+                product=product,
                 batch_number=med_data['batch_number'],
                 defaults=med_data
             )
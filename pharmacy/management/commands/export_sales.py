@@ -0,0 +1,90 @@
+from datetime import date
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS
+
+from pharmacy import exports
+from pharmacy.models import Branch, Sale
+from pharmacy.routers import reporting_database
+
+
+def _date(value):
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise CommandError(f'Invalid date {value!r}, expected YYYY-MM-DD')
+
+
+class Command(BaseCommand):
+    help = 'Export sales and their items as CSV or NDJSON for accounting'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--format',
+            dest='fmt',
+            choices=sorted(exports.FORMATS),
+            default='csv',
+            help='Output format (default: csv)'
+        )
+        parser.add_argument(
+            '--from',
+            dest='start',
+            help='First day to export, YYYY-MM-DD (default: the first sale)'
+        )
+        parser.add_argument(
+            '--to',
+            dest='end',
+            help='Last day to export, YYYY-MM-DD (default: the last sale)'
+        )
+        parser.add_argument(
+            '--cashier',
+            help='Only sales rung up by this username'
+        )
+        parser.add_argument(
+            '--branch',
+            help='Only sales of the branch with this code'
+        )
+        parser.add_argument(
+            '--primary',
+            action='store_true',
+            help='Read from the primary database even when a read replica is in date'
+        )
+        parser.add_argument(
+            '--output',
+            help='File to write (default: standard output)'
+        )
+
+    def handle(self, *args, **options):
+        start = _date(options['start']) if options['start'] else None
+        end = _date(options['end']) if options['end'] else None
+        if start and end and start > end:
+            raise CommandError('--from must not be after --to')
+        cashier = None
+        if options['cashier']:
+            cashier = User.objects.filter(username=options['cashier']).first()
+            if cashier is None:
+                raise CommandError(f'Unknown cashier: {options["cashier"]}')
+
+        branch = None
+        if options['branch']:
+            branch = Branch.objects.filter(code=options['branch']).first()
+            if branch is None:
+                raise CommandError(f'Unknown branch: {options["branch"]}')
+
+        database = DEFAULT_DB_ALIAS if options['primary'] else reporting_database()
+        sales = exports.filter_sales(Sale.objects.using(database), start=start, end=end, cashier=cashier,
+                                     branch=branch)
+        lines = exports.export_lines(sales, options['fmt'])
+        if not options['output']:
+            for chunk in lines:
+                self.stdout.write(chunk, ending='')
+            return
+
+        self.stdout.write(f'📤 Exporting sales to {options["output"]}...')
+        if database != DEFAULT_DB_ALIAS:
+            self.stdout.write(f'📡 Reading from replica {database}')
+        with open(options['output'], 'w', newline='', encoding='utf-8') as f:
+            for chunk in lines:
+                f.write(chunk)
+        self.stdout.write(self.style.SUCCESS(f'✅ Sales exported to {options["output"]}'))
@@ -0,0 +1,340 @@
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.contrib.auth.models import User
+from django.db import connection, connections, transaction
+from django.db.models import Max
+from django.utils import timezone
+from pharmacy.models import Supplier, Medicine, Product, Customer, Sale, SaleItem, normalize_name
+from bisect import bisect_left
+from datetime import date, timedelta
+from decimal import Decimal
+from itertools import accumulate
+import multiprocessing
+import random
+import time
+
+CATEGORY_PRICES = {
+    'tablet': (2, 25),
+    'capsule': (5, 40),
+    'syrup': (8, 35),
+    'injection': (15, 150),
+    'cream': (6, 30),
+    'drops': (10, 45),
+    'other': (3, 200),
+}
+NAME_STEMS = ['para', 'ibu', 'amox', 'cipro', 'metro', 'lisino', 'ator', 'losar', 'omep', 'panto',
+              'cetiri', 'lora', 'montel', 'sertra', 'fluox', 'gaba', 'predni', 'azithro', 'doxy', 'metf']
+NAME_ENDINGS = ['cillin', 'profen', 'zole', 'pril', 'statin', 'tan', 'mab', 'dine', 'line', 'xone',
+                'mycin', 'cetamol', 'lukast', 'pam', 'sone', 'formin']
+MANUFACTURERS = ['PharmaCorp', 'MediLabs', 'HealthCare Inc', 'BioPharm', 'MediCore', 'PharmaTech',
+                 'CardioMed', 'GastroMed', 'NeuroCare', 'VitaLife', 'WellMed', 'KidsHealth']
+STRENGTHS = ['5mg', '10mg', '20mg', '50mg', '100mg', '250mg', '500mg', '1g', '100ml', '200ml', '15g']
+
+# Relative sales volume per hour of day (opening hours 8-22) and per weekday (Mon=0).
+HOURLY_WEIGHTS = [0, 0, 0, 0, 0, 0, 0, 0, 3, 5, 7, 9, 10, 9, 7, 6, 7, 9, 10, 8, 6, 4, 2, 0]
+WEEKDAY_WEIGHTS = [1.0, 0.95, 0.95, 1.0, 1.15, 1.3, 0.8]
+PAYMENT_METHODS = ['cash', 'card', 'digital']
+PAYMENT_WEIGHTS = [50, 40, 10]
+
+# Per-process generation state, set up by _init_worker.
+_state = {}
+
+
+def _init_worker(state, child=True):
+    if child:
+        # Never share a connection inherited from the parent process.
+        connections.close_all()
+    _state.clear()
+    _state.update(state)
+    _state['medicine_cum_weights'] = list(accumulate(
+        1 / (rank + 1) ** 0.8 for rank in range(len(state['medicines']))
+    ))
+
+
+def _sale_times(first, last, total_sales, slot_cum_weights, start):
+    """Timestamps for sales ``first..last-1`` spread over the weighted hour slots.
+
+    Sale ``i`` is placed at the ``i / total_sales`` quantile of the time
+    distribution, so ids grow with ``created_at`` like they would in a live
+    database, and the result does not depend on how the work was split.
+    """
+    rng = random.Random(f'{_state["seed"]}:times:{first}')
+    total_weight = slot_cum_weights[-1]
+    times = []
+    for i in range(first, last):
+        target = (i + rng.random()) / total_sales * total_weight
+        slot = min(bisect_left(slot_cum_weights, target), len(slot_cum_weights) - 1)
+        slot_start = slot_cum_weights[slot - 1] if slot else 0
+        slot_weight = slot_cum_weights[slot] - slot_start
+        fraction = (target - slot_start) / slot_weight if slot_weight else 0
+        times.append(start + timedelta(hours=slot, seconds=int(fraction * 3600)))
+    return times
+
+
+def _insert_chunk(sales, items, state):
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.executemany(state['sale_sql'], sales)
+        cursor.executemany(state['item_sql'], items)
+
+
+def _generate_chunk(bounds):
+    """Generate sales ``first..last-1``.
+
+    Where the database takes concurrent writers the worker inserts the rows
+    itself, in one transaction. SQLite has a single writer, so there the rows
+    go back to the parent process to be written.
+    """
+    first, last = bounds
+    state = _state
+    rng = random.Random(f'{state["seed"]}:sales:{first}')
+    ops = connection.ops
+    medicines = state['medicines']
+    cum_weights = state['medicine_cum_weights']
+
+    sales = []
+    items = []
+    times = _sale_times(first, last, state['total_sales'], state['slot_cum_weights'], state['start'])
+    for offset, created_at in enumerate(times):
+        sale_id = state['first_sale_id'] + first + offset
+        lines = rng.randint(1, state['max_lines'])
+        total = Decimal('0')
+        for medicine_index in set(rng.choices(range(len(medicines)), cum_weights=cum_weights, k=lines)):
+            medicine_id, price = medicines[medicine_index]
+            quantity = rng.choices((1, 2, 3, 5), weights=(70, 20, 7, 3))[0]
+            line_total = price * quantity
+            total += line_total
+            items.append((sale_id, medicine_id, quantity, ops.adapt_decimalfield_value(price),
+                          ops.adapt_decimalfield_value(Decimal('0')), ops.adapt_decimalfield_value(line_total)))
+
+        discount = Decimal('10') if rng.random() < 0.05 else Decimal('0')
+        final = (total - total * discount / 100).quantize(Decimal('0.01'))
+        customer_id = rng.choice(state['customers']) if state['customers'] and rng.random() < 0.3 else None
+        sales.append((
+            sale_id, customer_id, rng.choice(state['cashiers']),
+            ops.adapt_decimalfield_value(total), ops.adapt_decimalfield_value(discount),
+            ops.adapt_decimalfield_value(Decimal('0')), ops.adapt_decimalfield_value(final),
+            rng.choices(PAYMENT_METHODS, weights=PAYMENT_WEIGHTS)[0],
+            ops.adapt_datetimefield_value(created_at),
+            ops.adapt_datetimefield_value(created_at),
+        ))
+
+    if state['write_in_parent']:
+        return sales, items
+    _insert_chunk(sales, items, state)
+    return len(sales), len(items)
+
+
+def _insert_sql(model, fields):
+    columns = [model._meta.get_field(name).column for name in fields]
+    return 'INSERT INTO {} ({}) VALUES ({})'.format(
+        connection.ops.quote_name(model._meta.db_table),
+        ', '.join(connection.ops.quote_name(c) for c in columns),
+        ', '.join(['%s'] * len(columns)),
+    )
+
+
+class Command(BaseCommand):
+    help = 'Generate a large, reproducible synthetic catalog and sales history for load testing'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--medicines', type=int, default=10000,
+                            help='Medicines to create (default: 10000)')
+        parser.add_argument('--customers', type=int, default=50000,
+                            help='Customers to create (default: 50000)')
+        parser.add_argument('--cashiers', type=int, default=10,
+                            help='Cashier accounts to spread sales over (default: 10)')
+        parser.add_argument('--sales', type=int, default=100000,
+                            help='Sales to create (default: 100000)')
+        parser.add_argument('--max-lines', type=int, default=5,
+                            help='Maximum lines per sale, averaging about half of it (default: 5)')
+        parser.add_argument('--days', type=int, default=365,
+                            help='Days of history the sales are spread over (default: 365)')
+        parser.add_argument('--seed', type=int, default=42,
+                            help='Random seed; the same seed generates the same data (default: 42)')
+        parser.add_argument('--workers', type=int, default=multiprocessing.cpu_count(),
+                            help='Processes generating sales (default: number of CPUs)')
+        parser.add_argument('--batch-size', type=int, default=5000,
+                            help='Sales per transaction (default: 5000)')
+
+    def handle(self, *args, **options):
+        if options['max_lines'] < 1 or options['days'] < 1 or options['batch_size'] < 1:
+            raise CommandError('--max-lines, --days and --batch-size must be positive')
+
+        self.seed = options['seed']
+        started = time.monotonic()
+        self.stdout.write(self.style.SUCCESS(f'🏭 Generating load data (seed {self.seed})...'))
+
+        suppliers = self.create_suppliers()
+        self.create_medicines(options['medicines'], suppliers)
+        self.create_customers(options['customers'])
+        cashiers = self.create_cashiers(options['cashiers'])
+
+        if options['sales'] > 0:
+            if not Medicine.objects.exists():
+                raise CommandError('Sales need at least one medicine')
+            self.create_sales(options, cashiers)
+            # Sales were written with raw inserts, which the rollups do not see.
+            call_command('rebuild_rollups', stdout=self.stdout)
+        call_command('scan_alerts', stdout=self.stdout)
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(f'✅ Load data generated in {elapsed:.1f}s'))
+
+    def create_suppliers(self):
+        """Create a fixed set of load-test suppliers"""
+        suppliers = []
+        for i in range(1, 11):
+            supplier, _ = Supplier.objects.get_or_create(
+                name=f'LoadGen Supplier {i:02d}',
+                defaults={'contact_person': f'Contact {i}', 'phone': f'555-9{i:03d}',
+                          'address': f'{i} Warehouse Row'},
+            )
+            suppliers.append(supplier)
+        return suppliers
+
+    def create_medicines(self, count, suppliers):
+        """Bulk-create products with one to three batches each, in chunks"""
+        rng = random.Random(f'{self.seed}:medicines')
+        today = date.today()
+        categories = list(CATEGORY_PRICES)
+        batches = 0
+        for chunk_start in range(0, count, 5000):
+            products = []
+            for i in range(chunk_start, min(chunk_start + 5000, count)):
+                products.append(Product(
+                    name=f'{rng.choice(NAME_STEMS).title()}{rng.choice(NAME_ENDINGS)} {rng.choice(STRENGTHS)}',
+                    generic_name=f'{rng.choice(NAME_STEMS)}{rng.choice(NAME_ENDINGS)}',
+                    category=rng.choice(categories),
+                    manufacturer=rng.choice(MANUFACTURERS),
+                ))
+            Product.objects.bulk_create(products)
+
+            medicines = []
+            for i, product in enumerate(products, start=chunk_start):
+                low, high = CATEGORY_PRICES[product.category]
+                selling = Decimal(rng.randint(low * 100, high * 100)) / 100
+                for lot in range(rng.choice((1, 1, 2, 3))):
+                    stock = rng.randint(0, 500)
+                    minimum = rng.randint(5, 30)
+                    medicines.append(Medicine(
+                        product=product,
+                        supplier=rng.choice(suppliers),
+                        batch_number=f'LG{self.seed}-{i:08d}-{lot}',
+                        expiry_date=today + timedelta(days=rng.randint(-60, 1095)),
+                        purchase_price=(selling * Decimal('0.65')).quantize(Decimal('0.01')),
+                        selling_price=selling,
+                        stock_quantity=stock,
+                        minimum_stock=minimum,
+                        # bulk_create skips Medicine.save, which normally sets this.
+                        needs_reorder=stock <= minimum,
+                    ))
+            Medicine.objects.bulk_create(medicines)
+            batches += len(medicines)
+        if count:
+            self.stdout.write(f'💊 Created {count} medicines in {batches} batches')
+
+    def create_customers(self, count):
+        """Bulk-create customers with deterministic unique phone numbers"""
+        rng = random.Random(f'{self.seed}:customers')
+        first_names = ['Alice', 'Bob', 'Carol', 'David', 'Emma', 'Frank', 'Grace', 'Henry', 'Ivy', 'Jack']
+        last_names = ['Johnson', 'Williams', 'Davis', 'Brown', 'Wilson', 'Miller', 'Lee', 'Garcia']
+        batch = []
+        for i in range(count):
+            name = f'{rng.choice(first_names)} {rng.choice(last_names)}'
+            batch.append(Customer(
+                name=name,
+                name_normalized=normalize_name(name),
+                phone=f'7{self.seed % 100:02d}{i:09d}'[:15],
+            ))
+            if len(batch) >= 5000:
+                Customer.objects.bulk_create(batch, ignore_conflicts=True)
+                batch = []
+        if batch:
+            Customer.objects.bulk_create(batch, ignore_conflicts=True)
+        if count:
+            self.stdout.write(f'👥 Created up to {count} customers')
+
+    def create_cashiers(self, count):
+        """Get or create the cashier accounts"""
+        cashiers = []
+        for i in range(1, max(count, 1) + 1):
+            user, created = User.objects.get_or_create(username=f'loadgen_cashier_{i:02d}')
+            if created:
+                user.set_unusable_password()
+                user.save(update_fields=['password'])
+            cashiers.append(user.id)
+        return cashiers
+
+    def slot_weights(self, days, end):
+        """Weight of every hour in the history window: weekly and daily peaks plus growth"""
+        start = (end - timedelta(days=days)).replace(minute=0, second=0, microsecond=0)
+        weights = []
+        for hour_index in range(days * 24):
+            moment = start + timedelta(hours=hour_index)
+            growth = 0.7 + 0.6 * hour_index / (days * 24)
+            weights.append(growth * WEEKDAY_WEIGHTS[moment.weekday()] * HOURLY_WEIGHTS[moment.hour])
+        return start, list(accumulate(weights))
+
+    def create_sales(self, options, cashiers):
+        """Generate sales and sale items across worker processes"""
+        total_sales = options['sales']
+        batch_size = options['batch_size']
+        start, slot_cum_weights = self.slot_weights(options['days'], timezone.localtime())
+
+        state = {
+            'seed': self.seed,
+            'total_sales': total_sales,
+            'max_lines': options['max_lines'],
+            'start': start,
+            'slot_cum_weights': slot_cum_weights,
+            'first_sale_id': (Sale.objects.aggregate(max_id=Max('id'))['max_id'] or 0) + 1,
+            'medicines': list(Medicine.objects.order_by('id').values_list('id', 'selling_price')),
+            'customers': list(Customer.objects.order_by('id').values_list('id', flat=True)),
+            'cashiers': cashiers,
+            'write_in_parent': connection.vendor == 'sqlite',
+            'sale_sql': _insert_sql(Sale, ['id', 'customer', 'cashier', 'total_amount', 'discount',
+                                           'tax', 'final_amount', 'payment_method', 'created_at',
+                                           'updated_at']),
+            'item_sql': _insert_sql(SaleItem, ['sale', 'medicine', 'quantity', 'unit_price',
+                                               'discount_amount', 'total_price']),
+        }
+        chunks = [(first, min(first + batch_size, total_sales))
+                  for first in range(0, total_sales, batch_size)]
+
+        self.stdout.write(f'🛒 Generating {total_sales} sales in {len(chunks)} batches...')
+        sales_done = items_done = 0
+        started = time.monotonic()
+
+        def report(result):
+            nonlocal sales_done, items_done
+            sales, items = result
+            if state['write_in_parent']:
+                _insert_chunk(sales, items, state)
+                sales, items = len(sales), len(items)
+            sales_done += sales
+            items_done += items
+            rate = items_done / max(time.monotonic() - started, 1e-6)
+            self.stdout.write(f'   • {sales_done}/{total_sales} sales, {items_done} lines ({rate:,.0f} lines/s)')
+
+        workers = options['workers']
+        if 'fork' not in multiprocessing.get_all_start_methods():
+            # Workers rely on inheriting the configured Django app registry.
+            workers = 1
+        if workers > 1 and len(chunks) > 1:
+            connections.close_all()
+            # Workers connect lazily on first use; on SQLite they never do.
+            with multiprocessing.get_context('fork').Pool(workers, _init_worker, (state,)) as pool:
+                for result in pool.imap_unordered(_generate_chunk, chunks):
+                    report(result)
+        else:
+            _init_worker(state, child=False)
+            for chunk in chunks:
+                report(_generate_chunk(chunk))
+
+        # Sale ids were assigned explicitly; move sequences past them where they exist.
+        statements = connection.ops.sequence_reset_sql(no_style(), [Sale])
+        if statements:
+            with connection.cursor() as cursor:
+                for statement in statements:
+                    cursor.execute(statement)
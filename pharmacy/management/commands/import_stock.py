@@ -0,0 +1,77 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from pharmacy import imports
+from pharmacy.models import ImportJob, Supplier
+
+
+class Command(BaseCommand):
+    help = 'Import a supplier delivery note or price list CSV, or resume a failed import'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path',
+            nargs='?',
+            help='CSV file with a header row, see pharmacy/imports.py for the columns'
+        )
+        parser.add_argument(
+            '--supplier',
+            help='Supplier name for new batches whose line names none'
+        )
+        parser.add_argument(
+            '--resume',
+            type=int,
+            metavar='JOB_ID',
+            help='Continue a failed import after its last committed chunk'
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=imports.CHUNK_SIZE,
+            help=f'Lines written per transaction (default: {imports.CHUNK_SIZE})'
+        )
+
+    def handle(self, *args, **options):
+        if options['chunk_size'] < 1:
+            raise CommandError('--chunk-size must be positive')
+        if options['resume']:
+            try:
+                job = ImportJob.objects.get(pk=options['resume'])
+            except ImportJob.DoesNotExist:
+                raise CommandError(f'No import #{options["resume"]}')
+            self.stdout.write(self.style.SUCCESS(f'📥 Resuming import #{job.pk} after line {job.lines_done}...'))
+        elif options['path']:
+            path = os.path.abspath(options['path'])
+            if not os.path.isfile(path):
+                raise CommandError(f'No such file: {path}')
+            supplier = None
+            if options['supplier']:
+                supplier = Supplier.objects.filter(name=options['supplier']).order_by('id').first()
+                if supplier is None:
+                    raise CommandError(f'Unknown supplier: {options["supplier"]}')
+            job = ImportJob.objects.create(path=path, original_name=os.path.basename(path),
+                                           supplier=supplier)
+            self.stdout.write(self.style.SUCCESS(f'📥 Importing {path} as import #{job.pk}...'))
+        else:
+            raise CommandError('Give a CSV file to import or --resume JOB_ID')
+
+        try:
+            imports.run_import(
+                job,
+                chunk_size=options['chunk_size'],
+                progress=lambda job: self.stdout.write(
+                    f'   • {job.lines_done} lines: {job.created} new batches, '
+                    f'{job.updated} updated, {job.skipped} skipped'
+                ),
+            )
+        except imports.StockImportError as e:
+            raise CommandError(f'{e}\nFix the problem and run: python manage.py import_stock --resume {job.pk}')
+
+        for error in job.line_errors:
+            self.stdout.write(self.style.WARNING(f'   ⚠️  Line {error["line"]}: {error["error"]}'))
+        if job.skipped > len(job.line_errors):
+            self.stdout.write(self.style.WARNING(f'   ... and {job.skipped - len(job.line_errors)} more'))
+        self.stdout.write(self.style.SUCCESS(
+            f'✅ Import #{job.pk} done: {job.created} new batches, {job.updated} updated, {job.skipped} skipped'
+        ))
@@ -1,8 +1,14 @@
 from django.core.management.base import BaseCommand, CommandError
 from django.contrib.auth.models import User
-from pharmacy.models import Supplier, Medicine, Customer, Sale
-from datetime import date, timedelta
-from decimal import Decimal
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import DEFAULT_DB_ALIAS
+from pharmacy.models import (
+    Supplier, Medicine, Product, Customer, Sale, DailyMedicineSales, DailyCashierSales,
+)
+from pharmacy.routers import reporting_database, reads_from
+from pharmacy.stats import EXPIRING_SOON_DAYS, collect_statistics
+from datetime import date
+import json
 
 class Command(BaseCommand):
     help = 'Interactive pharmacy management command'
@@ -14,6 +20,16 @@ class Command(BaseCommand):
             choices=['setup', 'stats', 'cleanup', 'backup'],
             help='Action to perform'
         )
+        parser.add_argument(
+            '--json',
+            action='store_true',
+            help='Print statistics as JSON (for monitoring)'
+        )
+        parser.add_argument(
+            '--primary',
+            action='store_true',
+            help='Read statistics from the primary database even when a read replica is in date'
+        )
 
     def handle(self, *args, **options):
         action = options.get('action')
@@ -21,7 +37,7 @@ class Command(BaseCommand):
         if action == 'setup':
             self.setup_pharmacy()
         elif action == 'stats':
-            self.show_statistics()
+            self.show_statistics(as_json=options.get('json', False), primary=options.get('primary', False))
         elif action == 'cleanup':
             self.cleanup_data()
         elif action == 'backup':
@@ -128,53 +144,46 @@ class Command(BaseCommand):
         except Exception as e:
             self.stdout.write(self.style.ERROR(f'❌ Error: {str(e)}'))
 
-    def show_statistics(self):
+    def show_statistics(self, as_json=False, primary=False):
         """Show comprehensive pharmacy statistics"""
+        database = DEFAULT_DB_ALIAS if primary else reporting_database()
+        with reads_from(database):
+            statistics = collect_statistics()
+        if as_json:
+            self.stdout.write(json.dumps(statistics, cls=DjangoJSONEncoder, indent=2))
+            return
+
+        medicines = statistics['medicines']
         self.stdout.write(self.style.SUCCESS('\n📊 PHARMACY STATISTICS'))
         self.stdout.write('=' * 40)
+        if database != DEFAULT_DB_ALIAS:
+            self.stdout.write(f'📡 Read from replica {database}')
         
         # Medicine statistics
-        total_medicines = Medicine.objects.count()
-        self.stdout.write(f'💊 Total Medicines: {total_medicines}')
+        self.stdout.write(f'💊 Total Medicines: {medicines["total"]} ({medicines["batches"]} batches)')
         
-        if total_medicines > 0:
+        if medicines['total'] > 0:
             # Category breakdown
             self.stdout.write('\n📋 By Category:')
-            for category_code, category_name in Medicine.CATEGORY_CHOICES:
-                count = Medicine.objects.filter(category=category_code).count()
-                if count > 0:
-                    percentage = (count / total_medicines) * 100
-                    self.stdout.write(f'   • {category_name}: {count} ({percentage:.1f}%)')
+            for category in medicines['by_category']:
+                self.stdout.write(f'   • {category["name"]}: {category["count"]} ({category["percentage"]:.1f}%)')
             
             # Stock alerts
-            low_stock = Medicine.objects.filter(stock_quantity__lte=models.F('minimum_stock')).count()
-            expired = Medicine.objects.filter(expiry_date__lt=date.today()).count()
-            expiring_soon = Medicine.objects.filter(
-                expiry_date__gte=date.today(),
-                expiry_date__lte=date.today() + timedelta(days=30)
-            ).count()
-            
             self.stdout.write(f'\n⚠️  Stock Alerts:')
-            self.stdout.write(f'   • Low Stock: {low_stock}')
-            self.stdout.write(f'   • Expired: {expired}')
-            self.stdout.write(f'   • Expiring Soon (30 days): {expiring_soon}')
+            self.stdout.write(f'   • Low Stock: {medicines["low_stock"]}')
+            self.stdout.write(f'   • Expired: {medicines["expired"]}')
+            self.stdout.write(f'   • Expiring Soon ({EXPIRING_SOON_DAYS} days): {medicines["expiring_soon"]}')
             
             # Value statistics
-            total_value = sum(med.selling_price * med.stock_quantity for med in Medicine.objects.all())
-            self.stdout.write(f'\n💰 Total Inventory Value: ${total_value:,.2f}')
+            self.stdout.write(f'\n💰 Total Inventory Value: ${medicines["inventory_value"]:,.2f}')
         
         # Other statistics
-        total_suppliers = Supplier.objects.count()
-        total_customers = Customer.objects.count()
-        total_sales = Sale.objects.count()
+        self.stdout.write(f'\n🏢 Total Suppliers: {statistics["suppliers"]}')
+        self.stdout.write(f'👥 Total Customers: {statistics["customers"]}')
+        self.stdout.write(f'🛒 Total Sales: {statistics["sales"]["total"]}')
         
-        self.stdout.write(f'\n🏢 Total Suppliers: {total_suppliers}')
-        self.stdout.write(f'👥 Total Customers: {total_customers}')
-        self.stdout.write(f'🛒 Total Sales: {total_sales}')
-        
-        if total_sales > 0:
-            total_revenue = sum(sale.final_amount for sale in Sale.objects.all())
-            self.stdout.write(f'💵 Total Revenue: ${total_revenue:,.2f}')
+        if statistics['sales']['total'] > 0:
+            self.stdout.write(f'💵 Total Revenue: ${statistics["sales"]["revenue"]:,.2f}')
 
     def cleanup_data(self):
         """Interactive data cleanup"""
@@ -202,18 +211,21 @@ class Command(BaseCommand):
                 deleted = Medicine.objects.filter(expiry_date__lt=date.today()).delete()
                 self.stdout.write(self.style.SUCCESS(f'🗑️  Deleted {deleted[0]} expired medicines'))
             elif choice == '2':
-                deleted = Medicine.objects.all().delete()
-                self.stdout.write(self.style.SUCCESS(f'🗑️  Deleted {deleted[0]} medicines'))
+                deleted = Product.objects.all().delete()
+                self.stdout.write(self.style.SUCCESS(f'🗑️  Deleted {deleted[0]} medicines and batches'))
             elif choice == '3':
                 deleted = Customer.objects.all().delete()
                 self.stdout.write(self.style.SUCCESS(f'🗑️  Deleted {deleted[0]} customers'))
             elif choice == '4':
                 deleted = Sale.objects.all().delete()
+                DailyMedicineSales.objects.all().delete()
+                DailyCashierSales.objects.all().delete()
                 self.stdout.write(self.style.SUCCESS(f'🗑️  Deleted {deleted[0]} sales records'))
             elif choice == '5':
-                Medicine.objects.all().delete()
+                Product.objects.all().delete()
                 Customer.objects.all().delete()
                 Sale.objects.all().delete()
+                DailyCashierSales.objects.all().delete()
                 Supplier.objects.all().delete()
                 self.stdout.write(self.style.SUCCESS('🗑️  Complete database cleanup done'))
             else:
@@ -224,20 +236,9 @@ class Command(BaseCommand):
 
     def backup_data(self):
         """Create data backup"""
-        self.stdout.write(self.style.SUCCESS('\n💾 Creating backup...'))
-        
         try:
             from django.core.management import call_command
-            from datetime import datetime
-            
-            backup_file = f'pharmacy_backup_{datetime.now().strftime("%Y%m%d_%H%M%S")}.json'
-            
-            with open(backup_file, 'w') as f:
-                call_command('dumpdata', 'pharmacy', stdout=f)
-            
-            self.stdout.write(self.style.SUCCESS(f'✅ Backup created: {backup_file}'))
-            self.stdout.write('To restore: python manage.py loaddata {}'.format(backup_file))
-            
+            call_command('backup_pharmacy', incremental=True, stdout=self.stdout)
         except Exception as e:
             self.stdout.write(self.style.ERROR(f'❌ Backup failed: {str(e)}'))
 
@@ -251,10 +252,13 @@ class Command(BaseCommand):
         self.stdout.write('python manage.py populate_medicines --clear --count 200')
         self.stdout.write('\npython manage.py manage_pharmacy --action setup')
         self.stdout.write('python manage.py manage_pharmacy --action stats')
+        self.stdout.write('python manage.py manage_pharmacy --action stats --json')
         self.stdout.write('python manage.py manage_pharmacy --action cleanup')
+        self.stdout.write('python manage.py backup_pharmacy --incremental')
+        self.stdout.write('python manage.py restore_pharmacy backups/<full> backups/<incremental>...')
         
         self.stdout.write('\n📚 Available Categories:')
-        for code, name in Medicine.CATEGORY_CHOICES:
+        for code, name in Product.CATEGORY_CHOICES:
             self.stdout.write(f'   • {code}: {name}')
         
         self.stdout.write('\n🎯 Tips:')
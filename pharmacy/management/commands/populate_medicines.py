@@ -1,6 +1,8 @@
 from django.core.management.base import BaseCommand, CommandError
 from django.contrib.auth.models import User
-from pharmacy.models import Supplier, Medicine, Customer
+from pharmacy.models import Supplier, Medicine, Product, Customer
+from pharmacy import alerts
+from pharmacy.stats import collect_statistics
 from datetime import date, timedelta
 from decimal import Decimal
 import random
@@ -49,7 +51,7 @@ class Command(BaseCommand):
         # Clear existing data if requested
         if clear_data:
             self.stdout.write('🗑️  Clearing existing medicine data...')
-            Medicine.objects.all().delete()
+            Product.objects.all().delete()
             if create_suppliers:
                 Supplier.objects.all().delete()
             if create_customers:
@@ -298,21 +300,26 @@ class Command(BaseCommand):
                 expiry_days = random.randint(180, 1095)
                 expiry_date = date.today() + timedelta(days=expiry_days)
                 
-                # Create medicine
-                medicine, created = Medicine.objects.get_or_create(
+                # Create the product, then this batch of it
+                product, _ = Product.objects.get_or_create(
                     name=medicine_data['name'],
-                    batch_number=batch_number,
                     defaults={
                         'generic_name': medicine_data['generic'],
                         'category': category,
                         'manufacturer': medicine_data['manufacturer'],
+                        'description': medicine_data['desc']
+                    }
+                )
+                medicine, created = Medicine.objects.get_or_create(
+                    product=product,
+                    batch_number=batch_number,
+                    defaults={
                         'supplier': supplier,
                         'expiry_date': expiry_date,
                         'purchase_price': purchase_price,
                         'selling_price': selling_price,
                         'stock_quantity': stock_quantity,
-                        'minimum_stock': minimum_stock,
-                        'description': medicine_data['desc']
+                        'minimum_stock': minimum_stock
                     }
                 )
                 
@@ -333,6 +340,7 @@ class Command(BaseCommand):
         )
         
         # Show summary
+        alerts.scan()
         self.show_summary()
 
     def show_summary(self):
@@ -341,32 +349,22 @@ class Command(BaseCommand):
         self.stdout.write(self.style.SUCCESS('📊 PHARMACY DATABASE SUMMARY'))
         self.stdout.write('='*50)
         
+        statistics = collect_statistics()
+        medicines = statistics['medicines']
+
         # Medicine statistics
-        total_medicines = Medicine.objects.count()
-        categories_stats = {}
-        for category_code, category_name in Medicine.CATEGORY_CHOICES:
-            count = Medicine.objects.filter(category=category_code).count()
-            if count > 0:
-                categories_stats[category_name] = count
-        
-        self.stdout.write(f'💊 Total Medicines: {total_medicines}')
+        self.stdout.write(f'💊 Total Medicines: {medicines["total"]} ({medicines["batches"]} batches)')
         self.stdout.write('📋 By Category:')
-        for category, count in categories_stats.items():
-            self.stdout.write(f'   • {category}: {count}')
+        for category in medicines['by_category']:
+            self.stdout.write(f'   • {category["name"]}: {category["count"]}')
         
         # Stock alerts
-        low_stock = Medicine.objects.filter(stock_quantity__lte = models.F('minimum_stock')).count()
-        expired = Medicine.objects.filter(expiry_date__lt=date.today()).count()
-        
-        self.stdout.write(f'⚠️  Low Stock Items: {low_stock}')
-        self.stdout.write(f'❌ Expired Items: {expired}')
+        self.stdout.write(f'⚠️  Low Stock Items: {medicines["low_stock"]}')
+        self.stdout.write(f'❌ Expired Items: {medicines["expired"]}')
         
         # Other statistics
-        total_suppliers = Supplier.objects.count()
-        total_customers = Customer.objects.count()
-        
-        self.stdout.write(f'🏢 Total Suppliers: {total_suppliers}')
-        self.stdout.write(f'👥 Total Customers: {total_customers}')
+        self.stdout.write(f'🏢 Total Suppliers: {statistics["suppliers"]}')
+        self.stdout.write(f'👥 Total Customers: {statistics["customers"]}')
         
         self.stdout.write('='*50)
         self.stdout.write(self.style.SUCCESS('✅ Database population complete!'))
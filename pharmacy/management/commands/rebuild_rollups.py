@@ -0,0 +1,40 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from pharmacy import rollups
+
+
+def _date(value):
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise CommandError(f'Invalid date {value!r}, expected YYYY-MM-DD')
+
+
+class Command(BaseCommand):
+    help = 'Recompute the daily sales rollups from the recorded sales'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--from',
+            dest='start',
+            help='First day to rebuild, YYYY-MM-DD (default: the first sale)'
+        )
+        parser.add_argument(
+            '--to',
+            dest='end',
+            help='Last day to rebuild, YYYY-MM-DD (default: the last sale)'
+        )
+
+    def handle(self, *args, **options):
+        start = _date(options['start']) if options['start'] else None
+        end = _date(options['end']) if options['end'] else None
+        if start and end and start > end:
+            raise CommandError('--from must not be after --to')
+
+        self.stdout.write('📊 Rebuilding daily sales rollups...')
+        medicine_rows, cashier_rows = rollups.rebuild(start, end)
+        self.stdout.write(self.style.SUCCESS(
+            f'✅ Rollups rebuilt: {medicine_rows} medicine rows, {cashier_rows} cashier rows'
+        ))
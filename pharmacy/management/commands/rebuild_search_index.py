@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from pharmacy import search
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the full-text medicine search index'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--database',
+            default=DEFAULT_DB_ALIAS,
+            help='Database alias to rebuild the index on (default: "default")'
+        )
+
+    def handle(self, *args, **options):
+        conn = connections[options['database']]
+        if not search.is_supported(conn):
+            raise CommandError('Full-text search needs SQLite with FTS5; the icontains fallback is in use.')
+
+        self.stdout.write('🔎 Rebuilding medicine search index...')
+        if not search.install(conn):
+            search.rebuild(conn)
+        self.stdout.write(self.style.SUCCESS('✅ Search index rebuilt'))
@@ -0,0 +1,30 @@
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from pharmacy import routers
+
+
+class Command(BaseCommand):
+    help = 'Copy the primary database into its SQLite read replicas'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'aliases',
+            nargs='*',
+            help='Replica database aliases to refresh (default: PHARMACY_READ_REPLICAS)'
+        )
+
+    def handle(self, *args, **options):
+        aliases = options['aliases'] or routers.replicas()
+        if not aliases:
+            raise CommandError('No read replicas configured; set PHARMACY_READ_REPLICAS or name an alias.')
+        for alias in aliases:
+            if alias not in connections:
+                raise CommandError(f'Unknown database alias: {alias}')
+            self.stdout.write(f'📡 Refreshing replica {alias}...')
+            try:
+                routers.refresh_replica(alias)
+            except ImproperlyConfigured as e:
+                raise CommandError(str(e))
+        self.stdout.write(self.style.SUCCESS(f'✅ {len(aliases)} replica(s) refreshed'))
@@ -0,0 +1,51 @@
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+
+from pharmacy import backup, customers
+
+
+class Command(BaseCommand):
+    help = 'Restore pharmacy backups created by backup_pharmacy'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'paths',
+            nargs='+',
+            help='Backup directories; a full backup followed by its incrementals'
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=4,
+            help='Tables loaded in parallel (default: 4)'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=backup.BATCH_SIZE,
+            help=f'Rows per insert batch and transaction (default: {backup.BATCH_SIZE})'
+        )
+
+    def handle(self, *args, **options):
+        try:
+            # Apply the chain oldest first so later changes win.
+            paths = sorted(options['paths'], key=lambda p: backup.read_manifest(p)['watermark'])
+            for path in paths:
+                self.stdout.write(self.style.SUCCESS(f'♻️  Restoring {path}...'))
+                backup.restore_backup(
+                    path,
+                    workers=options['workers'],
+                    batch_size=options['batch_size'],
+                    progress=lambda model, rows: self.stdout.write(
+                        f'   • {model._meta.verbose_name_plural}: {rows}'
+                    ),
+                )
+        except backup.BackupError as e:
+            raise CommandError(str(e))
+
+        # Backups hold the sales, not the rollups derived from them.
+        call_command('rebuild_rollups', stdout=self.stdout)
+        # Backups taken before customers had name_normalized leave it empty.
+        customers.normalize_names()
+
+        self.stdout.write(self.style.SUCCESS('✅ Restore complete'))
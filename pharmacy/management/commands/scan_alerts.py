@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from pharmacy import alerts
+
+
+class Command(BaseCommand):
+    help = 'Open and resolve low stock and expiry alerts for batches changed since the last scan (run from cron)'
+
+    def handle(self, *args, **options):
+        run = alerts.scan()
+        if options['verbosity'] > 0:
+            self.stdout.write(self.style.SUCCESS(
+                f'🔔 Checked {run.checked} batches: {run.opened} alerts opened, {run.resolved} resolved'
+            ))
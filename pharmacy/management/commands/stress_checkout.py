@@ -0,0 +1,234 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connection, connections
+from django.test.utils import override_settings
+from django.utils import timezone
+from pharmacy.benchmark import percentile
+from pharmacy.checkout import CheckoutError, process_checkout
+from pharmacy.db import sqlite_pragmas
+from pharmacy.models import Supplier, Medicine, Product, Sale
+from pharmacy.writer import CheckoutWriter
+from datetime import timedelta
+from decimal import Decimal
+import asyncio
+import os
+import random
+import tempfile
+import threading
+import time
+
+
+class Command(BaseCommand):
+    help = 'Run concurrent checkouts against a scratch SQLite file: untuned, tuned, and through the group-commit writer'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8,
+                            help='Concurrent checkout threads, or async clients in group mode (default: 8)')
+        parser.add_argument('--readers', type=int, default=2,
+                            help='Concurrent threads reading sales history (default: 2)')
+        parser.add_argument('--duration', type=float, default=10,
+                            help='Seconds to run each configuration (default: 10)')
+        parser.add_argument('--medicines', type=int, default=50,
+                            help='Products the checkouts pick from (default: 50)')
+        parser.add_argument('--lines', type=int, default=3,
+                            help='Lines per cart (default: 3)')
+        parser.add_argument('--mode', choices=['all', 'both', 'untuned', 'tuned', 'group'], default='all',
+                            help='Configurations to run; "both" is untuned and tuned (default: all)')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError('stress_checkout measures the SQLite connection settings')
+        if options['threads'] < 1 or options['duration'] <= 0 or options['lines'] < 1:
+            raise CommandError('--threads, --duration and --lines must be positive')
+        if options['medicines'] < options['lines']:
+            raise CommandError('--medicines must be at least --lines')
+
+        # SQLite's defaults (no pragmas, deferred transactions that upgrade
+        # their lock when they first write) versus the pragmas and immediate
+        # transactions of pharmacy.db, and the tuned database behind the
+        # group-commit writer of the async path.
+        configurations = [
+            ('untuned', {}, None),
+            ('tuned', sqlite_pragmas(), 'IMMEDIATE'),
+            ('group', sqlite_pragmas(), 'IMMEDIATE'),
+        ]
+        if options['mode'] == 'both':
+            configurations = configurations[:2]
+        elif options['mode'] != 'all':
+            configurations = [c for c in configurations if c[0] == options['mode']]
+
+        results = {}
+        for label, pragmas, transaction_mode in configurations:
+            clients = 'async clients' if label == 'group' else 'writers'
+            self.stdout.write(self.style.SUCCESS(
+                f'🏋️  {label}: {options["threads"]} {clients}, {options["readers"]} readers, '
+                f'{options["duration"]:g}s'
+            ))
+            results[label] = self.run_configuration(pragmas, transaction_mode, options, group=label == 'group')
+            self.show_result(results[label])
+
+        if 'untuned' in results and 'tuned' in results:
+            before, after = results['untuned'], results['tuned']
+            speedup = after['throughput'] / before['throughput'] if before['throughput'] else float('inf')
+            self.stdout.write(self.style.SUCCESS(
+                f'📈 Tuned: {speedup:.1f}x checkout throughput, lock errors '
+                f'{before["error_rate"]:.1f}% -> {after["error_rate"]:.1f}%'
+            ))
+        if 'tuned' in results and 'group' in results:
+            before, after = results['tuned'], results['group']
+            speedup = after['throughput'] / before['throughput'] if before['throughput'] else float('inf')
+            self.stdout.write(self.style.SUCCESS(
+                f'📈 Group commit: {speedup:.1f}x checkout throughput over tuned create_sale, '
+                f'{after["sales_per_group"]:.1f} sales per transaction'
+            ))
+
+    def run_configuration(self, pragmas, transaction_mode, options, group=False):
+        """Create a scratch database file with ``pragmas`` and hammer it with checkouts"""
+        settings_dict = connection.settings_dict
+        saved = settings_dict['TEST'].get('NAME'), settings_dict.get('SQLITE_PRAGMAS'), settings_dict['OPTIONS']
+        with tempfile.TemporaryDirectory() as tmp, override_settings(RECEIPT_CACHE_DIR=tmp):
+            settings_dict['TEST']['NAME'] = os.path.join(tmp, 'stress.sqlite3')
+            settings_dict['SQLITE_PRAGMAS'] = pragmas
+            settings_dict['OPTIONS'] = {**saved[2], 'transaction_mode': transaction_mode}
+            old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+            try:
+                cashier, product_ids = self.seed(options['medicines'])
+                # Every thread opens its own connection, so the pragmas apply to all of them.
+                connection.close()
+                return self.hammer(cashier, product_ids, options, group)
+            finally:
+                connection.creation.destroy_test_db(old_name, verbosity=0)
+                settings_dict['TEST']['NAME'], settings_dict['SQLITE_PRAGMAS'], settings_dict['OPTIONS'] = saved
+                if saved[1] is None:
+                    del settings_dict['SQLITE_PRAGMAS']
+
+    def seed(self, count):
+        """Create the cashier and well-stocked products, two batches each"""
+        cashier = User.objects.create_user('stress_cashier')
+        supplier = Supplier.objects.create(name='Stress Supplier', contact_person='Load',
+                                           phone='555-0000', address='1 Test Lane')
+        products = Product.objects.bulk_create([
+            Product(name=f'Stress Medicine {i}', generic_name='Stressamol',
+                    category='tablet', manufacturer='LoadLabs')
+            for i in range(count)
+        ])
+        Medicine.objects.bulk_create([
+            Medicine(
+                product=product, supplier=supplier, batch_number=f'ST{i:05d}-{batch}',
+                expiry_date=timezone.localdate() + timedelta(days=180 * (batch + 1)),
+                purchase_price=Decimal('1.00'), selling_price=Decimal('2.00'),
+                stock_quantity=10 ** 9, minimum_stock=10,
+            )
+            for i, product in enumerate(products) for batch in range(2)
+        ])
+        return cashier, [product.pk for product in products]
+
+    def hammer(self, cashier, product_ids, options, group=False):
+        """Run writer and reader threads until the deadline and collect their numbers"""
+        deadline = time.monotonic() + options['duration']
+        lock = threading.Lock()
+        latencies = []
+        totals = {'checkouts': 0, 'lock_errors': 0, 'reads': 0}
+        checkout_writer = CheckoutWriter()
+
+        def writer(seed):
+            rng = random.Random(seed)
+            done = errors = 0
+            timings = []
+            try:
+                while time.monotonic() < deadline:
+                    cart = [{'product_id': product_id, 'quantity': 1}
+                            for product_id in rng.sample(product_ids, options['lines'])]
+                    started = time.perf_counter()
+                    try:
+                        process_checkout(cashier, cart)
+                    except OperationalError as e:
+                        if 'locked' not in str(e):
+                            raise
+                        errors += 1
+                        continue
+                    except CheckoutError:
+                        errors += 1
+                        continue
+                    timings.append(time.perf_counter() - started)
+                    done += 1
+            finally:
+                connections.close_all()
+            with lock:
+                totals['checkouts'] += done
+                totals['lock_errors'] += errors
+                latencies.extend(timings)
+
+        async def client(seed):
+            rng = random.Random(seed)
+            done = errors = 0
+            timings = []
+            while time.monotonic() < deadline:
+                cart = [{'product_id': product_id, 'quantity': 1}
+                        for product_id in rng.sample(product_ids, options['lines'])]
+                started = time.perf_counter()
+                try:
+                    await checkout_writer.checkout(cashier, cart)
+                except OperationalError as e:
+                    if 'locked' not in str(e):
+                        raise
+                    errors += 1
+                    continue
+                except CheckoutError:
+                    errors += 1
+                    continue
+                timings.append(time.perf_counter() - started)
+                done += 1
+            with lock:
+                totals['checkouts'] += done
+                totals['lock_errors'] += errors
+                latencies.extend(timings)
+
+        async def clients():
+            await asyncio.gather(*(client(i) for i in range(options['threads'])))
+
+        def reader():
+            reads = 0
+            try:
+                while time.monotonic() < deadline:
+                    list(Sale.objects.select_related('customer').order_by('-created_at', '-id')[:50])
+                    reads += 1
+            except OperationalError as e:
+                if 'locked' not in str(e):
+                    raise
+            finally:
+                connections.close_all()
+            with lock:
+                totals['reads'] += reads
+
+        if group:
+            # One event loop stands in for the ASGI server: every client
+            # awaits its own sale while the writer thread commits them.
+            threads = [threading.Thread(target=asyncio.run, args=(clients(),))]
+        else:
+            threads = [threading.Thread(target=writer, args=(i,)) for i in range(options['threads'])]
+        threads += [threading.Thread(target=reader) for _ in range(options['readers'])]
+        started = time.monotonic()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.monotonic() - started
+        checkout_writer.stop()
+
+        attempts = totals['checkouts'] + totals['lock_errors']
+        return {
+            **totals,
+            'throughput': totals['checkouts'] / elapsed,
+            'error_rate': 100 * totals['lock_errors'] / attempts if attempts else 0,
+            'p50_ms': percentile(latencies, 50) * 1000 if latencies else 0,
+            'p95_ms': percentile(latencies, 95) * 1000 if latencies else 0,
+            'sales_per_group': checkout_writer.sales / checkout_writer.groups if checkout_writer.groups else 0,
+        }
+
+    def show_result(self, result):
+        """Print the figures of one configuration"""
+        self.stdout.write(f'   • Checkouts: {result["checkouts"]} ({result["throughput"]:.1f}/s)')
+        self.stdout.write(f'   • Lock errors: {result["lock_errors"]} ({result["error_rate"]:.1f}%)')
+        self.stdout.write(f'   • Latency: p50 {result["p50_ms"]:.1f} ms, p95 {result["p95_ms"]:.1f} ms')
+        self.stdout.write(f'   • History reads: {result["reads"]}')
@@ -0,0 +1,128 @@
+"""Medicine details for the POS, with validators for conditional requests.
+
+A cart is re-validated in one round trip: ``product_details`` reads every
+product in it with one ``IN`` query and returns what checkout would charge
+and can sell now, the price of the batch sold first and the unexpired stock
+at this branch (see ``search.with_stock``). The ETag is a digest of exactly
+that, so a client repeating its request with ``If-None-Match`` gets a 304
+until a price or a stock figure in its cart changes. ``Last-Modified`` is
+the newest ``updated_at`` of the products and their batches: every write to
+a batch (sales, imports, edits) moves its timestamp, and a rename moves the
+product's.
+
+``details`` does the same for single batches, for the older per-batch
+endpoint.
+"""
+import hashlib
+import json
+
+from django.db.models import Max
+
+from .branches import branch_q
+from .models import Medicine, Product
+from .search import with_stock
+
+MEDICINE_DETAILS_MAX_IDS = 100
+MAX_ID = 2**63 - 1
+INVALID_IDS = 'ids must be comma-separated integers'
+
+
+def parse_ids(value):
+    """The ids in a comma-separated ``value``, without repeats; raises ``ValueError``."""
+    ids = []
+    for part in value.split(','):
+        part = part.strip()
+        if not part:
+            continue
+        try:
+            pk = int(part)
+        except ValueError:
+            raise ValueError(INVALID_IDS) from None
+        if not 0 < pk <= MAX_ID:
+            raise ValueError(INVALID_IDS)
+        if pk not in ids:
+            ids.append(pk)
+    if not ids:
+        raise ValueError('No ids given')
+    if len(ids) > MEDICINE_DETAILS_MAX_IDS:
+        raise ValueError(f'At most {MEDICINE_DETAILS_MAX_IDS} ids per request')
+    return ids
+
+
+def _etag(data):
+    payload = json.dumps(data, sort_keys=True, separators=(',', ':'))
+    return '"%s"' % hashlib.md5(payload.encode(), usedforsecurity=False).hexdigest()
+
+
+def product_data(product):
+    return {
+        'id': product.id,
+        'name': product.name,
+        'price': None if product.price is None else f'{product.price:.2f}',
+        'stock': product.stock,
+    }
+
+
+def product_details(ids):
+    """Look up the products ``ids``; returns ``(found, missing, etag, last_modified)``.
+
+    ``found`` maps id to ``product_data`` in the order of ``ids`` and
+    ``missing`` lists the ids with no product. A product with nothing to sell
+    is found with stock 0 and no price. ``last_modified`` is ``None`` when
+    nothing was found.
+    """
+    products = (
+        with_stock(Product.objects.filter(id__in=ids).only('name', 'updated_at'))
+        .annotate(batches_changed=Max('batches__updated_at', filter=branch_q('batches__')))
+        .in_bulk()
+    )
+    found = {}
+    missing = []
+    last_modified = None
+    for product_id in ids:
+        product = products.get(product_id)
+        if product is None:
+            missing.append(product_id)
+            continue
+        found[product_id] = product_data(product)
+        changed = max(filter(None, (product.updated_at, product.batches_changed)))
+        if last_modified is None or changed > last_modified:
+            last_modified = changed
+    return found, missing, _etag([found[pk] if pk in found else pk for pk in ids]), last_modified
+
+
+def medicine_data(medicine):
+    return {
+        'id': medicine.id,
+        'product_id': medicine.product_id,
+        'name': medicine.name,
+        'price': str(medicine.selling_price),
+        'stock': medicine.stock_quantity,
+    }
+
+
+def details(ids):
+    """Look up the batches ``ids``; returns ``(found, missing, etag, last_modified)``.
+
+    As ``product_details``, with ``medicine_data`` for each batch.
+    """
+    medicines = (
+        Medicine.objects.filter(id__in=ids)
+        .select_related('product')
+        .only('product_id', 'selling_price', 'stock_quantity', 'updated_at', 'product__name',
+              'product__updated_at')
+        .in_bulk()
+    )
+    found = {}
+    missing = []
+    last_modified = None
+    for medicine_id in ids:
+        medicine = medicines.get(medicine_id)
+        if medicine is None:
+            missing.append(medicine_id)
+            continue
+        found[medicine_id] = medicine_data(medicine)
+        changed = max(medicine.updated_at, medicine.product.updated_at)
+        if last_modified is None or changed > last_modified:
+            last_modified = changed
+    return found, missing, _etag([found[pk] if pk in found else pk for pk in ids]), last_modified
@@ -0,0 +1,169 @@
+"""In-process request metrics in the Prometheus text format.
+
+Each thread records into its own shard, so recording a request takes no
+lock; the registry lock is only taken when a thread records for the first
+time and when the shards are merged for a scrape. Shards of threads that
+have exited are folded into a retired shard, which keeps the number of
+shards bounded by the number of live threads.
+
+With several worker processes every process has its own registry and each
+scrape sees the process that served it.
+"""
+import threading
+from bisect import bisect_left
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576)
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100)
+
+UNRESOLVED_VIEW = '<unresolved>'
+
+
+class Histogram:
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def merge(self, other):
+        for i, count in enumerate(other.counts):
+            self.counts[i] += count
+        self.sum += other.sum
+        self.count += other.count
+
+
+class ViewStats:
+    __slots__ = ('latency', 'size', 'queries', 'sql_seconds', 'statuses')
+
+    def __init__(self):
+        self.latency = Histogram(LATENCY_BUCKETS)
+        self.size = Histogram(SIZE_BUCKETS)
+        self.queries = Histogram(QUERY_BUCKETS)
+        self.sql_seconds = 0.0
+        self.statuses = {}
+
+    def merge(self, other):
+        self.latency.merge(other.latency)
+        self.size.merge(other.size)
+        self.queries.merge(other.queries)
+        self.sql_seconds += other.sql_seconds
+        for status, count in list(other.statuses.items()):
+            self.statuses[status] = self.statuses.get(status, 0) + count
+
+
+def _merge_shard(target, shard):
+    for view, stats in list(shard.items()):
+        target.setdefault(view, ViewStats()).merge(stats)
+
+
+class MetricsRegistry:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._shards = []
+        self._retired = {}
+
+    def _shard(self):
+        try:
+            return self._local.shard
+        except AttributeError:
+            pass
+        shard = self._local.shard = {}
+        with self._lock:
+            self._retire_dead_shards()
+            self._shards.append((threading.current_thread(), shard))
+        return shard
+
+    def _retire_dead_shards(self):
+        live = []
+        for thread, shard in self._shards:
+            if thread.is_alive():
+                live.append((thread, shard))
+            else:
+                _merge_shard(self._retired, shard)
+        self._shards = live
+
+    def record(self, view, status, seconds, size, queries, sql_seconds):
+        shard = self._shard()
+        stats = shard.get(view)
+        if stats is None:
+            stats = shard[view] = ViewStats()
+        stats.latency.observe(seconds)
+        if size is not None:
+            stats.size.observe(size)
+        stats.queries.observe(queries)
+        stats.sql_seconds += sql_seconds
+        stats.statuses[status] = stats.statuses.get(status, 0) + 1
+
+    def collect(self):
+        """Return ``{view: ViewStats}`` merged over every thread."""
+        merged = {}
+        with self._lock:
+            self._retire_dead_shards()
+            _merge_shard(merged, self._retired)
+            for _, shard in self._shards:
+                _merge_shard(merged, shard)
+        return merged
+
+    def reset(self):
+        with self._lock:
+            for _, shard in self._shards:
+                shard.clear()
+            self._retired = {}
+
+
+registry = MetricsRegistry()
+
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _histogram_lines(name, view, histogram):
+    cumulative = 0
+    bounds = [repr(float(bound)) for bound in histogram.buckets] + ['+Inf']
+    for bound, count in zip(bounds, histogram.counts):
+        cumulative += count
+        yield f'{name}_bucket{{view="{view}",le="{bound}"}} {cumulative}'
+    yield f'{name}_sum{{view="{view}"}} {histogram.sum}'
+    yield f'{name}_count{{view="{view}"}} {histogram.count}'
+
+
+def render(stats=None):
+    """Render the collected metrics in the Prometheus text exposition format."""
+    stats = registry.collect() if stats is None else stats
+    views = sorted(stats)
+    lines = []
+
+    lines.append('# HELP pharmacy_http_requests_total Requests served, by view and status code.')
+    lines.append('# TYPE pharmacy_http_requests_total counter')
+    for view in views:
+        for status, count in sorted(stats[view].statuses.items()):
+            lines.append(f'pharmacy_http_requests_total{{view="{_label(view)}",status="{status}"}} {count}')
+
+    histograms = (
+        ('pharmacy_http_request_duration_seconds', 'Request latency in seconds, by view.', 'latency'),
+        ('pharmacy_http_response_size_bytes', 'Response body size in bytes, by view.', 'size'),
+        ('pharmacy_db_queries_per_request', 'SQL queries run per request, by view.', 'queries'),
+    )
+    for name, help_text, attribute in histograms:
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} histogram')
+        for view in views:
+            lines.extend(_histogram_lines(name, _label(view), getattr(stats[view], attribute)))
+
+    lines.append('# HELP pharmacy_db_query_duration_seconds_total Time spent in SQL, by view.')
+    lines.append('# TYPE pharmacy_db_query_duration_seconds_total counter')
+    for view in views:
+        lines.append(f'pharmacy_db_query_duration_seconds_total{{view="{_label(view)}"}} '
+                     f'{stats[view].sql_seconds}')
+    return '\n'.join(lines) + '\n'
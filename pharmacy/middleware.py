@@ -0,0 +1,67 @@
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+from .metrics import UNRESOLVED_VIEW, registry
+from .routers import DEFAULT_PIN_SECONDS, PIN_COOKIE
+
+
+class QueryTimer:
+    """``execute_wrapper`` that counts the queries of one request and times them."""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.seconds += time.perf_counter() - started
+            self.count += 1
+
+
+class MetricsMiddleware:
+    """Record latency, SQL and response size per URL name into ``metrics.registry``."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        timer = QueryTimer()
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(timer))
+            response = self.get_response(request)
+        elapsed = time.perf_counter() - started
+
+        match = request.resolver_match
+        registry.record(
+            match.view_name if match else UNRESOLVED_VIEW,
+            response.status_code,
+            elapsed,
+            None if response.streaming else len(response.content),
+            timer.count,
+            timer.seconds,
+        )
+        return response
+
+
+class PrimaryPinMiddleware:
+    """After a successful write request, pin the client's reads to the primary for a while."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if request.method not in ('GET', 'HEAD', 'OPTIONS') and response.status_code < 400:
+            response.set_cookie(
+                PIN_COOKIE, '1', httponly=True, samesite='Lax',
+                max_age=getattr(settings, 'PHARMACY_REPLICA_PIN_SECONDS', DEFAULT_PIN_SECONDS),
+            )
+        return response
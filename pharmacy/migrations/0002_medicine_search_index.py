@@ -0,0 +1,55 @@
+from django.db import migrations
+
+FTS_TABLE = 'pharmacy_medicine_fts'
+
+CREATE_INDEX = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS pharmacy_medicine_fts USING fts5("
+    "name, generic_name, manufacturer, content='pharmacy_medicine', content_rowid='id', "
+    "tokenize='unicode61 remove_diacritics 2', prefix='2 3')",
+    "CREATE TRIGGER IF NOT EXISTS pharmacy_medicine_fts_ai AFTER INSERT ON pharmacy_medicine BEGIN "
+    "INSERT INTO pharmacy_medicine_fts(rowid, name, generic_name, manufacturer) "
+    "VALUES (new.id, new.name, new.generic_name, new.manufacturer); END",
+    "CREATE TRIGGER IF NOT EXISTS pharmacy_medicine_fts_ad AFTER DELETE ON pharmacy_medicine BEGIN "
+    "INSERT INTO pharmacy_medicine_fts(pharmacy_medicine_fts, rowid, name, generic_name, manufacturer) "
+    "VALUES ('delete', old.id, old.name, old.generic_name, old.manufacturer); END",
+    "CREATE TRIGGER IF NOT EXISTS pharmacy_medicine_fts_au "
+    "AFTER UPDATE OF name, generic_name, manufacturer ON pharmacy_medicine BEGIN "
+    "INSERT INTO pharmacy_medicine_fts(pharmacy_medicine_fts, rowid, name, generic_name, manufacturer) "
+    "VALUES ('delete', old.id, old.name, old.generic_name, old.manufacturer); "
+    "INSERT INTO pharmacy_medicine_fts(rowid, name, generic_name, manufacturer) "
+    "VALUES (new.id, new.name, new.generic_name, new.manufacturer); END",
+    "INSERT INTO pharmacy_medicine_fts(pharmacy_medicine_fts) VALUES ('rebuild')",
+]
+
+DROP_INDEX = [
+    'DROP TRIGGER IF EXISTS pharmacy_medicine_fts_ai',
+    'DROP TRIGGER IF EXISTS pharmacy_medicine_fts_ad',
+    'DROP TRIGGER IF EXISTS pharmacy_medicine_fts_au',
+    'DROP TABLE IF EXISTS pharmacy_medicine_fts',
+]
+
+
+def create_search_index(apps, schema_editor):
+    # FTS5 is SQLite only; other backends use the icontains fallback search.
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for statement in CREATE_INDEX:
+        schema_editor.execute(statement)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for statement in DROP_INDEX:
+        schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pharmacy', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
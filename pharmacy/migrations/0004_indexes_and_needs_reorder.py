@@ -0,0 +1,54 @@
+# Generated by Django 5.2.18 on 2026-10-16 23:59
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def set_needs_reorder(apps, schema_editor):
+    Medicine = apps.get_model('pharmacy', 'Medicine')
+    Medicine.objects.update(needs_reorder=models.Case(
+        models.When(stock_quantity__lte=models.F('minimum_stock'), then=models.Value(True)),
+        default=models.Value(False),
+        output_field=models.BooleanField(),
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pharmacy', '0003_sale_created_id_idx'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='medicine',
+            name='needs_reorder',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+        migrations.RunPython(set_needs_reorder, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='medicine',
+            index=models.Index(fields=['name'], name='medicine_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='medicine',
+            index=models.Index(fields=['category', 'name'], name='medicine_category_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='medicine',
+            index=models.Index(fields=['expiry_date', 'needs_reorder'], name='medicine_expiry_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='medicine',
+            index=models.Index(condition=models.Q(('needs_reorder', True)), fields=['needs_reorder'], name='medicine_reorder_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='sale',
+            index=models.Index(fields=['cashier', 'created_at'], name='sale_cashier_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='sale',
+            index=models.Index(fields=['payment_method', 'created_at'], name='sale_payment_created_idx'),
+        ),
+    ]
@@ -0,0 +1,195 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+PRODUCT_FIELDS = ('name', 'generic_name', 'category', 'manufacturer')
+
+DROP_MEDICINE_INDEX = [
+    'DROP TRIGGER IF EXISTS pharmacy_medicine_fts_ai',
+    'DROP TRIGGER IF EXISTS pharmacy_medicine_fts_ad',
+    'DROP TRIGGER IF EXISTS pharmacy_medicine_fts_au',
+    'DROP TABLE IF EXISTS pharmacy_medicine_fts',
+]
+
+CREATE_PRODUCT_INDEX = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS pharmacy_product_fts USING fts5("
+    "name, generic_name, manufacturer, content='pharmacy_product', content_rowid='id', "
+    "tokenize='unicode61 remove_diacritics 2', prefix='2 3')",
+    "CREATE TRIGGER IF NOT EXISTS pharmacy_product_fts_ai AFTER INSERT ON pharmacy_product BEGIN "
+    "INSERT INTO pharmacy_product_fts(rowid, name, generic_name, manufacturer) "
+    "VALUES (new.id, new.name, new.generic_name, new.manufacturer); END",
+    "CREATE TRIGGER IF NOT EXISTS pharmacy_product_fts_ad AFTER DELETE ON pharmacy_product BEGIN "
+    "INSERT INTO pharmacy_product_fts(pharmacy_product_fts, rowid, name, generic_name, manufacturer) "
+    "VALUES ('delete', old.id, old.name, old.generic_name, old.manufacturer); END",
+    "CREATE TRIGGER IF NOT EXISTS pharmacy_product_fts_au "
+    "AFTER UPDATE OF name, generic_name, manufacturer ON pharmacy_product BEGIN "
+    "INSERT INTO pharmacy_product_fts(pharmacy_product_fts, rowid, name, generic_name, manufacturer) "
+    "VALUES ('delete', old.id, old.name, old.generic_name, old.manufacturer); "
+    "INSERT INTO pharmacy_product_fts(rowid, name, generic_name, manufacturer) "
+    "VALUES (new.id, new.name, new.generic_name, new.manufacturer); END",
+    "INSERT INTO pharmacy_product_fts(pharmacy_product_fts) VALUES ('rebuild')",
+]
+
+DROP_PRODUCT_INDEX = [
+    'DROP TRIGGER IF EXISTS pharmacy_product_fts_ai',
+    'DROP TRIGGER IF EXISTS pharmacy_product_fts_ad',
+    'DROP TRIGGER IF EXISTS pharmacy_product_fts_au',
+    'DROP TABLE IF EXISTS pharmacy_product_fts',
+]
+
+# The medicine index as 0002 created it, for unapplying this migration.
+CREATE_MEDICINE_INDEX = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS pharmacy_medicine_fts USING fts5("
+    "name, generic_name, manufacturer, content='pharmacy_medicine', content_rowid='id', "
+    "tokenize='unicode61 remove_diacritics 2', prefix='2 3')",
+    "CREATE TRIGGER IF NOT EXISTS pharmacy_medicine_fts_ai AFTER INSERT ON pharmacy_medicine BEGIN "
+    "INSERT INTO pharmacy_medicine_fts(rowid, name, generic_name, manufacturer) "
+    "VALUES (new.id, new.name, new.generic_name, new.manufacturer); END",
+    "CREATE TRIGGER IF NOT EXISTS pharmacy_medicine_fts_ad AFTER DELETE ON pharmacy_medicine BEGIN "
+    "INSERT INTO pharmacy_medicine_fts(pharmacy_medicine_fts, rowid, name, generic_name, manufacturer) "
+    "VALUES ('delete', old.id, old.name, old.generic_name, old.manufacturer); END",
+    "CREATE TRIGGER IF NOT EXISTS pharmacy_medicine_fts_au "
+    "AFTER UPDATE OF name, generic_name, manufacturer ON pharmacy_medicine BEGIN "
+    "INSERT INTO pharmacy_medicine_fts(pharmacy_medicine_fts, rowid, name, generic_name, manufacturer) "
+    "VALUES ('delete', old.id, old.name, old.generic_name, old.manufacturer); "
+    "INSERT INTO pharmacy_medicine_fts(rowid, name, generic_name, manufacturer) "
+    "VALUES (new.id, new.name, new.generic_name, new.manufacturer); END",
+    "INSERT INTO pharmacy_medicine_fts(pharmacy_medicine_fts) VALUES ('rebuild')",
+]
+
+
+def _run_sqlite(statements):
+    def run(apps, schema_editor):
+        # FTS5 is SQLite only; other backends use the icontains fallback search.
+        if schema_editor.connection.vendor != 'sqlite':
+            return
+        for statement in statements:
+            schema_editor.execute(statement)
+    return run
+
+
+def create_products(apps, schema_editor):
+    """One product per distinct name/generic/category/manufacturer; batches point at it."""
+    Medicine = apps.get_model('pharmacy', 'Medicine')
+    Product = apps.get_model('pharmacy', 'Product')
+
+    groups = (
+        Medicine.objects.order_by().values(*PRODUCT_FIELDS)
+        .annotate(description=models.Max('description'))
+    )
+    Product.objects.bulk_create(
+        (Product(**group) for group in groups.iterator()), batch_size=1000,
+    )
+    Medicine.objects.update(product=models.Subquery(
+        Product.objects.filter(**{field: models.OuterRef(field) for field in PRODUCT_FIELDS})
+        .order_by('pk').values('pk')[:1]
+    ))
+
+
+def copy_product_details(apps, schema_editor):
+    Medicine = apps.get_model('pharmacy', 'Medicine')
+    Product = apps.get_model('pharmacy', 'Product')
+    Medicine.objects.update(**{
+        field: models.Subquery(Product.objects.filter(pk=models.OuterRef('product')).values(field)[:1])
+        for field in PRODUCT_FIELDS + ('description',)
+    })
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pharmacy', '0004_indexes_and_needs_reorder'),
+    ]
+
+    operations = [
+        migrations.RunPython(_run_sqlite(DROP_MEDICINE_INDEX), _run_sqlite(CREATE_MEDICINE_INDEX)),
+        migrations.CreateModel(
+            name='Product',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=200)),
+                ('generic_name', models.CharField(blank=True, max_length=200)),
+                ('category', models.CharField(choices=[('tablet', 'Tablet'), ('syrup', 'Syrup'), ('injection', 'Injection'), ('capsule', 'Capsule'), ('cream', 'Cream'), ('drops', 'Drops'), ('other', 'Other')], max_length=20)),
+                ('manufacturer', models.CharField(max_length=100)),
+                ('description', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'indexes': [
+                    models.Index(fields=['name'], name='product_name_idx'),
+                    models.Index(fields=['category', 'name'], name='product_category_name_idx'),
+                ],
+            },
+        ),
+        migrations.AddField(
+            model_name='medicine',
+            name='product',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='batches', to='pharmacy.product'),
+        ),
+        migrations.RunPython(create_products, copy_product_details),
+        migrations.AlterField(
+            model_name='medicine',
+            name='product',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='batches', to='pharmacy.product'),
+        ),
+        # Defaults only so that unapplying can re-add the columns before
+        # copy_product_details fills them in.
+        migrations.AlterField(
+            model_name='medicine',
+            name='name',
+            field=models.CharField(default='', max_length=200),
+        ),
+        migrations.AlterField(
+            model_name='medicine',
+            name='generic_name',
+            field=models.CharField(blank=True, default='', max_length=200),
+        ),
+        migrations.AlterField(
+            model_name='medicine',
+            name='category',
+            field=models.CharField(choices=[('tablet', 'Tablet'), ('syrup', 'Syrup'), ('injection', 'Injection'), ('capsule', 'Capsule'), ('cream', 'Cream'), ('drops', 'Drops'), ('other', 'Other')], default='other', max_length=20),
+        ),
+        migrations.AlterField(
+            model_name='medicine',
+            name='manufacturer',
+            field=models.CharField(default='', max_length=100),
+        ),
+        migrations.AlterField(
+            model_name='medicine',
+            name='description',
+            field=models.TextField(blank=True, default=''),
+        ),
+        migrations.RemoveIndex(
+            model_name='medicine',
+            name='medicine_name_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='medicine',
+            name='medicine_category_name_idx',
+        ),
+        migrations.RemoveField(
+            model_name='medicine',
+            name='name',
+        ),
+        migrations.RemoveField(
+            model_name='medicine',
+            name='generic_name',
+        ),
+        migrations.RemoveField(
+            model_name='medicine',
+            name='category',
+        ),
+        migrations.RemoveField(
+            model_name='medicine',
+            name='manufacturer',
+        ),
+        migrations.RemoveField(
+            model_name='medicine',
+            name='description',
+        ),
+        migrations.AddIndex(
+            model_name='medicine',
+            index=models.Index(fields=['product', 'expiry_date'], name='medicine_product_expiry_idx'),
+        ),
+        migrations.RunPython(_run_sqlite(CREATE_PRODUCT_INDEX), _run_sqlite(DROP_PRODUCT_INDEX)),
+    ]
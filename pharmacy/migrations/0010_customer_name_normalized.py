@@ -0,0 +1,44 @@
+# Generated by Django 5.2.18 on 2026-10-17 01:06
+
+import unicodedata
+
+from django.db import migrations, models
+
+
+def _normalize_name(value):
+    # A copy of pharmacy.models.normalize_name as of this migration.
+    value = unicodedata.normalize('NFKD', value)
+    value = ''.join(c for c in value if not unicodedata.combining(c))
+    return ' '.join(value.casefold().split())[:200]
+
+
+def normalize_names(apps, schema_editor):
+    Customer = apps.get_model('pharmacy', 'Customer')
+    batch = []
+    for customer in Customer.objects.only('id', 'name').iterator(chunk_size=2000):
+        customer.name_normalized = _normalize_name(customer.name)
+        batch.append(customer)
+        if len(batch) >= 2000:
+            Customer.objects.bulk_update(batch, ['name_normalized'])
+            batch = []
+    Customer.objects.bulk_update(batch, ['name_normalized'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pharmacy', '0009_import_jobs'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customer',
+            name='name_normalized',
+            field=models.CharField(default='', editable=False, max_length=200),
+        ),
+        migrations.RunPython(normalize_names, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='customer',
+            index=models.Index(fields=['name_normalized'], name='customer_name_norm_idx'),
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.2.18 on 2026-10-17 01:10
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pharmacy', '0010_customer_name_normalized'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='saleitem',
+            name='discount_amount',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=10),
+        ),
+        migrations.CreateModel(
+            name='Promotion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100)),
+                ('kind', models.CharField(choices=[('percent', 'Percentage off'), ('buy_get', 'Buy N, get M free')], default='percent', max_length=20)),
+                ('category', models.CharField(blank=True, choices=[('tablet', 'Tablet'), ('syrup', 'Syrup'), ('injection', 'Injection'), ('capsule', 'Capsule'), ('cream', 'Cream'), ('drops', 'Drops'), ('other', 'Other')], max_length=20)),
+                ('manufacturer', models.CharField(blank=True, max_length=100)),
+                ('percent', models.DecimalField(decimal_places=2, default=0, max_digits=5)),
+                ('buy_quantity', models.PositiveIntegerField(default=0)),
+                ('free_quantity', models.PositiveIntegerField(default=0)),
+                ('starts_on', models.DateField(blank=True, null=True)),
+                ('ends_on', models.DateField(blank=True, null=True)),
+                ('is_active', models.BooleanField(default=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('product', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='pharmacy.product')),
+                ('supplier', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='pharmacy.supplier')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='saleitem',
+            name='promotion',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='sale_items', to='pharmacy.promotion'),
+        ),
+    ]
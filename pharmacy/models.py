@@ -1,7 +1,9 @@
 from django.db import models
 from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
 from django.utils import timezone
 from decimal import Decimal
+import unicodedata
 
 class Supplier(models.Model):
     name = models.CharField(max_length=100)
@@ -10,11 +12,28 @@ class Supplier(models.Model):
     email = models.EmailField(blank=True)
     address = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return self.name
 
-class Medicine(models.Model):
+class Branch(models.Model):
+    """A branch of the pharmacy, see ``branches``.
+
+    Sales and batches without a branch belong to the main pharmacy.
+    """
+    code = models.SlugField(max_length=20, unique=True)
+    name = models.CharField(max_length=100)
+    address = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return self.name
+
+class Product(models.Model):
+    """What is sold: one row per medicine, however many batches of it are stocked."""
+
     CATEGORY_CHOICES = [
         ('tablet', 'Tablet'),
         ('syrup', 'Syrup'),
@@ -29,20 +48,86 @@ class Medicine(models.Model):
     generic_name = models.CharField(max_length=200, blank=True)
     category = models.CharField(max_length=20, choices=CATEGORY_CHOICES)
     manufacturer = models.CharField(max_length=100)
+    description = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['name'], name='product_name_idx'),
+            models.Index(fields=['category', 'name'], name='product_category_name_idx'),
+            # The POS catalog sync asks for what changed since a timestamp.
+            models.Index(fields=['updated_at'], name='product_updated_idx'),
+        ]
+
+    def __str__(self):
+        return self.name
+
+class Medicine(models.Model):
+    """One batch (lot) of a product, with its own expiry, prices and stock."""
+
+    CATEGORY_CHOICES = Product.CATEGORY_CHOICES
+
+    product = models.ForeignKey(Product, related_name='batches', on_delete=models.CASCADE)
     supplier = models.ForeignKey(Supplier, on_delete=models.CASCADE)
+    branch = models.ForeignKey(Branch, related_name='batches', on_delete=models.PROTECT, null=True, blank=True)
     batch_number = models.CharField(max_length=50)
     expiry_date = models.DateField()
     purchase_price = models.DecimalField(max_digits=10, decimal_places=2)
     selling_price = models.DecimalField(max_digits=10, decimal_places=2)
     stock_quantity = models.IntegerField()
     minimum_stock = models.IntegerField(default=10)
-    description = models.TextField(blank=True)
+    # Denormalized ``stock_quantity <= minimum_stock`` so low stock lookups
+    # can use an index; kept in step by every write that touches stock.
+    needs_reorder = models.BooleanField(default=False, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            # Checkout picks batches first-expiry-first-out per product.
+            models.Index(fields=['product', 'expiry_date'], name='medicine_product_expiry_idx'),
+            models.Index(fields=['expiry_date', 'needs_reorder'], name='medicine_expiry_idx'),
+            models.Index(fields=['needs_reorder'], condition=models.Q(needs_reorder=True),
+                         name='medicine_reorder_idx'),
+            models.Index(fields=['updated_at'], name='medicine_updated_idx'),
+        ]
+
     def __str__(self):
         return f"{self.name} - {self.batch_number}"
 
+    def save(self, *args, **kwargs):
+        self.needs_reorder = self.stock_quantity <= self.minimum_stock
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'stock_quantity' in update_fields:
+            kwargs['update_fields'] = set(update_fields) | {'needs_reorder', 'updated_at'}
+        super().save(*args, **kwargs)
+
+    # The product's details, for templates and code written against the
+    # old single-table medicine. Load batches with select_related('product').
+    @property
+    def name(self):
+        return self.product.name
+
+    @property
+    def generic_name(self):
+        return self.product.generic_name
+
+    @property
+    def category(self):
+        return self.product.category
+
+    def get_category_display(self):
+        return self.product.get_category_display()
+
+    @property
+    def manufacturer(self):
+        return self.product.manufacturer
+
+    @property
+    def description(self):
+        return self.product.description
+
     @property
     def is_low_stock(self):
         return self.stock_quantity <= self.minimum_stock
@@ -51,19 +136,172 @@ class Medicine(models.Model):
     def is_expired(self):
         return self.expiry_date < timezone.now().date()
 
+class CatalogTombstone(models.Model):
+    """Records a deleted product or batch, so catalog sync can tell terminals.
+
+    ``batch_id`` is empty when the product itself was deleted.
+    """
+    product_id = models.BigIntegerField()
+    batch_id = models.BigIntegerField(null=True, blank=True)
+    deleted_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['deleted_at'], name='tombstone_deleted_idx'),
+        ]
+
+    def __str__(self):
+        return f"Product {self.product_id} batch {self.batch_id or '-'} deleted {self.deleted_at}"
+
+class StockAlert(models.Model):
+    """A low stock or expiry alert on one batch, open until ``resolved_at`` is set.
+
+    Opened and resolved by ``alerts.scan``; a batch has at most one open
+    alert of each kind.
+    """
+    LOW_STOCK = 'low_stock'
+    EXPIRING = 'expiring'
+    EXPIRED = 'expired'
+    KIND_CHOICES = [
+        (LOW_STOCK, 'Low stock'),
+        (EXPIRING, 'Expiring soon'),
+        (EXPIRED, 'Expired'),
+    ]
+
+    medicine = models.ForeignKey(Medicine, related_name='alerts', on_delete=models.CASCADE)
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    opened_at = models.DateTimeField(default=timezone.now)
+    resolved_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['medicine', 'kind'], condition=models.Q(resolved_at__isnull=True),
+                                    name='open_alert_key'),
+        ]
+        indexes = [
+            models.Index(fields=['kind'], condition=models.Q(resolved_at__isnull=True),
+                         name='open_alert_kind_idx'),
+            models.Index(fields=['resolved_at'], name='alert_resolved_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.get_kind_display()}: {self.medicine_id}"
+
+class AlertScan(models.Model):
+    """One run of the alert engine; the latest one is where the next starts."""
+    started_at = models.DateTimeField()
+    # The local date whose expiry horizon the run applied.
+    day = models.DateField()
+    checked = models.IntegerField(default=0)
+    opened = models.IntegerField(default=0)
+    resolved = models.IntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['started_at'], name='alert_scan_started_idx'),
+        ]
+
+    def __str__(self):
+        return f"Alert scan {self.started_at}: {self.opened} opened, {self.resolved} resolved"
+
+def reorder_after_sale(sold=0):
+    """``needs_reorder`` for a stock ``UPDATE`` that sells ``sold`` units.
+
+    ``sold`` is a quantity, or maps batch ids to the quantity sold of each
+    when the ``UPDATE`` covers several batches; ``0`` gives the flag for the
+    stock as it stands. The right-hand side of an ``UPDATE`` sees the row
+    before the change, so the new stock is ``stock_quantity - quantity``.
+    """
+    if isinstance(sold, dict):
+        batches = [(models.Q(pk=pk), quantity) for pk, quantity in sold.items()]
+    else:
+        batches = [(models.Q(), sold)]
+    return models.Case(
+        *[models.When(batch, stock_quantity__lte=models.F('minimum_stock') + quantity, then=models.Value(True))
+          for batch, quantity in batches],
+        default=models.Value(False),
+        output_field=models.BooleanField(),
+    )
+
+def normalize_name(value):
+    """Case-folded, accent-free, single-spaced form of a name, for lookups."""
+    value = unicodedata.normalize('NFKD', value)
+    value = ''.join(c for c in value if not unicodedata.combining(c))
+    return ' '.join(value.casefold().split())[:200]
+
 class Customer(models.Model):
     name = models.CharField(max_length=100)
+    # normalize_name(name), kept by save(); prefix lookups range-scan its index.
+    name_normalized = models.CharField(max_length=200, editable=False, default='')
     phone = models.CharField(max_length=15, unique=True)
     email = models.EmailField(blank=True)
     address = models.TextField(blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['name_normalized'], name='customer_name_norm_idx'),
+            models.Index(fields=['updated_at'], name='customer_updated_idx'),
+        ]
 
     def __str__(self):
         return f"{self.name} - {self.phone}"
 
+    def save(self, *args, **kwargs):
+        self.name_normalized = normalize_name(self.name)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'name' in update_fields:
+            kwargs['update_fields'] = set(update_fields) | {'name_normalized'}
+        super().save(*args, **kwargs)
+
+class Promotion(models.Model):
+    """A discount checkout applies by itself, see ``promotions.price``.
+
+    It targets exactly one of a product, a category, a manufacturer or the
+    supplier of the batch sold, and takes either a percentage off the line
+    or ``free_quantity`` units free for every ``buy_quantity`` bought.
+    """
+    PERCENT = 'percent'
+    BUY_GET = 'buy_get'
+    KIND_CHOICES = [
+        (PERCENT, 'Percentage off'),
+        (BUY_GET, 'Buy N, get M free'),
+    ]
+
+    name = models.CharField(max_length=100)
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES, default=PERCENT)
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, null=True, blank=True)
+    category = models.CharField(max_length=20, choices=Product.CATEGORY_CHOICES, blank=True)
+    manufacturer = models.CharField(max_length=100, blank=True)
+    supplier = models.ForeignKey(Supplier, on_delete=models.CASCADE, null=True, blank=True)
+    percent = models.DecimalField(max_digits=5, decimal_places=2, default=0)
+    buy_quantity = models.PositiveIntegerField(default=0)
+    free_quantity = models.PositiveIntegerField(default=0)
+    starts_on = models.DateField(null=True, blank=True)
+    ends_on = models.DateField(null=True, blank=True)
+    is_active = models.BooleanField(default=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return self.name
+
+    def clean(self):
+        targets = [self.product_id, self.category, self.manufacturer.strip(), self.supplier_id]
+        if sum(1 for target in targets if target) != 1:
+            raise ValidationError('Pick exactly one of product, category, manufacturer or supplier.')
+        if self.kind == self.PERCENT and not 0 < self.percent <= 100:
+            raise ValidationError({'percent': 'Enter a percentage between 0 and 100.'})
+        if self.kind == self.BUY_GET and (self.buy_quantity < 1 or self.free_quantity < 1):
+            raise ValidationError('Buy and free quantities must both be at least 1.')
+        if self.starts_on and self.ends_on and self.starts_on > self.ends_on:
+            raise ValidationError({'ends_on': 'The promotion ends before it starts.'})
+
 class Sale(models.Model):
     customer = models.ForeignKey(Customer, on_delete=models.CASCADE, null=True, blank=True)
     cashier = models.ForeignKey(User, on_delete=models.CASCADE)
+    branch = models.ForeignKey(Branch, related_name='sales', on_delete=models.PROTECT, null=True, blank=True)
     total_amount = models.DecimalField(max_digits=10, decimal_places=2)
     discount = models.DecimalField(max_digits=5, decimal_places=2, default=0)
     tax = models.DecimalField(max_digits=5, decimal_places=2, default=0)
@@ -74,6 +312,16 @@ class Sale(models.Model):
         ('digital', 'Digital Payment'),
     ], default='cash')
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at', 'id'], name='sale_created_id_idx'),
+            models.Index(fields=['updated_at'], name='sale_updated_idx'),
+            models.Index(fields=['cashier', 'created_at'], name='sale_cashier_created_idx'),
+            models.Index(fields=['payment_method', 'created_at'], name='sale_payment_created_idx'),
+            models.Index(fields=['branch', 'created_at'], name='sale_branch_created_idx'),
+        ]
 
     def __str__(self):
         return f"Sale #{self.id} - {self.created_at.strftime('%Y-%m-%d %H:%M')}"
@@ -83,14 +331,100 @@ class SaleItem(models.Model):
     medicine = models.ForeignKey(Medicine, on_delete=models.CASCADE)
     quantity = models.IntegerField()
     unit_price = models.DecimalField(max_digits=10, decimal_places=2)
+    # The promotion checkout applied to the line and what it took off;
+    # total_price is net of it.
+    promotion = models.ForeignKey(Promotion, related_name='sale_items', on_delete=models.SET_NULL,
+                                  null=True, blank=True)
+    discount_amount = models.DecimalField(max_digits=10, decimal_places=2, default=0)
     total_price = models.DecimalField(max_digits=10, decimal_places=2)
 
     def save(self, *args, **kwargs):
-        self.total_price = self.quantity * self.unit_price
+        self.total_price = self.quantity * self.unit_price - self.discount_amount
         super().save(*args, **kwargs)
         # Update medicine stock
+        Medicine.objects.filter(pk=self.medicine_id).update(
+            stock_quantity=models.F('stock_quantity') - self.quantity,
+            needs_reorder=reorder_after_sale(self.quantity),
+            updated_at=timezone.now(),
+        )
         self.medicine.stock_quantity -= self.quantity
-        self.medicine.save()
 
     def __str__(self):
-        return f"{self.medicine.name} x {self.quantity}"
\ No newline at end of file
+        return f"{self.medicine.name} x {self.quantity}"
+
+class DailyMedicineSales(models.Model):
+    """Units, line revenue and cost of one batch sold on one local day.
+
+    Revenue is the line total before the sale's discount and tax; cost is
+    the batch's purchase price. Kept up to date by ``rollups.add_sales``.
+    """
+    date = models.DateField()
+    medicine = models.ForeignKey(Medicine, on_delete=models.CASCADE)
+    quantity = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    cost = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['date', 'medicine'], name='daily_medicine_sales_key'),
+        ]
+
+    def __str__(self):
+        return f"{self.date} {self.medicine_id}: {self.quantity}"
+
+class DailyCashierSales(models.Model):
+    """Sales taken by one cashier with one payment method on one local day.
+
+    Revenue is what was charged, after discount and tax.
+    """
+    date = models.DateField()
+    cashier = models.ForeignKey(User, on_delete=models.CASCADE)
+    payment_method = models.CharField(max_length=20)
+    sale_count = models.IntegerField(default=0)
+    quantity = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    cost = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['date', 'cashier', 'payment_method'],
+                                    name='daily_cashier_sales_key'),
+        ]
+
+    def __str__(self):
+        return f"{self.date} {self.cashier_id} {self.payment_method}: {self.sale_count}"
+
+class ImportJob(models.Model):
+    """A stock receipt or price list CSV being imported, see ``imports.run_import``.
+
+    ``lines_done`` counts the data lines committed so far; a failed job
+    resumes after them.
+    """
+    PENDING = 'pending'
+    RUNNING = 'running'
+    FAILED = 'failed'
+    DONE = 'done'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (RUNNING, 'Running'),
+        (FAILED, 'Failed'),
+        (DONE, 'Done'),
+    ]
+
+    path = models.CharField(max_length=500)
+    original_name = models.CharField(max_length=255, blank=True)
+    supplier = models.ForeignKey(Supplier, on_delete=models.SET_NULL, null=True, blank=True)
+    created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=PENDING)
+    lines_done = models.IntegerField(default=0)
+    created = models.IntegerField(default=0)
+    updated = models.IntegerField(default=0)
+    skipped = models.IntegerField(default=0)
+    # The first rejected lines, as {'line', 'error'} dicts.
+    line_errors = models.JSONField(default=list, blank=True)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Import #{self.id} {self.original_name or self.path} ({self.status})"
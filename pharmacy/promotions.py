@@ -0,0 +1,143 @@
+"""Promotions applied at checkout.
+
+The promotions running today are compiled once into an in-memory index
+keyed by what they target: ``('product', id)``, ``('category', slug)``,
+``('manufacturer', name)`` and ``('supplier', id)``. Pricing a cart then
+looks up the keys of each batch sold and does arithmetic. Each checkout
+first reads the version of the promotions table, its row count and newest
+``updated_at``, in one aggregate query; the index is rebuilt with one more
+query when that moves (a promotion saved, added or deleted, by any process)
+or when the day changes. A process never prices with a promotion that has
+since changed or been deleted.
+
+A product line gets at most one promotion, the one taking the most off
+the units of it in the cart; promotions do not stack. The cashier's
+percentage discount on the whole sale still applies on top.
+"""
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.db.models import Count, Max, Q
+from django.utils import timezone
+
+from .cache import LRUCache
+from .models import Promotion
+
+ZERO = Decimal('0')
+CENT = Decimal('0.01')
+
+# One entry per day and version: a promotion starting or ending at midnight
+# takes effect without a save.
+index_cache = LRUCache(maxsize=1)
+
+
+def _manufacturer_key(name):
+    return ' '.join(name.casefold().split())
+
+
+def _target(promotion):
+    if promotion.product_id:
+        return ('product', promotion.product_id)
+    if promotion.category:
+        return ('category', promotion.category)
+    if promotion.manufacturer.strip():
+        return ('manufacturer', _manufacturer_key(promotion.manufacturer))
+    if promotion.supplier_id:
+        return ('supplier', promotion.supplier_id)
+    return None
+
+
+def _batch_keys(batch):
+    product = batch.product
+    return (
+        ('product', batch.product_id),
+        ('category', product.category),
+        ('manufacturer', _manufacturer_key(product.manufacturer)),
+        ('supplier', batch.supplier_id),
+    )
+
+
+def compile_index(day=None):
+    """Map each target key to the promotions running on ``day`` (default today)."""
+    day = day or timezone.localdate()
+    running = Promotion.objects.filter(
+        Q(starts_on__isnull=True) | Q(starts_on__lte=day),
+        Q(ends_on__isnull=True) | Q(ends_on__gte=day),
+        is_active=True,
+    ).order_by('id')
+    index = {}
+    for promotion in running:
+        target = _target(promotion)
+        if target is not None:
+            index.setdefault(target, []).append(promotion)
+    return index
+
+
+def version():
+    """What changes whenever a promotion is saved, added or deleted."""
+    return tuple(Promotion.objects.aggregate(count=Count('id'), changed=Max('updated_at')).values())
+
+
+def active_index():
+    """Today's promotion index, compiled on first use after a change."""
+    key = (timezone.localdate(), *version())
+    index = index_cache.get(key)
+    if index is None:
+        index = compile_index(key[0])
+        index_cache.set(key, index)
+    return index
+
+
+def _cents(value):
+    return value.quantize(CENT, rounding=ROUND_HALF_UP)
+
+
+def _discounts(promotion, lines):
+    """Discount per allocation position for the ``(position, batch, quantity)`` lines."""
+    if promotion.kind == Promotion.BUY_GET:
+        group = promotion.buy_quantity + promotion.free_quantity
+        units = sum(quantity for _, _, quantity in lines)
+        free = units // group * promotion.free_quantity
+        discounts = {}
+        # The free units are the cheapest ones in the cart.
+        for position, batch, quantity in sorted(lines, key=lambda line: line[1].selling_price):
+            if not free:
+                break
+            taken = min(free, quantity)
+            discounts[position] = batch.selling_price * taken
+            free -= taken
+        return discounts
+    return {
+        position: _cents(batch.selling_price * quantity * promotion.percent / 100)
+        for position, batch, quantity in lines
+    }
+
+
+def price(allocations, index):
+    """The ``(promotion, discount)`` of each ``(batch, quantity)`` in one cart.
+
+    ``allocations`` are a cart's lines as ``checkout.allocate`` returns them,
+    batches with their product loaded; ``index`` comes from
+    ``active_index``. Lines without a promotion get ``(None, 0)``.
+    """
+    pricing = [(None, ZERO)] * len(allocations)
+    if not index:
+        return pricing
+
+    candidates = {}
+    for position, (batch, quantity) in enumerate(allocations):
+        for key in _batch_keys(batch):
+            for promotion in index.get(key, ()):
+                lines = candidates.setdefault(batch.product_id, {}).setdefault(promotion, [])
+                lines.append((position, batch, quantity))
+
+    for promotions in candidates.values():
+        best, best_total, best_discounts = None, ZERO, None
+        for promotion, lines in promotions.items():
+            discounts = _discounts(promotion, lines)
+            total = sum(discounts.values(), ZERO)
+            if total > best_total or (total == best_total and best and promotion.pk < best.pk):
+                best, best_total, best_discounts = promotion, total, discounts
+        if best is not None:
+            for position, discount in best_discounts.items():
+                pricing[position] = (best, discount)
+    return pricing
@@ -0,0 +1,164 @@
+"""Rendered receipts, cached by sale id.
+
+A completed sale does not change, so its receipt is rendered once and then
+served from memory, or from a size-bounded directory of rendered files
+that survives restarts and is shared by every worker process. Reprints do
+not touch the ORM at all. Checkout warms the cache from the objects it
+already holds, and the rare admin edit of a sale drops its receipt.
+"""
+import os
+import tempfile
+import threading
+
+from django.conf import settings
+from django.db.models import Prefetch
+from django.http import Http404
+from django.template.loader import render_to_string
+
+from .cache import LRUCache
+from .models import Sale, SaleItem
+
+RECEIPT_TEMPLATE = 'pharmacy/receipt.html'
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+# Eviction trims the directory to this fraction of the limit, so it does
+# not run again on the very next write.
+EVICT_TO = 0.9
+
+
+class ReceiptCache:
+    """Two-tier cache of rendered receipts: an in-process LRU over a directory."""
+
+    def __init__(self, directory=None, max_bytes=None, memory_size=512):
+        self._directory = directory
+        self._max_bytes = max_bytes
+        self.memory = LRUCache(maxsize=memory_size, generation_key='pharmacy:receipts:generation')
+        self._lock = threading.Lock()
+        self._disk_bytes = None
+
+    @property
+    def directory(self):
+        if self._directory is not None:
+            return str(self._directory)
+        return str(getattr(settings, 'RECEIPT_CACHE_DIR', os.path.join(settings.BASE_DIR, 'receipt_cache')))
+
+    @property
+    def max_bytes(self):
+        if self._max_bytes is not None:
+            return self._max_bytes
+        return getattr(settings, 'RECEIPT_CACHE_MAX_BYTES', DEFAULT_MAX_BYTES)
+
+    def _path(self, sale_id):
+        return os.path.join(self.directory, f'{int(sale_id)}.html')
+
+    def get(self, sale_id):
+        html = self.memory.get(sale_id)
+        if html is not None:
+            return html
+        try:
+            with open(self._path(sale_id), encoding='utf-8') as f:
+                html = f.read()
+        except OSError:
+            return None
+        self.memory.set(sale_id, html)
+        return html
+
+    def set(self, sale_id, html):
+        self.memory.set(sale_id, html)
+        if self.max_bytes <= 0:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        # Write to a temporary file and rename it into place so a reader in
+        # another process never sees half a receipt.
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(html)
+        os.replace(tmp_path, self._path(sale_id))
+
+        with self._lock:
+            if self._disk_bytes is None:
+                self._disk_bytes = self._scan_size()
+            else:
+                self._disk_bytes += len(html.encode('utf-8'))
+            if self._disk_bytes > self.max_bytes:
+                self._evict()
+
+    def delete(self, sale_id):
+        try:
+            os.remove(self._path(sale_id))
+        except OSError:
+            pass
+        self.memory.invalidate()
+
+    def clear(self):
+        for entry in self._entries():
+            try:
+                os.remove(entry.path)
+            except OSError:
+                pass
+        self.memory.invalidate()
+        with self._lock:
+            self._disk_bytes = None
+
+    def _entries(self):
+        try:
+            return [entry for entry in os.scandir(self.directory) if entry.name.endswith('.html')]
+        except OSError:
+            return []
+
+    def _scan_size(self):
+        return sum(entry.stat().st_size for entry in self._entries())
+
+    def _evict(self):
+        """Delete the least recently written receipts until under the size limit."""
+        entries = []
+        for entry in self._entries():
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+        entries.sort()
+        total = sum(size for _, size, _ in entries)
+        target = self.max_bytes * EVICT_TO
+        for _, size, path in entries:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+        self._disk_bytes = total
+
+
+receipt_cache = ReceiptCache()
+
+
+def render_receipt(sale, items):
+    return render_to_string(RECEIPT_TEMPLATE, {'sale': sale, 'items': items})
+
+
+def warm_receipt(sale, items):
+    """Render and cache the receipt of a sale checkout just created.
+
+    ``items`` must have their medicine, its product and their promotion
+    loaded; nothing is queried.
+    """
+    receipt_cache.set(sale.pk, render_receipt(sale, items))
+
+
+def receipt_html(sale_id):
+    """The rendered receipt for ``sale_id``; raises ``Http404`` if there is no such sale."""
+    html = receipt_cache.get(sale_id)
+    if html is not None:
+        return html
+    sale = (
+        Sale.objects.select_related('customer', 'cashier')
+        .prefetch_related(Prefetch('items', queryset=SaleItem.objects.select_related('medicine__product', 'promotion')))
+        .filter(pk=sale_id).first()
+    )
+    if sale is None:
+        raise Http404('No sale matches the given query.')
+    html = render_receipt(sale, sale.items.all())
+    receipt_cache.set(sale_id, html)
+    return html
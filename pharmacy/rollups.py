@@ -0,0 +1,217 @@
+"""Daily sales rollups for reports.
+
+Two tables hold per-day totals: ``DailyMedicineSales`` keyed by
+``(date, medicine)`` and ``DailyCashierSales`` keyed by
+``(date, cashier, payment_method)``. A new sale adds to them in the same
+transaction that writes it, with one upsert per table, so a report reads a
+row per day and key instead of every sale item in the range.
+
+Only new sales are folded in. After editing or deleting recorded sales, or
+loading them behind the ORM's back, run ``rebuild_rollups`` for the days
+concerned.
+"""
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import connection, transaction
+from django.db.models import Count, DecimalField, F, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import DailyCashierSales, DailyMedicineSales, Product, Sale, SaleItem
+from .stats import day_range
+
+MEDICINE_KEY = ('date', 'medicine_id')
+MEDICINE_TOTALS = ('quantity', 'revenue', 'cost')
+CASHIER_KEY = ('date', 'cashier_id', 'payment_method')
+CASHIER_TOTALS = ('sale_count', 'quantity', 'revenue', 'cost')
+
+REBUILD_BATCH_SIZE = 1000
+TOP_PRODUCTS = 20
+
+ZERO = Decimal('0')
+MONEY = DecimalField(max_digits=14, decimal_places=2)
+
+
+def _add_sql(model, key, totals, conn):
+    """``INSERT`` one row, or add its totals to the row already holding the key."""
+    ops = conn.ops
+    table = ops.quote_name(model._meta.db_table)
+    key_columns = [ops.quote_name(model._meta.get_field(name).column) for name in key]
+    total_columns = [ops.quote_name(model._meta.get_field(name).column) for name in totals]
+    if conn.features.supports_update_conflicts_with_target:
+        updates = ', '.join(f'{c} = {table}.{c} + EXCLUDED.{c}' for c in total_columns)
+        suffix = f'ON CONFLICT({", ".join(key_columns)}) DO UPDATE SET {updates}'
+    else:
+        # MySQL and MariaDB match on any unique key.
+        updates = ', '.join(f'{c} = {c} + VALUES({c})' for c in total_columns)
+        suffix = f'ON DUPLICATE KEY UPDATE {updates}'
+    columns = key_columns + total_columns
+    return (
+        f'INSERT INTO {table} ({", ".join(columns)}) '
+        f'VALUES ({", ".join(["%s"] * len(columns))}) {suffix}'
+    )
+
+
+def _add(model, key, totals, rows):
+    if not rows:
+        return
+    fields = [model._meta.get_field(name) for name in key + totals]
+    params = [
+        [field.get_db_prep_save(value, connection) for field, value in zip(fields, row_key + tuple(values))]
+        for row_key, values in rows.items()
+    ]
+    with connection.cursor() as cursor:
+        cursor.executemany(_add_sql(model, key, totals, connection), params)
+
+
+def add_sales(sales=(), items=()):
+    """Add new ``Sale`` objects and new ``SaleItem`` objects to the rollups.
+
+    A sale counts towards ``sale_count`` and revenue of its cashier's row;
+    an item adds units, revenue and cost to its batch's row and units and
+    cost to its sale's cashier row. Items need ``sale`` and ``medicine``
+    loaded. Call inside the transaction that writes them.
+    """
+    medicine_rows = defaultdict(lambda: [0, ZERO, ZERO])
+    cashier_rows = defaultdict(lambda: [0, 0, ZERO, ZERO])
+    for sale in sales:
+        row = cashier_rows[timezone.localdate(sale.created_at), sale.cashier_id, sale.payment_method]
+        row[0] += 1
+        row[2] += sale.final_amount
+    for item in items:
+        sale = item.sale
+        day = timezone.localdate(sale.created_at)
+        cost = item.medicine.purchase_price * item.quantity
+        row = medicine_rows[day, item.medicine_id]
+        row[0] += item.quantity
+        row[1] += item.total_price
+        row[2] += cost
+        row = cashier_rows[day, sale.cashier_id, sale.payment_method]
+        row[1] += item.quantity
+        row[3] += cost
+    _add(DailyMedicineSales, MEDICINE_KEY, MEDICINE_TOTALS, medicine_rows)
+    _add(DailyCashierSales, CASHIER_KEY, CASHIER_TOTALS, cashier_rows)
+
+
+def _bulk_create(model, rows):
+    batch = []
+    count = 0
+    for row in rows:
+        batch.append(model(**row))
+        if len(batch) >= REBUILD_BATCH_SIZE:
+            model.objects.bulk_create(batch)
+            count += len(batch)
+            batch = []
+    model.objects.bulk_create(batch)
+    return count + len(batch)
+
+
+def rebuild(start=None, end=None):
+    """Recompute the rollups of the local days ``start`` to ``end`` inclusive.
+
+    Either bound may be left out to go back to the first sale or up to the
+    last. Returns ``(medicine_rows, cashier_rows)`` written.
+    """
+    sales = Sale.objects.order_by()
+    items = SaleItem.objects.order_by()
+    medicine_rollups = DailyMedicineSales.objects.all()
+    cashier_rollups = DailyCashierSales.objects.all()
+    if start:
+        sales = sales.filter(created_at__gte=day_range(start)[0])
+        items = items.filter(sale__created_at__gte=day_range(start)[0])
+        medicine_rollups = medicine_rollups.filter(date__gte=start)
+        cashier_rollups = cashier_rollups.filter(date__gte=start)
+    if end:
+        sales = sales.filter(created_at__lt=day_range(end)[1])
+        items = items.filter(sale__created_at__lt=day_range(end)[1])
+        medicine_rollups = medicine_rollups.filter(date__lte=end)
+        cashier_rollups = cashier_rollups.filter(date__lte=end)
+
+    with transaction.atomic():
+        # The totals are read and written in one transaction, so a sale
+        # committed in between can neither be missed nor counted twice.
+        medicine_rollups.delete()
+        cashier_rollups.delete()
+        return _rebuild(sales, items)
+
+
+def _rebuild(sales, items):
+    cost = Sum(F('quantity') * F('medicine__purchase_price'), output_field=MONEY)
+    # Every sale's totals, then the units and cost of its items, per key.
+    cashier_rows = {}
+    for row in (
+        sales.values('cashier_id', 'payment_method', day=TruncDate('created_at'))
+        .annotate(sale_count=Count('id'), revenue=Sum('final_amount'))
+    ):
+        cashier_rows[row['day'], row['cashier_id'], row['payment_method']] = {
+            'date': row['day'], 'cashier_id': row['cashier_id'], 'payment_method': row['payment_method'],
+            'sale_count': row['sale_count'], 'quantity': 0, 'revenue': row['revenue'], 'cost': ZERO,
+        }
+    for row in (
+        items.values(day=TruncDate('sale__created_at'), cashier=F('sale__cashier_id'),
+                     payment=F('sale__payment_method'))
+        .annotate(units=Sum('quantity'), cost=cost)
+    ):
+        cashier_row = cashier_rows[row['day'], row['cashier'], row['payment']]
+        cashier_row['quantity'] = row['units']
+        cashier_row['cost'] = row['cost']
+
+    medicine_rows = (
+        {'date': row['day'], 'medicine_id': row['medicine_id'], 'quantity': row['units'],
+         'revenue': row['revenue'], 'cost': row['cost']}
+        for row in items.values('medicine_id', day=TruncDate('sale__created_at'))
+        .annotate(units=Sum('quantity'), revenue=Sum('total_price'), cost=cost)
+        .iterator(chunk_size=REBUILD_BATCH_SIZE)
+    )
+
+    written = _bulk_create(DailyMedicineSales, medicine_rows)
+    return written, _bulk_create(DailyCashierSales, cashier_rows.values())
+
+
+def daily_totals(start, end):
+    """One row per day with sales in ``[start, end]``, oldest first."""
+    return list(
+        DailyCashierSales.objects.filter(date__range=(start, end))
+        .values('date')
+        .annotate(sale_count=Sum('sale_count'), quantity=Sum('quantity'),
+                  revenue=Sum('revenue'), cost=Sum('cost'))
+        .order_by('date')
+    )
+
+
+def cashier_totals(start, end):
+    names = dict(Sale._meta.get_field('payment_method').choices)
+    rows = list(
+        DailyCashierSales.objects.filter(date__range=(start, end))
+        .values('cashier', 'payment_method', username=F('cashier__username'))
+        .annotate(sale_count=Sum('sale_count'), quantity=Sum('quantity'),
+                  revenue=Sum('revenue'), cost=Sum('cost'))
+        .order_by('username', 'payment_method')
+    )
+    for row in rows:
+        row['payment_name'] = names.get(row['payment_method'], row['payment_method'])
+    return rows
+
+
+def category_totals(start, end):
+    names = dict(Product.CATEGORY_CHOICES)
+    rows = list(
+        DailyMedicineSales.objects.filter(date__range=(start, end))
+        .values(category=F('medicine__product__category'))
+        .annotate(quantity=Sum('quantity'), revenue=Sum('revenue'), cost=Sum('cost'))
+        .order_by('-revenue')
+    )
+    for row in rows:
+        row['name'] = names.get(row['category'], row['category'])
+    return rows
+
+
+def product_totals(start, end, limit=TOP_PRODUCTS):
+    """The ``limit`` best-selling products by line revenue, all batches together."""
+    return list(
+        DailyMedicineSales.objects.filter(date__range=(start, end))
+        .values(product_id=F('medicine__product_id'), name=F('medicine__product__name'))
+        .annotate(quantity=Sum('quantity'), revenue=Sum('revenue'), cost=Sum('cost'))
+        .order_by('-revenue', 'name')[:limit]
+    )
@@ -0,0 +1,125 @@
+"""Read replicas for reporting.
+
+Everything reads and writes the primary (``default``) database except code
+running under ``reads_from(alias)``, whose reads go to ``alias``. Reporting
+views use ``replica_reads`` and the reporting commands ``reporting_database``,
+which pick the first replica in ``PHARMACY_READ_REPLICAS`` that is at most
+``PHARMACY_REPLICA_MAX_LAG`` behind the primary, and the primary when none
+is. Lag is the gap between the newest sale on each side, two index seeks.
+
+A replica can also be behind by less than that, so someone who has just
+written reads the primary for ``PHARMACY_REPLICA_PIN_SECONDS``: a cashier
+always finds the sale they just rang up in the sales history. The pin is a
+cookie set by ``middleware.PrimaryPinMiddleware``, which costs no query.
+
+SQLite does not replicate; ``refresh_replica`` copies the primary into a
+replica's file with SQLite's online backup, for ``refresh_replicas`` to run
+on a schedule.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import timedelta
+from functools import wraps
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+
+from .models import Sale
+
+PIN_COOKIE = 'pharmacy_primary'
+DEFAULT_MAX_LAG = 60
+DEFAULT_PIN_SECONDS = 10
+
+_reads_from = ContextVar('pharmacy_reads_from', default=None)
+
+
+class ReplicaRouter:
+    """Sends reads to the alias ``reads_from`` chose and writes to the primary."""
+
+    def db_for_read(self, model, **hints):
+        return _reads_from.get()
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary.
+        return True
+
+    def allow_migrate(self, db, app_label, **hints):
+        # Replicas get the primary's schema with its rows, see refresh_replica.
+        return db == DEFAULT_DB_ALIAS
+
+
+@contextmanager
+def reads_from(alias):
+    token = _reads_from.set(None if alias == DEFAULT_DB_ALIAS else alias)
+    try:
+        yield alias
+    finally:
+        _reads_from.reset(token)
+
+
+def replicas():
+    return [alias for alias in getattr(settings, 'PHARMACY_READ_REPLICAS', []) if alias in connections]
+
+
+def _newest_sale(alias):
+    return (
+        Sale.objects.using(alias).order_by('-created_at', '-id')
+        .values_list('created_at', flat=True).first()
+    )
+
+
+def replica_lag(alias):
+    """How far ``alias`` is behind the primary; ``None`` if it cannot be read."""
+    try:
+        replica = _newest_sale(alias)
+    except DatabaseError:
+        return None
+    primary = _newest_sale(DEFAULT_DB_ALIAS)
+    if primary is None or (replica is not None and replica >= primary):
+        return timedelta(0)
+    if replica is None:
+        return None
+    return primary - replica
+
+
+def reporting_database(max_lag=None):
+    """The alias to run reporting reads on: a replica within ``max_lag``, else the primary."""
+    if max_lag is None:
+        max_lag = timedelta(seconds=getattr(settings, 'PHARMACY_REPLICA_MAX_LAG', DEFAULT_MAX_LAG))
+    for alias in replicas():
+        lag = replica_lag(alias)
+        if lag is not None and lag <= max_lag:
+            return alias
+    return DEFAULT_DB_ALIAS
+
+
+def request_database(request):
+    """``reporting_database`` for a request, or the primary if the client has just written."""
+    if PIN_COOKIE in request.COOKIES:
+        return DEFAULT_DB_ALIAS
+    return reporting_database()
+
+
+def replica_reads(view):
+    """Run a read-only view's queries on ``request_database``."""
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        with reads_from(request_database(request)):
+            return view(request, *args, **kwargs)
+    return wrapper
+
+
+def refresh_replica(alias):
+    """Copy the primary into the SQLite replica ``alias``."""
+    source, target = connections[DEFAULT_DB_ALIAS], connections[alias]
+    if source.settings_dict['NAME'] == target.settings_dict['NAME']:
+        raise ImproperlyConfigured(f'{alias} is the primary database, not a replica')
+    if source.vendor != 'sqlite' or target.vendor != 'sqlite':
+        raise ImproperlyConfigured('Only SQLite replicas are refreshed by copying the primary')
+    source.ensure_connection()
+    target.ensure_connection()
+    source.connection.backup(target.connection)
@@ -0,0 +1,229 @@
+"""Full-text product search backed by an SQLite FTS5 index.
+
+Search works on products, so a medicine stocked in several batches is one
+hit. The index is an external-content FTS5 table over ``pharmacy_product``
+kept in sync by SQL triggers, so it follows every write path (ORM saves, queryset
+``update``/``delete`` and bulk inserts) without any Python-side bookkeeping.
+On databases without FTS5 the search falls back to ``icontains`` filters.
+"""
+import re
+
+from django.db import connection
+from django.db.models import Count, Exists, Min, OuterRef, Q, Subquery, Sum
+from django.utils import timezone
+
+from .branches import branch_q, current_branch
+from .cache import LRUCache
+from .models import Medicine, Product
+
+SEARCH_RESULT_LIMIT = 50
+
+FTS_TABLE = 'pharmacy_product_fts'
+INDEXED_COLUMNS = ('name', 'generic_name', 'manufacturer')
+# bm25 weights for the indexed columns, name matches rank highest.
+COLUMN_WEIGHTS = (10.0, 5.0, 1.0)
+
+
+def _index_sql():
+    table = Product._meta.db_table
+    columns = ', '.join(INDEXED_COLUMNS)
+    new_values = ', '.join(f'new.{c}' for c in INDEXED_COLUMNS)
+    old_values = ', '.join(f'old.{c}' for c in INDEXED_COLUMNS)
+    return [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+        f"{columns}, content='{table}', content_rowid='id', "
+        f"tokenize='unicode61 remove_diacritics 2', prefix='2 3')",
+        f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON {table} BEGIN "
+        f"INSERT INTO {FTS_TABLE}(rowid, {columns}) VALUES (new.id, {new_values}); END",
+        f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON {table} BEGIN "
+        f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, {columns}) "
+        f"VALUES ('delete', old.id, {old_values}); END",
+        f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF {columns} ON {table} BEGIN "
+        f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, {columns}) "
+        f"VALUES ('delete', old.id, {old_values}); "
+        f"INSERT INTO {FTS_TABLE}(rowid, {columns}) VALUES (new.id, {new_values}); END",
+    ]
+
+
+_fts5_available = {}
+
+
+def is_supported(conn=None):
+    conn = conn or connection
+    if conn.vendor != 'sqlite':
+        return False
+    if conn.alias not in _fts5_available:
+        with conn.cursor() as cursor:
+            cursor.execute('PRAGMA compile_options')
+            options = {row[0] for row in cursor.fetchall()}
+        _fts5_available[conn.alias] = 'ENABLE_FTS5' in options
+    return _fts5_available[conn.alias]
+
+
+def _triggers_installed(cursor):
+    names = [f'{FTS_TABLE}_{suffix}' for suffix in ('ai', 'ad', 'au')]
+    cursor.execute(
+        "SELECT count(*) FROM sqlite_master WHERE type = 'trigger' AND name IN (%s, %s, %s)",
+        names,
+    )
+    return cursor.fetchone()[0] == len(names)
+
+
+def install(conn=None):
+    """Create the FTS table and triggers if missing.
+
+    Django recreates a table (dropping its triggers) for some schema changes
+    on SQLite, so this runs after every ``migrate``. The index is rebuilt only
+    when the triggers had to be put back.
+    """
+    conn = conn or connection
+    if not is_supported(conn):
+        return False
+    # Migrated back to before the product table existed.
+    if Product._meta.db_table not in conn.introspection.table_names():
+        return False
+    with conn.cursor() as cursor:
+        if _triggers_installed(cursor):
+            return False
+        for statement in _index_sql():
+            cursor.execute(statement)
+    rebuild(conn)
+    return True
+
+
+def rebuild(conn=None):
+    """Repopulate the index from the product table."""
+    conn = conn or connection
+    with conn.cursor() as cursor:
+        cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+        cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('optimize')")
+
+
+def build_match_expression(query):
+    """Turn free text into an FTS5 prefix query: every term must match."""
+    terms = re.findall(r'\w+', query.lower())
+    return ' '.join(f'"{term}"*' for term in terms)
+
+
+def _sellable_batches(today):
+    return Medicine.objects.filter(branch_q(), stock_quantity__gt=0, expiry_date__gte=today)
+
+
+def with_stock(products, today=None):
+    """Annotate products with what this branch can sell from their unexpired batches.
+
+    ``stock`` is the units in stock, ``batch_count`` the number of batches,
+    ``next_expiry`` the expiry date of the batch checkout sells first and
+    ``price`` that batch's selling price.
+    """
+    today = today or timezone.localdate()
+    sellable = Q(batches__stock_quantity__gt=0, batches__expiry_date__gte=today) & branch_q('batches__')
+    first_batch = (
+        _sellable_batches(today).filter(product=OuterRef('pk'))
+        .order_by('expiry_date', 'id')
+    )
+    return products.annotate(
+        stock=Sum('batches__stock_quantity', filter=sellable, default=0),
+        batch_count=Count('batches', filter=sellable),
+        next_expiry=Min('batches__expiry_date', filter=sellable),
+        price=Subquery(first_batch.values('selling_price')[:1]),
+    )
+
+
+def search_products(query, category=None, limit=SEARCH_RESULT_LIMIT, in_stock=False):
+    """Return up to ``limit`` products matching ``query``, best match first.
+
+    Products come annotated as by ``with_stock``; the stock figures are
+    computed for the returned page only.
+    """
+    match = build_match_expression(query)
+    if not match:
+        return []
+
+    if not is_supported():
+        return _fallback_search(query, category, limit, in_stock)
+
+    table = Product._meta.db_table
+    weights = ', '.join(str(w) for w in COLUMN_WEIGHTS)
+    sql = (
+        f'SELECT p.id FROM {FTS_TABLE} '
+        f'JOIN {table} p ON p.id = {FTS_TABLE}.rowid '
+        f'WHERE {FTS_TABLE} MATCH %s'
+    )
+    params = [match]
+    if category:
+        sql += ' AND p.category = %s'
+        params.append(category)
+    if in_stock:
+        # The same batches as _sellable_batches.
+        batches = Medicine._meta.db_table
+        branch = current_branch()
+        branch_column = Medicine._meta.get_field('branch').column
+        sql += (
+            f' AND EXISTS (SELECT 1 FROM {batches} b WHERE b.product_id = p.id'
+            f' AND b.stock_quantity > 0 AND b.expiry_date >= %s'
+            f' AND b.{branch_column} {"IS NULL" if branch is None else "= %s"})'
+        )
+        params.append(timezone.localdate())
+        if branch is not None:
+            params.append(branch.pk)
+    sql += f' ORDER BY bm25({FTS_TABLE}, {weights}), p.name LIMIT %s'
+    params.append(limit)
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        ids = [row[0] for row in cursor.fetchall()]
+    products = with_stock(Product.objects.filter(pk__in=ids)).in_bulk(ids)
+    return [products[pk] for pk in ids]
+
+
+def _fallback_search(query, category, limit, in_stock=False):
+    products = Product.objects.filter(
+        Q(name__icontains=query) |
+        Q(generic_name__icontains=query) |
+        Q(manufacturer__icontains=query)
+    )
+    if category:
+        products = products.filter(category=category)
+    if in_stock:
+        products = products.filter(Exists(
+            _sellable_batches(timezone.localdate()).filter(product=OuterRef('pk'))
+        ))
+    return list(with_stock(products.order_by('name')[:limit]))
+
+
+TYPEAHEAD_LIMIT = 20
+TYPEAHEAD_MAX_LIMIT = 50
+
+# Sales do not invalidate the typeahead, or at a busy till it would hardly
+# ever hit; its stock figures are instead at most this many seconds old.
+# Checkout checks stock itself.
+TYPEAHEAD_STOCK_TTL = 5
+
+typeahead_cache = LRUCache(maxsize=2048, generation_key='pharmacy:typeahead:generation',
+                           ttl=TYPEAHEAD_STOCK_TTL)
+
+
+def typeahead(query, limit=TYPEAHEAD_LIMIT):
+    """Products with sellable stock for the POS search box, as plain dicts.
+
+    ``price`` is the selling price of the batch checkout would sell first.
+    Results are cached per normalised query until the next catalog write or
+    import, and for ``TYPEAHEAD_STOCK_TTL`` seconds at most.
+    """
+    branch = current_branch()
+    key = (build_match_expression(query), limit, branch and branch.pk)
+    version = typeahead_cache.version()
+    results = typeahead_cache.get(key)
+    if results is None:
+        results = [
+            {
+                'id': product.id,
+                'name': product.name,
+                'price': None if product.price is None else f'{product.price:.2f}',
+                'stock': product.stock,
+            }
+            for product in search_products(query, limit=limit, in_stock=True)
+        ]
+        typeahead_cache.set(key, results, version)
+    return results
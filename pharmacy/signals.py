@@ -0,0 +1,78 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from . import branches, rollups, stats, sync
+from .receipts import receipt_cache
+from .search import typeahead_cache
+from .models import Branch, CatalogTombstone, Medicine, Product, Sale, SaleItem
+
+
+@receiver(post_save, sender=Medicine)
+@receiver(post_delete, sender=Medicine)
+@receiver(post_save, sender=SaleItem)
+@receiver(post_delete, sender=SaleItem)
+def medicine_changed(sender, **kwargs):
+    # The dashboard's batch figures come from the alerts, refreshed by alerts.scan.
+    transaction.on_commit(typeahead_cache.invalidate)
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def product_changed(sender, created=True, **kwargs):
+    if created:
+        # A new or deleted product changes the dashboard's product total.
+        transaction.on_commit(stats.invalidate_inventory_stats)
+    transaction.on_commit(typeahead_cache.invalidate)
+
+
+@receiver(post_delete, sender=Product)
+@receiver(post_delete, sender=Medicine)
+def catalog_row_deleted(sender, instance, **kwargs):
+    # Terminals syncing the catalog learn about deletes from these.
+    if sender is Product:
+        CatalogTombstone.objects.create(product_id=instance.pk)
+    else:
+        CatalogTombstone.objects.create(product_id=instance.product_id, batch_id=instance.pk)
+    transaction.on_commit(sync.prune_tombstones)
+
+
+@receiver(post_save, sender=SaleItem)
+@receiver(post_delete, sender=SaleItem)
+def sale_item_changed(sender, instance, **kwargs):
+    sale_id = instance.sale_id
+    transaction.on_commit(lambda: receipt_cache.delete(sale_id))
+
+
+@receiver(post_save, sender=SaleItem)
+def sale_item_saved(sender, instance, created, **kwargs):
+    # Checkout bulk-creates its items and adds them to the rollups itself.
+    if created:
+        rollups.add_sales(items=[instance])
+    # Incremental backups find changed items through their sale.
+    Sale.objects.filter(pk=instance.sale_id).update(updated_at=timezone.now())
+
+
+@receiver(post_save, sender=Sale)
+def sale_saved(sender, instance, created, **kwargs):
+    transaction.on_commit(stats.invalidate_sales_stats)
+    if created:
+        rollups.add_sales(sales=[instance])
+    else:
+        sale_id = instance.pk
+        transaction.on_commit(lambda: receipt_cache.delete(sale_id))
+
+
+@receiver(post_delete, sender=Sale)
+def sale_deleted(sender, instance, **kwargs):
+    # The primary key is cleared once the delete finishes; keep a copy.
+    sale_id = instance.pk
+    transaction.on_commit(stats.invalidate_sales_stats)
+    transaction.on_commit(lambda: receipt_cache.delete(sale_id))
+
+
+@receiver(post_save, sender=Branch)
+@receiver(post_delete, sender=Branch)
+def branch_changed(sender, **kwargs):
+    transaction.on_commit(branches.forget)
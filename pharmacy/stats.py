@@ -0,0 +1,179 @@
+"""Dashboard counters and pharmacy-wide statistics.
+
+The dashboard is split into two cache entries so that a sale does not throw
+away the inventory figures and vice versa:
+
+* inventory: product total, low stock and expired batch counts, low stock
+  list. The batch figures come from the open alerts kept by
+  ``alerts.scan``, so they cost a query over the alerts, not over every
+  batch. Invalidated when a scan changes the alerts and when products are
+  added or deleted; batch writes and sales wait for the next scan.
+* sales: today's sale count, revenue and the recent sales list. Computed over
+  an indexed ``created_at`` range and invalidated when a sale commits.
+
+Batch, alert and sale figures are those of the branch this server sells for
+(see ``branches``); the product total is the shared catalog's. Both keys
+carry the branch code and the local date, so a new day starts with fresh
+figures, and a generation counter, shared by the branches, that
+invalidating bumps with ``cache.incr``. Entries
+are never rewritten in place, so concurrent sales cannot lose an update,
+and figures computed before a write are stored under the old generation,
+where nobody reads them. Every worker sees the same figures only if the
+configured cache is shared between them.
+"""
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+from time import time_ns
+
+from django.core.cache import cache
+from django.db.models import Count, DecimalField, F, Sum
+from django.utils import timezone
+
+from .branches import branch_q, current_branch
+from .models import Customer, Medicine, Product, Sale, StockAlert, Supplier
+
+DASHBOARD_CACHE_TIMEOUT = 300
+DASHBOARD_LIST_SIZE = 5
+
+INVENTORY_KEY = 'pharmacy:dashboard:inventory:{branch}:{date}:{generation}'
+SALES_KEY = 'pharmacy:dashboard:sales:{branch}:{date}:{generation}'
+GENERATION_KEY = '{key}:generation'
+
+
+def day_range(day):
+    """Return the aware ``[start, end)`` datetimes of a local calendar day."""
+    start = timezone.make_aware(datetime.combine(day, time.min))
+    return start, start + timedelta(days=1)
+
+
+def open_alerts():
+    """The open stock alerts on the current branch's batches."""
+    return StockAlert.objects.filter(branch_q('medicine__'), resolved_at__isnull=True)
+
+
+def alert_counts():
+    """``{kind: count}`` of the branch's open stock alerts, with every kind present."""
+    counts = dict.fromkeys((kind for kind, _ in StockAlert.KIND_CHOICES), 0)
+    counts.update(open_alerts().order_by().values_list('kind').annotate(Count('id')))
+    return counts
+
+
+def _inventory_stats(today):
+    alerts = alert_counts()
+    return {
+        'total_medicines': Product.objects.count(),
+        'low_stock_count': alerts[StockAlert.LOW_STOCK],
+        'expired_count': alerts[StockAlert.EXPIRED],
+        'low_stock_medicines': [
+            alert.medicine for alert in
+            open_alerts().filter(kind=StockAlert.LOW_STOCK).select_related('medicine__product')
+            .order_by('medicine__stock_quantity', 'medicine')[:DASHBOARD_LIST_SIZE]
+        ],
+    }
+
+
+def _sales_stats(today):
+    start, end = day_range(today)
+    sales = Sale.objects.filter(branch_q())
+    totals = sales.filter(created_at__gte=start, created_at__lt=end).aggregate(
+        today_sales=Count('id'),
+        today_revenue=Sum('final_amount'),
+    )
+    totals['today_revenue'] = totals['today_revenue'] or 0
+    totals['recent_sales'] = list(
+        sales.select_related('customer')
+        .order_by('-created_at', '-id')[:DASHBOARD_LIST_SIZE]
+    )
+    return totals
+
+
+def _generation(key):
+    generation_key = GENERATION_KEY.format(key=key)
+    generation = cache.get(generation_key)
+    if generation is None:
+        cache.add(generation_key, 0, None)
+        generation = cache.get(generation_key, 0)
+    return generation
+
+
+def _invalidate(key):
+    generation_key = GENERATION_KEY.format(key=key)
+    try:
+        cache.incr(generation_key)
+    except ValueError:
+        # Evicted: start over from a value no old entry was stored under.
+        cache.set(generation_key, time_ns(), None)
+
+
+def get_dashboard_stats():
+    today = timezone.localdate()
+    branch = current_branch()
+    stats = {}
+    for key, compute in ((INVENTORY_KEY, _inventory_stats), (SALES_KEY, _sales_stats)):
+        key = key.format(branch=branch.code if branch else '', date=today.isoformat(),
+                         generation=_generation(key))
+        values = cache.get(key)
+        if values is None:
+            values = compute(today)
+            cache.set(key, values, DASHBOARD_CACHE_TIMEOUT)
+        stats.update(values)
+    return stats
+
+
+def invalidate_inventory_stats():
+    _invalidate(INVENTORY_KEY)
+
+
+def invalidate_sales_stats():
+    _invalidate(SALES_KEY)
+
+
+EXPIRING_SOON_DAYS = 30
+CENTS = Decimal('0.01')
+
+
+def collect_statistics():
+    """Figures for ``manage_pharmacy --action stats``.
+
+    ``medicines['total']`` and the category breakdown count the shared
+    catalog's products, the stock figures count the current branch's
+    batches; low stock, expired and expiring soon are its open alerts as of
+    the last ``scan_alerts``. Sales are the branch's too; suppliers and
+    customers are shared. Everything comes from
+    grouped aggregates, so memory use does not depend on how many medicines
+    or sales there are.
+    """
+    medicines = Medicine.objects.filter(branch_q()).aggregate(
+        batches=Count('id'),
+        inventory_value=Sum(F('selling_price') * F('stock_quantity'),
+                            output_field=DecimalField(max_digits=14, decimal_places=2)),
+    )
+    alerts = alert_counts()
+    medicines['low_stock'] = alerts[StockAlert.LOW_STOCK]
+    medicines['expired'] = alerts[StockAlert.EXPIRED]
+    medicines['expiring_soon'] = alerts[StockAlert.EXPIRING]
+    medicines['inventory_value'] = (medicines['inventory_value'] or Decimal('0')).quantize(CENTS)
+
+    counts = dict(
+        Product.objects.order_by().values_list('category').annotate(count=Count('id'))
+    )
+    medicines['total'] = sum(counts.values())
+    medicines['by_category'] = [
+        {
+            'category': code,
+            'name': name,
+            'count': counts[code],
+            'percentage': round(counts[code] * 100 / medicines['total'], 1),
+        }
+        for code, name in Product.CATEGORY_CHOICES if counts.get(code)
+    ]
+
+    sales = Sale.objects.filter(branch_q()).aggregate(total=Count('id'), revenue=Sum('final_amount'))
+    sales['revenue'] = (sales['revenue'] or Decimal('0')).quantize(CENTS)
+
+    return {
+        'medicines': medicines,
+        'suppliers': Supplier.objects.count(),
+        'customers': Customer.objects.count(),
+        'sales': sales,
+    }
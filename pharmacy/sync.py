@@ -0,0 +1,96 @@
+"""Delta catalog feed for POS terminals.
+
+A terminal keeps its own copy of the catalog and asks for what changed
+since the watermark of its last sync. A product is sent again when the
+product row, or any of its batches, was written, deleted or expired after
+the watermark; deleted products come back as tombstones. Steady-state
+traffic is therefore proportional to churn, not to the catalog size.
+
+Timestamps are set before a transaction commits, so a row can become
+visible with an ``updated_at`` older than a watermark already handed out.
+Every delta re-reads ``SYNC_OVERLAP`` before the watermark to pick such
+rows up; re-sent rows are identical and applying them twice is harmless.
+"""
+from datetime import datetime, time, timedelta
+
+from django.db.models import Max, Q
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from .models import CatalogTombstone, Medicine, Product
+from .search import with_stock
+
+SYNC_OVERLAP = timedelta(seconds=5)
+TOMBSTONE_RETENTION = timedelta(days=30)
+
+
+def prune_tombstones(now=None):
+    now = now or timezone.now()
+    CatalogTombstone.objects.filter(deleted_at__lt=now - TOMBSTONE_RETENTION).delete()
+
+
+def _product_row(product):
+    return {
+        'id': product.id,
+        'name': product.name,
+        'generic_name': product.generic_name,
+        'manufacturer': product.manufacturer,
+        'price': None if product.price is None else f'{product.price:.2f}',
+        'stock': product.stock,
+    }
+
+
+def catalog_delta(since=None, now=None):
+    """Products changed and deleted since the ``since`` watermark.
+
+    Without ``since``, or when it is older than the tombstones go back, the
+    result is a full snapshot (``full`` is true) and the terminal should
+    replace its copy. The returned ``watermark`` only depends on the data
+    and the current day, so repeating a request that found no changes
+    gives an identical response.
+    """
+    now = now or timezone.now()
+    today = timezone.localdate(now)
+    full = since is None or since < now - TOMBSTONE_RETENTION
+
+    products = Product.objects.order_by('id')
+    deleted = []
+    changes = [since] if not full else []
+    if not full:
+        after = since - SYNC_OVERLAP
+        changed = (
+            Q(updated_at__gt=after)
+            | Q(pk__in=Medicine.objects.filter(updated_at__gt=after).values('product_id'))
+            | Q(pk__in=CatalogTombstone.objects.filter(deleted_at__gt=after, batch_id__isnull=False)
+                .values('product_id'))
+        )
+        if timezone.localdate(since) < today:
+            # Batches that expired since the last sync no longer count as stock.
+            changed |= Q(pk__in=Medicine.objects.filter(
+                expiry_date__gte=timezone.localdate(since), expiry_date__lt=today,
+            ).values('product_id'))
+        products = products.filter(changed)
+        tombstones = (
+            CatalogTombstone.objects.filter(deleted_at__gt=after, batch_id__isnull=True)
+            .values_list('product_id', 'deleted_at')
+        )
+        for product_id, deleted_at in tombstones:
+            deleted.append(product_id)
+            changes.append(deleted_at)
+        deleted.sort()
+
+    products = list(with_stock(products, today).annotate(
+        changed_at=Greatest('updated_at', Max('batches__updated_at')),
+    ))
+    changes += [product.changed_at or product.updated_at for product in products]
+    # Never behind the start of today, so expiries are only looked for once
+    # a day, and never within SYNC_OVERLAP of now.
+    start_of_day = timezone.make_aware(datetime.combine(today, time.min))
+    changes.append(min(start_of_day, now - SYNC_OVERLAP))
+
+    return {
+        'watermark': max(changes).isoformat(),
+        'full': full,
+        'products': [_product_row(product) for product in products],
+        'deleted': deleted,
+    }
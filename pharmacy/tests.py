@@ -1,3 +1,1637 @@
-from django.test import TestCase
+import csv
+import json
+import tempfile
+import threading
+import time
+from io import StringIO
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from unittest.mock import patch
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured, ValidationError
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from .backup import create_backup, find_backups, read_manifest, restore_backup
+from .benchmark import build_scenarios, check_budgets, load_budgets, run_scenarios, seed_dataset
+from .branches import current_branch, forget as forget_branches
+from .checkout import CheckoutError, Order, parse_cart, process_checkout, record_sales
+from .customers import normalize_names as normalize_customer_names
+from .admin import IndexedDatesQuerySet
+from .alerts import scan as scan_alerts
+from .db import apply_pragmas, read_transaction, sqlite_pragmas
+from .imports import StockImportError, import_chunk, run_import
+from .medicines import MAX_ID, product_details
+from .metrics import MetricsRegistry, registry
+from .models import (
+    Branch, Supplier, Product, Medicine, Customer, Sale, SaleItem, CatalogTombstone, DailyCashierSales,
+    DailyMedicineSales, ImportJob, Promotion, StockAlert,
+)
+from .promotions import active_index
+from .receipts import ReceiptCache, receipt_cache
+from .routers import PIN_COOKIE, reads_from, reporting_database
+from .search import TYPEAHEAD_STOCK_TTL, search_products, typeahead, typeahead_cache
+from .stats import collect_statistics, get_dashboard_stats
+from .sync import catalog_delta
+from .writer import CheckoutWriter, checkout_writer
+
+
+
+def setUpModule():
+    # Keep rendered receipts out of the project's receipt cache directory.
+    global _receipts_dir, _receipts_settings
+    _receipts_dir = tempfile.TemporaryDirectory()
+    _receipts_settings = override_settings(RECEIPT_CACHE_DIR=_receipts_dir.name)
+    _receipts_settings.enable()
+
+
+def tearDownModule():
+    _receipts_settings.disable()
+    _receipts_dir.cleanup()
+
+class PharmacyTestMixin:
+    """Shared fixtures for the pharmacy test cases."""
+
+    @classmethod
+    def make_supplier(cls):
+        return Supplier.objects.create(
+            name='MediCore', contact_person='Sarah', phone='555-0101', address='1 Pharma St'
+        )
+
+    @classmethod
+    def make_medicine(cls, supplier, name='Paracetamol 500mg', stock=100, price='8.50', **kwargs):
+        """Create a batch, and its product unless one with ``name`` exists."""
+        product, _ = Product.objects.get_or_create(name=name, defaults={
+            'generic_name': kwargs.pop('generic_name', 'Acetaminophen'),
+            'category': kwargs.pop('category', 'tablet'),
+            'manufacturer': kwargs.pop('manufacturer', 'PharmaCorp'),
+        })
+        defaults = {
+            'batch_number': f'{name[:3].upper()}001',
+            'expiry_date': date.today() + timedelta(days=365),
+            'purchase_price': Decimal('5.00'),
+            'minimum_stock': 10,
+        }
+        defaults.update(kwargs)
+        return Medicine.objects.create(
+            product=product, supplier=supplier, stock_quantity=stock,
+            selling_price=Decimal(price), **defaults
+        )
+
+
+class CheckoutTests(PharmacyTestMixin, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.cashier = User.objects.create_user('cashier', password='secret')
+        cls.supplier = cls.make_supplier()
+        cls.medicines = [
+            cls.make_medicine(cls.supplier, name=f'Medicine {i}', stock=50, price='2.00',
+                              batch_number=f'B{i:03d}')
+            for i in range(20)
+        ]
+
+    def cart(self, count, quantity=1):
+        return [{'product_id': m.product_id, 'quantity': quantity} for m in self.medicines[:count]]
+
+    def test_checkout_creates_sale_and_decrements_stock(self):
+        sale = process_checkout(self.cashier, self.cart(3, quantity=2), discount=10)
+
+        self.assertEqual(sale.items.count(), 3)
+        self.assertEqual(sale.total_amount, Decimal('12.00'))
+        self.assertEqual(sale.final_amount, Decimal('10.80'))
+        for medicine in self.medicines[:3]:
+            medicine.refresh_from_db()
+            self.assertEqual(medicine.stock_quantity, 48)
+
+    def test_duplicate_lines_are_merged(self):
+        cart = self.cart(1) + self.cart(1, quantity=4)
+        sale = process_checkout(self.cashier, cart)
+
+        item = sale.items.get()
+        self.assertEqual(item.quantity, 5)
+
+    def test_query_count_is_flat(self):
+        with CaptureQueriesContext(connection) as small:
+            process_checkout(self.cashier, self.cart(1))
+        with CaptureQueriesContext(connection) as large:
+            process_checkout(self.cashier, self.cart(20))
+        self.assertEqual(len(small), len(large))
+
+    def test_oversell_is_rejected_with_line_errors(self):
+        cart = self.cart(2)
+        cart[1]['quantity'] = 51
+
+        with self.assertRaises(CheckoutError) as ctx:
+            process_checkout(self.cashier, cart)
+
+        self.assertEqual(ctx.exception.errors[0]['line'], 1)
+        self.assertEqual(Sale.objects.count(), 0)
+        self.medicines[0].refresh_from_db()
+        self.assertEqual(self.medicines[0].stock_quantity, 50)
+
+    def test_unknown_medicine_and_bad_quantity(self):
+        with self.assertRaises(CheckoutError) as ctx:
+            process_checkout(self.cashier, [{'product_id': 'x', 'quantity': 1},
+                                            {'product_id': self.medicines[0].product_id, 'quantity': 0}])
+        self.assertEqual([e['line'] for e in ctx.exception.errors], [0, 1])
+
+        with self.assertRaises(CheckoutError):
+            process_checkout(self.cashier, [{'product_id': 999999, 'quantity': 1}])
+
+    def test_create_sale_view(self):
+        self.client.force_login(self.cashier)
+        response = self.client.post(
+            reverse('pharmacy:create_sale'),
+            data=json.dumps({'items': self.cart(2), 'payment_method': 'card'}),
+            content_type='application/json',
+        )
+        data = response.json()
+        self.assertTrue(data['success'])
+        self.assertEqual(Sale.objects.get(id=data['sale_id']).payment_method, 'card')
+
+        response = self.client.post(
+            reverse('pharmacy:create_sale'),
+            data=json.dumps({'items': [{'product_id': self.medicines[0].product_id, 'quantity': 500}]}),
+            content_type='application/json',
+        )
+        data = response.json()
+        self.assertFalse(data['success'])
+        self.assertEqual(len(data['errors']), 1)
+
+        for body in ('{', json.dumps([]), json.dumps('x'), json.dumps(1)):
+            response = self.client.post(reverse('pharmacy:create_sale'), data=body,
+                                        content_type='application/json')
+            self.assertEqual(response.status_code, 400)
+
+    def test_malformed_cart_values_are_checkout_errors(self):
+        product_id = self.medicines[0].product_id
+        for items in (5, 'x', [5], [{'product_id': 10**30, 'quantity': 1}],
+                      [{'product_id': product_id, 'quantity': 1.9}],
+                      [{'product_id': product_id, 'quantity': True}],
+                      [{'product_id': str(product_id), 'quantity': 1}]):
+            with self.assertRaises(CheckoutError):
+                process_checkout(self.cashier, items)
+        for customer_id in ('abc', 10**30, True):
+            with self.assertRaises(CheckoutError):
+                process_checkout(self.cashier, self.cart(1), customer_id=customer_id)
+        self.assertEqual(Sale.objects.count(), 0)
+
+    def test_invalid_payment_method_and_percentages(self):
+        for options in ({'payment_method': 'cheque'}, {'discount': -5}, {'discount': 101},
+                        {'tax': 'NaN'}):
+            with self.assertRaises(CheckoutError):
+                process_checkout(self.cashier, self.cart(1), **options)
+        self.assertEqual(Sale.objects.count(), 0)
+
+    def test_sale_item_save_decrements_stock(self):
+        sale = Sale.objects.create(cashier=self.cashier, total_amount=2, final_amount=2)
+        SaleItem.objects.create(sale=sale, medicine=self.medicines[0], quantity=3,
+                                unit_price=Decimal('2.00'), total_price=Decimal('6.00'))
+        self.medicines[0].refresh_from_db()
+        self.assertEqual(self.medicines[0].stock_quantity, 47)
+
+    def make_batches(self):
+        """Three more batches of ``Medicine 0``: one expired, one sooner, one later."""
+        today = date.today()
+        expired, soon, late = [
+            self.make_medicine(self.supplier, name='Medicine 0', stock=stock, price=price,
+                               batch_number=batch, expiry_date=today + timedelta(days=days))
+            for batch, stock, price, days in (('X', 40, '1.00', -1), ('S', 5, '1.50', 30),
+                                              ('L', 50, '3.00', 700))
+        ]
+        return expired, soon, late
+
+    def test_first_expiring_batch_sells_first(self):
+        expired, soon, late = self.make_batches()
+        sale = process_checkout(self.cashier, [{'product_id': soon.product_id, 'quantity': 3}])
+
+        item = sale.items.get()
+        self.assertEqual((item.medicine, item.unit_price), (soon, Decimal('1.50')))
+        soon.refresh_from_db()
+        self.assertEqual(soon.stock_quantity, 2)
+
+    def test_line_splits_across_batches_and_skips_expired(self):
+        expired, soon, late = self.make_batches()
+        sale = process_checkout(self.cashier, [{'product_id': soon.product_id, 'quantity': 60}])
+
+        items = {item.medicine_id: item.quantity for item in sale.items.all()}
+        self.assertEqual(items, {soon.id: 5, self.medicines[0].id: 50, late.id: 5})
+        self.assertEqual(sale.total_amount, Decimal('122.50'))
+        expired.refresh_from_db()
+        self.assertEqual(expired.stock_quantity, 40)
+
+        with self.assertRaises(CheckoutError) as ctx:
+            process_checkout(self.cashier, [{'product_id': soon.product_id, 'quantity': 46}])
+        self.assertEqual(ctx.exception.errors[0]['error'], 'Only 45 of Medicine 0 in stock')
+
+
+class PromotionTests(PharmacyTestMixin, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.cashier = User.objects.create_user('cashier', password='secret')
+        cls.supplier = cls.make_supplier()
+        cls.tablet = cls.make_medicine(cls.supplier, name='Tablet A', price='10.00')
+        cls.syrup = cls.make_medicine(cls.supplier, name='Syrup B', price='4.00', category='syrup',
+                                      manufacturer='Acme Labs')
+        cls.cream = cls.make_medicine(cls.supplier, name='Cream C', price='6.00', category='cream')
+
+    def setUp(self):
+        cache.clear()
+
+    def promote(self, **fields):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Promotion.objects.create(**fields)
+
+    def test_cart_is_priced_with_the_best_promotion_per_line(self):
+        self.promote(name='Tablets 10% off', category='tablet', percent=Decimal('10'))
+        self.promote(name='Tablet A 25% off', product=self.tablet.product, percent=Decimal('25'))
+        acme = self.promote(name='Acme 3 for 2', kind=Promotion.BUY_GET, manufacturer='acme labs ',
+                            buy_quantity=2, free_quantity=1)
+        self.promote(name='Expired', category='cream', percent=Decimal('50'),
+                     ends_on=date.today() - timedelta(days=1))
+
+        cart = [{'product_id': m.product_id, 'quantity': 7} for m in (self.tablet, self.syrup, self.cream)]
+        sale = process_checkout(self.cashier, cart)
+
+        items = {item.medicine_id: item for item in sale.items.select_related('promotion')}
+        tablet, syrup, cream = items[self.tablet.id], items[self.syrup.id], items[self.cream.id]
+        self.assertEqual((tablet.promotion.name, tablet.discount_amount, tablet.total_price),
+                         ('Tablet A 25% off', Decimal('17.50'), Decimal('52.50')))
+        self.assertEqual((syrup.promotion, syrup.discount_amount, syrup.total_price),
+                         (acme, Decimal('8.00'), Decimal('20.00')))
+        self.assertEqual((cream.promotion, cream.discount_amount), (None, Decimal('0')))
+        self.assertEqual(sale.total_amount, Decimal('114.50'))
+
+    def test_pricing_runs_no_queries_per_line(self):
+        self.promote(name='Tablets 10% off', category='tablet', percent=Decimal('10'))
+        process_checkout(self.cashier, [{'product_id': self.tablet.product_id, 'quantity': 1}])
+        with CaptureQueriesContext(connection) as small:
+            process_checkout(self.cashier, [{'product_id': self.tablet.product_id, 'quantity': 1}])
+        cart = [{'product_id': m.product_id, 'quantity': 2} for m in (self.tablet, self.syrup, self.cream)]
+        with CaptureQueriesContext(connection) as large:
+            process_checkout(self.cashier, cart)
+        self.assertEqual(len(small), len(large))
+        # The version check only; the index is not compiled again.
+        self.assertEqual(sum('pharmacy_promotion' in q['sql'] for q in large.captured_queries), 1)
+
+    def test_index_follows_promotion_changes(self):
+        promotion = self.promote(name='Creams 50% off', category='cream', percent=Decimal('50'))
+        self.assertEqual(active_index(), {('category', 'cream'): [promotion]})
+
+        promotion.is_active = False
+        promotion.save()
+        self.assertEqual(active_index(), {})
+
+    def test_changes_made_by_another_process_are_seen(self):
+        promotion = self.promote(name='Tablet A 25% off', product=self.tablet.product, percent=Decimal('25'))
+        cart = [{'product_id': self.tablet.product_id, 'quantity': 1}]
+        self.assertEqual(process_checkout(self.cashier, cart).items.get().discount_amount, Decimal('2.50'))
+
+        # As another worker would change them, without this process's caches noticing.
+        Promotion.objects.filter(pk=promotion.pk).update(percent=Decimal('50'), updated_at=timezone.now())
+        self.assertEqual(process_checkout(self.cashier, cart).items.get().discount_amount, Decimal('5.00'))
+
+        Promotion.objects.filter(pk=promotion.pk).delete()
+        item = process_checkout(self.cashier, cart).items.get()
+        self.assertEqual((item.promotion, item.discount_amount), (None, Decimal('0')))
+
+    def test_promotion_needs_one_target(self):
+        with self.assertRaises(ValidationError):
+            Promotion(name='Nothing', percent=Decimal('5')).clean()
+        with self.assertRaises(ValidationError):
+            Promotion(name='Two', category='tablet', supplier=self.supplier, percent=Decimal('5')).clean()
+        with self.assertRaises(ValidationError):
+            Promotion(name='Free', kind=Promotion.BUY_GET, category='tablet', buy_quantity=2).clean()
+        Promotion(name='Ok', supplier=self.supplier, percent=Decimal('5')).clean()
+
+class MedicineSearchTests(PharmacyTestMixin, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('pharmacist', password='secret')
+        supplier = cls.make_supplier()
+        cls.paracetamol = cls.make_medicine(supplier, name='Paracetamol 500mg').product
+        cls.ibuprofen = cls.make_medicine(supplier, name='Ibuprofen 400mg', generic_name='Ibuprofen',
+                                          manufacturer='MediLabs', category='capsule').product
+        cls.syrup = cls.make_medicine(supplier, name='Fever Syrup', generic_name='Paracetamol',
+                                      manufacturer='KidsHealth', category='syrup').product
+
+    def test_prefix_search_ranks_name_matches_first(self):
+        results = search_products('parac')
+        self.assertEqual(results, [self.paracetamol, self.syrup])
+
+    def test_all_terms_must_match(self):
+        self.assertEqual(search_products('ibu medil'), [self.ibuprofen])
+        self.assertEqual(search_products('ibu kids'), [])
+
+    def test_category_and_limit(self):
+        self.assertEqual(search_products('paracetamol', category='syrup'), [self.syrup])
+        self.assertEqual(len(search_products('paracetamol', limit=1)), 1)
+
+    def test_one_hit_per_product_with_stock_of_all_batches(self):
+        supplier = Supplier.objects.get()
+        self.make_medicine(supplier, name='Paracetamol 500mg', stock=30, batch_number='PAR002',
+                           expiry_date=date.today() + timedelta(days=30))
+        self.make_medicine(supplier, name='Paracetamol 500mg', stock=70, batch_number='PAR003',
+                           expiry_date=date.today() - timedelta(days=1))
+
+        paracetamol = search_products('paracetamol 500')[0]
+        self.assertEqual(paracetamol, self.paracetamol)
+        self.assertEqual((paracetamol.stock, paracetamol.batch_count), (130, 2))
+        self.assertEqual(paracetamol.next_expiry, date.today() + timedelta(days=30))
+
+    def test_index_follows_writes(self):
+        Product.objects.filter(pk=self.ibuprofen.pk).update(name='Advil 200mg')
+        self.assertEqual(search_products('advil'), [self.ibuprofen])
+        self.assertEqual(search_products('ibuprofen 400'), [])
+
+        self.syrup.delete()
+        self.assertEqual(search_products('paracetamol'), [self.paracetamol])
+
+    def test_rebuild_command(self):
+        call_command('rebuild_search_index', stdout=StringIO())
+        self.assertEqual(search_products('fever'), [self.syrup])
+
+    def test_search_view(self):
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('pharmacy:search_medicine'), {'query': 'ibu'})
+        self.assertEqual(list(response.context['products']), [self.ibuprofen])
+
+
+class SalesHistoryTests(PharmacyTestMixin, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.cashier = User.objects.create_user('cashier', password='secret')
+        cls.other = User.objects.create_user('other', password='secret')
+        supplier = cls.make_supplier()
+        medicine = cls.make_medicine(supplier, stock=1000)
+        customer = Customer.objects.create(name='Alice', phone='555-1001')
+        start = timezone.now() - timedelta(days=10)
+        for i in range(12):
+            sale = Sale.objects.create(
+                cashier=cls.cashier if i % 3 else cls.other,
+                customer=customer if i % 2 else None,
+                total_amount=Decimal('10.00'), final_amount=Decimal('10.00'),
+                payment_method='card' if i % 4 == 0 else 'cash',
+            )
+            SaleItem.objects.create(sale=sale, medicine=medicine, quantity=1,
+                                    unit_price=Decimal('10.00'), total_price=Decimal('10.00'))
+            # Sales 4 and 5 share a timestamp to exercise the id tie-breaker.
+            Sale.objects.filter(pk=sale.pk).update(created_at=start + timedelta(days=min(i, 4) if i < 6 else i))
+
+    def setUp(self):
+        self.client.force_login(self.cashier)
+
+    def test_keyset_pages_cover_every_sale_once(self):
+        seen = []
+        cursor = None
+        while True:
+            with patch('pharmacy.views.SALES_HISTORY_PAGE_SIZE', 5):
+                response = self.client.get(reverse('pharmacy:sales_history'), {'cursor': cursor or ''})
+            seen += [sale.id for sale in response.context['sales']]
+            cursor = response.context['next_cursor']
+            if not cursor:
+                break
+        expected = list(Sale.objects.order_by('-created_at', '-id').values_list('id', flat=True))
+        self.assertEqual(seen, expected)
+
+    def test_query_count_does_not_depend_on_rows(self):
+        url = reverse('pharmacy:sales_history')
+        with CaptureQueriesContext(connection) as full_page:
+            self.client.get(url)
+        with CaptureQueriesContext(connection) as filtered:
+            self.client.get(url, {'payment_method': 'digital'})
+        self.assertEqual(len(full_page), len(filtered))
+
+        response = self.client.get(url)
+        self.assertContains(response, '1 item(s)')
+        self.assertEqual(response.context['sales'][0].item_count, 1)
+
+    def test_page_walks_the_created_at_index(self):
+        url = reverse('pharmacy:sales_history')
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get(url)
+        page_sql = next(q['sql'] for q in ctx.captured_queries if 'LIMIT' in q['sql'] and 'pharmacy_sale' in q['sql'])
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN {page_sql}')
+            plan = ' '.join(row[-1] for row in cursor.fetchall())
+        self.assertIn('sale_created_id_idx', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_filters_and_totals(self):
+        response = self.client.get(reverse('pharmacy:sales_history'), {
+            'cashier': self.other.id, 'payment_method': 'card',
+        })
+        sales = response.context['sales']
+        self.assertEqual(len(sales), 1)
+        self.assertEqual(response.context['totals']['sale_count'], 1)
+        self.assertEqual(response.context['totals']['final_amount'], Decimal('10.00'))
+
+        today = timezone.localdate()
+        response = self.client.get(reverse('pharmacy:sales_history'), {'date_from': today, 'date_to': today})
+        self.assertEqual(response.context['totals']['sale_count'], 1)
+        self.assertEqual(response.context['totals']['total_amount'], Decimal('10.00'))
+
+    def test_csv_export_streams_filtered_items(self):
+        response = self.client.get(reverse('pharmacy:export_sales', args=['csv']), {'cashier': self.other.id})
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        rows = list(csv.DictReader(StringIO(b''.join(response.streaming_content).decode())))
+        expected = Sale.objects.filter(cashier=self.other).order_by('created_at', 'id')
+        self.assertEqual([int(row['sale_id']) for row in rows], list(expected.values_list('id', flat=True)))
+        self.assertEqual({row['cashier'] for row in rows}, {'other'})
+        self.assertEqual((rows[0]['product'], rows[0]['quantity'], rows[0]['unit_price']),
+                         ('Paracetamol 500mg', '1', '10.00'))
+
+        self.assertEqual(self.client.get(reverse('pharmacy:export_sales', args=['xml'])).status_code, 404)
+
+    def test_ndjson_export_nests_items(self):
+        empty = Sale.objects.create(cashier=self.cashier, total_amount=0, final_amount=0)
+        response = self.client.get(reverse('pharmacy:export_sales', args=['ndjson']))
+        sales = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+        self.assertEqual(len(sales), 13)
+        self.assertEqual({sale['sale_id']: sale['items'] for sale in sales}[empty.id], [])
+        self.assertEqual(len(sales[0]['items']), 1)
+        self.assertEqual(sales[0]['items'][0]['total_price'], '10.00')
+
+    def test_export_sales_command(self):
+        out = StringIO()
+        today = timezone.localdate().isoformat()
+        call_command('export_sales', '--from', today, '--to', today, '--cashier', 'cashier', stdout=out)
+        rows = list(csv.DictReader(StringIO(out.getvalue())))
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0]['cashier'], 'cashier')
+
+
+class DashboardStatsTests(PharmacyTestMixin, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.cashier = User.objects.create_user('cashier', password='secret')
+        supplier = cls.make_supplier()
+        cls.plenty = cls.make_medicine(supplier, name='Plenty', stock=100)
+        cls.scarce = cls.make_medicine(supplier, name='Scarce', stock=12, minimum_stock=10)
+        cls.make_medicine(supplier, name='Old', stock=50, expiry_date=date.today() - timedelta(days=1))
+        scan_alerts()
+
+    def setUp(self):
+        cache.clear()
+
+    def test_counters_and_cache_hit(self):
+        with self.assertNumQueries(5):
+            stats = get_dashboard_stats()
+        self.assertEqual(stats['total_medicines'], 3)
+        self.assertEqual(stats['low_stock_count'], 0)
+        self.assertEqual(stats['expired_count'], 1)
+        self.assertEqual(stats['today_sales'], 0)
+
+        with self.assertNumQueries(0):
+            get_dashboard_stats()
+
+    def test_sale_refreshes_cached_sales_figures(self):
+        get_dashboard_stats()
+        for _ in range(2):
+            with self.captureOnCommitCallbacks(execute=True):
+                sale = process_checkout(self.cashier, [{'product_id': self.plenty.product_id, 'quantity': 2}])
+
+        # Only the sales figures are recomputed.
+        with self.assertNumQueries(2):
+            stats = get_dashboard_stats()
+        self.assertEqual(stats['today_sales'], 2)
+        self.assertEqual(stats['today_revenue'], 2 * sale.final_amount)
+        self.assertEqual(stats['recent_sales'][0].id, sale.id)
+
+    def test_batch_writes_keep_the_cached_inventory(self):
+        get_dashboard_stats()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.scarce.stock_quantity = 5
+            self.scarce.save()
+        with self.assertNumQueries(0):
+            self.assertEqual(get_dashboard_stats()['low_stock_count'], 0)
+
+    def test_alert_scan_refreshes_inventory(self):
+        get_dashboard_stats()
+        process_checkout(self.cashier, [{'product_id': self.scarce.product_id, 'quantity': 2}])
+        self.assertEqual(get_dashboard_stats()['low_stock_count'], 0)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            scan_alerts()
+        stats = get_dashboard_stats()
+        self.assertEqual(stats['low_stock_count'], 1)
+        self.assertEqual(stats['low_stock_medicines'], [self.scarce])
+
+    def test_dashboard_view(self):
+        self.client.force_login(self.cashier)
+        response = self.client.get(reverse('pharmacy:dashboard'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['total_medicines'], 3)
+
+
+class MedicineTypeaheadTests(PharmacyTestMixin, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.cashier = User.objects.create_user('cashier', password='secret')
+        supplier = cls.make_supplier()
+        cls.amoxicillin = cls.make_medicine(supplier, name='Amoxicillin 250mg', stock=5, price='4.00')
+        cls.make_medicine(supplier, name='Amlodipine 5mg', stock=0)
+
+    def setUp(self):
+        typeahead_cache.invalidate()
+        self.client.force_login(self.cashier)
+
+    def test_returns_in_stock_prefix_matches_with_cart_fields(self):
+        response = self.client.get(reverse('pharmacy:medicine_typeahead'), {'q': 'am'})
+        self.assertEqual(response.json()['results'], [
+            {'id': self.amoxicillin.id, 'name': 'Amoxicillin 250mg', 'price': '4.00', 'stock': 5},
+        ])
+
+    def test_results_are_cached_until_a_medicine_write(self):
+        typeahead('amox')
+        with self.assertNumQueries(0):
+            typeahead('amox')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.amoxicillin.stock_quantity = 0
+            self.amoxicillin.save()
+        self.assertEqual(typeahead('amox'), [])
+
+    def test_sales_do_not_invalidate_and_stock_expires(self):
+        typeahead('amox')
+        with self.captureOnCommitCallbacks(execute=True):
+            process_checkout(self.cashier, [{'product_id': self.amoxicillin.product_id, 'quantity': 5}])
+        with self.assertNumQueries(0):
+            self.assertEqual(typeahead('amox')[0]['stock'], 5)
+
+        later = time.monotonic() + TYPEAHEAD_STOCK_TTL
+        with patch('pharmacy.cache.time.monotonic', return_value=later):
+            self.assertEqual(typeahead('amox'), [])
+
+    def test_results_computed_before_an_invalidation_are_not_stored(self):
+        version = typeahead_cache.version()
+        typeahead_cache.invalidate()
+        typeahead_cache.set('stale', [], version)
+        self.assertIsNone(typeahead_cache.get('stale'))
+
+    def test_create_sale_page_does_not_embed_catalog(self):
+        response = self.client.get(reverse('pharmacy:create_sale'))
+        self.assertNotIn('medicines', response.context)
+        self.assertNotContains(response, 'Amoxicillin')
+
+
+class MedicineDetailsTests(PharmacyTestMixin, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.cashier = User.objects.create_user('cashier', password='secret')
+        cls.supplier = cls.make_supplier()
+        cls.medicines = [
+            cls.make_medicine(cls.supplier, name=f'Medicine {i}', stock=10, price='2.00') for i in range(30)
+        ]
+
+    def setUp(self):
+        self.client.force_login(self.cashier)
+
+    def get_batch(self, ids, **headers):
+        return self.client.get(reverse('pharmacy:medicine_details_batch'),
+                               {'ids': ','.join(str(pk) for pk in ids)}, headers=headers)
+
+    def test_cart_is_validated_with_one_query(self):
+        ids = [m.product_id for m in reversed(self.medicines)] + [MAX_ID]
+        with self.assertNumQueries(1):
+            found, missing, _, _ = product_details(ids)
+        self.assertEqual(list(found), ids[:-1])
+        self.assertEqual(missing, [MAX_ID])
+
+        data = self.get_batch(ids[:2]).json()
+        self.assertEqual(data['products'][0], {
+            'id': self.medicines[-1].product_id, 'name': 'Medicine 29', 'price': '2.00', 'stock': 10,
+        })
+        self.assertEqual(self.get_batch(range(1, 102)).status_code, 400)
+        for ids in (['x'], [10**23], [-1]):
+            response = self.get_batch(ids)
+            self.assertEqual((response.status_code, response.json()['error']),
+                             (400, 'ids must be comma-separated integers'))
+
+    def test_price_and_stock_are_what_checkout_would_sell(self):
+        medicine = self.medicines[0]
+        self.make_medicine(self.supplier, name='Medicine 0', stock=5, price='3.00', batch_number='LATER',
+                           expiry_date=medicine.expiry_date + timedelta(days=30))
+        self.make_medicine(self.supplier, name='Medicine 0', stock=7, price='1.00', batch_number='OLD',
+                           expiry_date=date.today() - timedelta(days=1))
+        found, _, _, _ = product_details([medicine.product_id])
+        self.assertEqual(found[medicine.product_id], {
+            'id': medicine.product_id, 'name': 'Medicine 0', 'price': '2.00', 'stock': 15,
+        })
+
+    def test_conditional_requests_get_304_until_the_cart_changes(self):
+        ids = [m.product_id for m in self.medicines[:3]]
+        response = self.get_batch(ids)
+        etag = response['ETag']
+        self.assertIn('Last-Modified', response)
+        self.assertEqual(self.get_batch(ids, if_none_match=etag).status_code, 304)
+        self.assertEqual(self.get_batch(ids, if_modified_since=response['Last-Modified']).status_code, 304)
+        self.assertEqual(self.get_batch(ids[:2], if_none_match=etag).status_code, 200)
+
+        process_checkout(self.cashier, [{'product_id': self.medicines[0].product_id, 'quantity': 1}])
+        response = self.get_batch(ids, if_none_match=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['products'][0]['stock'], 9)
+
+    def test_single_medicine_details_are_cacheable(self):
+        url = reverse('pharmacy:medicine_details', args=[self.medicines[0].id])
+        response = self.client.get(url)
+        self.assertEqual(response.json()['name'], 'Medicine 0')
+        self.assertEqual(self.client.get(url, headers={'If-None-Match': response['ETag']}).status_code, 304)
+        self.assertEqual(self.client.get(reverse('pharmacy:medicine_details', args=[0])).status_code, 404)
+
+class CustomerLookupTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.cashier = User.objects.create_user('cashier', password='secret')
+        cls.zoe = Customer.objects.create(name='Zoë  Álvarez', phone='555-2001')
+        cls.zack = Customer.objects.create(name='Zack Young', phone='555-2002')
+        Customer.objects.create(name='Alice Smith', phone='777-0001')
+
+    def setUp(self):
+        self.client.force_login(self.cashier)
+
+    def lookup(self, query, **params):
+        response = self.client.get(reverse('pharmacy:customer_lookup'), {'q': query, **params})
+        return [customer['id'] for customer in response.json()['results']]
+
+    def test_name_prefix_ignores_case_and_accents(self):
+        self.assertEqual(self.zoe.name_normalized, 'zoe alvarez')
+        self.assertEqual(self.lookup('ZOE alv'), [self.zoe.id])
+        self.assertEqual(self.lookup('za'), [self.zack.id])
+        self.assertEqual(self.lookup('z'), [self.zack.id, self.zoe.id])
+        self.assertEqual(self.lookup('z', limit=1), [self.zack.id])
+        self.assertEqual(self.lookup('alvarez'), [])
+        self.assertEqual(self.lookup(''), [])
+
+    def test_phone_prefix(self):
+        self.assertEqual(self.lookup('555-20'), [self.zoe.id, self.zack.id])
+        self.assertEqual(self.lookup('555-2002'), [self.zack.id])
+
+    def test_lookups_use_indexes(self):
+        for query in ('zo', '555'):
+            with CaptureQueriesContext(connection) as queries:
+                self.lookup(query)
+            sql = queries.captured_queries[-1]['sql']
+            with connection.cursor() as cursor:
+                cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+                plan = ' '.join(row[-1] for row in cursor.fetchall())
+            self.assertIn('USING INDEX', plan)
+            self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_quick_create(self):
+        url = reverse('pharmacy:customer_lookup')
+        response = self.client.post(url, {'name': 'Bob Stone', 'phone': '555-3001'}, content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        customer = Customer.objects.get(phone='555-3001')
+        self.assertEqual(response.json()['customer'], {'id': customer.id, 'name': 'Bob Stone', 'phone': '555-3001'})
+        self.assertEqual(self.lookup('bob'), [customer.id])
+
+        response = self.client.post(url, {'name': 'Bob Again', 'phone': '555-3001'}, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('phone', response.json()['errors'])
+
+    def test_create_sale_page_does_not_embed_customers(self):
+        response = self.client.get(reverse('pharmacy:create_sale'))
+        self.assertNotIn('customers', response.context)
+        self.assertNotContains(response, 'Zack Young')
+
+    def test_normalize_names_fills_rows_written_behind_save(self):
+        Customer.objects.filter(pk=self.zack.pk).update(name_normalized='')
+        self.assertEqual(normalize_customer_names(), 1)
+        self.assertEqual(self.lookup('zack'), [self.zack.id])
+
+
+class QueryPlanTests(PharmacyTestMixin, TestCase):
+    """The hot inventory and sales queries must be answered from indexes."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.cashier = User.objects.create_user('cashier', password='secret')
+        supplier = cls.make_supplier()
+        for i in range(30):
+            cls.make_medicine(supplier, name=f'Medicine {i}', stock=i, batch_number=f'B{i}',
+                              expiry_date=date.today() + timedelta(days=i * 10 - 50))
+
+    def query_plans(self, func):
+        with CaptureQueriesContext(connection) as ctx:
+            func()
+        plans = []
+        with connection.cursor() as cursor:
+            for query in ctx.captured_queries:
+                cursor.execute('EXPLAIN QUERY PLAN ' + query['sql'])
+                plans.append((query['sql'], [row[-1] for row in cursor.fetchall()]))
+        return plans
+
+    def assertNoTableScans(self, func):
+        plans = self.query_plans(func)
+        self.assertTrue(plans)
+        for sql, steps in plans:
+            for step in steps:
+                if step.startswith('SCAN') and 'INDEX' not in step:
+                    self.fail(f'{step!r} in plan for {sql}')
+
+    def test_dashboard_queries_use_indexes(self):
+        cache.clear()
+        self.assertNoTableScans(get_dashboard_stats)
+
+    def test_alert_queries_use_indexes(self):
+        today = date.today()
+        self.assertNoTableScans(lambda: list(Medicine.objects.filter(needs_reorder=True)))
+        self.assertNoTableScans(lambda: Medicine.objects.filter(expiry_date__lt=today).count())
+        self.assertNoTableScans(lambda: Medicine.objects.filter(
+            expiry_date__gte=today, expiry_date__lte=today + timedelta(days=30)).count())
+
+    def test_needs_reorder_follows_stock_changes(self):
+        medicine = Medicine.objects.get(product__name='Medicine 12')
+        self.assertFalse(medicine.needs_reorder)
+
+        process_checkout(self.cashier, [{'product_id': medicine.product_id, 'quantity': 2}])
+        medicine.refresh_from_db()
+        self.assertTrue(medicine.needs_reorder)
+
+        medicine.stock_quantity = 40
+        medicine.save(update_fields=['stock_quantity'])
+        medicine.refresh_from_db()
+        self.assertFalse(medicine.needs_reorder)
+
+        sale = Sale.objects.create(cashier=self.cashier, total_amount=0, final_amount=0)
+        SaleItem.objects.create(sale=sale, medicine=medicine, quantity=30,
+                                unit_price=Decimal('1.00'), total_price=Decimal('30.00'))
+        medicine.refresh_from_db()
+        self.assertTrue(medicine.needs_reorder)
+
+
+class StatisticsTests(PharmacyTestMixin, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.cashier = User.objects.create_user('cashier', password='secret')
+        supplier = cls.make_supplier()
+        cls.make_medicine(supplier, name='Tablet A', stock=10, price='2.00', minimum_stock=10)
+        cls.make_medicine(supplier, name='Syrup B', stock=4, price='5.00', category='syrup',
+                          expiry_date=date.today() + timedelta(days=10))
+        cls.make_medicine(supplier, name='Tablet C', stock=100, price='1.00',
+                          expiry_date=date.today() - timedelta(days=1))
+        Customer.objects.create(name='Alice', phone='555-1001')
+        Sale.objects.create(cashier=cls.cashier, total_amount=Decimal('5'), final_amount=Decimal('4.50'))
+        scan_alerts()
+
+    def test_collect_statistics(self):
+        with self.assertNumQueries(6):
+            statistics = collect_statistics()
+
+        medicines = statistics['medicines']
+        self.assertEqual(medicines['total'], 3)
+        self.assertEqual(medicines['low_stock'], 2)
+        self.assertEqual(medicines['expired'], 1)
+        self.assertEqual(medicines['expiring_soon'], 1)
+        self.assertEqual(medicines['inventory_value'], Decimal('140.00'))
+        self.assertEqual(
+            [(c['category'], c['count'], c['percentage']) for c in medicines['by_category']],
+            [('tablet', 2, 66.7), ('syrup', 1, 33.3)],
+        )
+        self.assertEqual(statistics['suppliers'], 1)
+        self.assertEqual(statistics['customers'], 1)
+        self.assertEqual(statistics['sales'], {'total': 1, 'revenue': Decimal('4.50')})
+
+    def test_stats_command_json_and_text(self):
+        out = StringIO()
+        call_command('manage_pharmacy', action='stats', json=True, stdout=out)
+        data = json.loads(out.getvalue())
+        self.assertEqual(data['medicines']['total'], 3)
+        self.assertEqual(data['sales']['revenue'], '4.50')
+
+        out = StringIO()
+        call_command('manage_pharmacy', action='stats', stdout=out)
+        self.assertIn('Total Inventory Value: $140.00', out.getvalue())
+
+
+class BackupTests(PharmacyTestMixin, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.cashier = User.objects.create_user('cashier', password='secret')
+        supplier = cls.make_supplier()
+        cls.medicine = cls.make_medicine(supplier, stock=20)
+        Customer.objects.create(name='Alice', phone='555-1001')
+        cls.sale = process_checkout(cls.cashier, [{'product_id': cls.medicine.product_id, 'quantity': 2}])
+        Sale.objects.filter(pk=cls.sale.pk).update(created_at=timezone.now() - timedelta(days=3))
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.root = tmp.name
+
+    def snapshot(self):
+        return {
+            model: list(model.objects.order_by('pk').values())
+            for model in (Supplier, Customer, Medicine, Sale, SaleItem)
+        }
+
+    def test_full_backup_round_trip(self):
+        before = self.snapshot()
+        path = create_backup(self.root)
+        manifest = read_manifest(path)
+        self.assertEqual(manifest['kind'], 'full')
+        self.assertEqual(manifest['models']['pharmacy.saleitem']['rows'], 1)
+
+        SaleItem.objects.all().delete()
+        Sale.objects.all().delete()
+        Medicine.objects.filter(pk=self.medicine.pk).update(stock_quantity=0)
+
+        restored = restore_backup(path, workers=1)
+        self.assertEqual(restored['pharmacy.sale'], 1)
+        self.assertEqual(self.snapshot(), before)
+
+    def test_incremental_backup_only_has_changed_rows(self):
+        create_backup(self.root)
+        Customer.objects.create(name='Bob', phone='555-1002')
+        path = create_backup(self.root, incremental=True)
+
+        manifest = read_manifest(path)
+        self.assertEqual(manifest['kind'], 'incremental')
+        rows = {label: info['rows'] for label, info in manifest['models'].items()}
+        self.assertEqual(rows, {
+            'pharmacy.supplier': 0, 'pharmacy.customer': 1, 'pharmacy.product': 0, 'pharmacy.branch': 0,
+            'pharmacy.medicine': 0, 'pharmacy.sale': 0, 'pharmacy.promotion': 0,
+            'pharmacy.saleitem': 0,
+        })
+        self.assertEqual(find_backups(self.root)[-1], path)
+
+    def test_incremental_backup_has_edited_rows(self):
+        create_backup(self.root)
+        customer = Customer.objects.get()
+        customer.address = '1 New Street'
+        customer.save()
+        supplier = Supplier.objects.get()
+        supplier.address = '2 Depot Road'
+        supplier.save()
+        item = SaleItem.objects.get()
+        item.discount_amount = Decimal('1.00')
+        item.save()
+        path = create_backup(self.root, incremental=True)
+
+        rows = {label: info['rows'] for label, info in read_manifest(path)['models'].items()}
+        self.assertEqual(
+            [rows[label] for label in ('pharmacy.customer', 'pharmacy.supplier', 'pharmacy.sale', 'pharmacy.saleitem')],
+            [1, 1, 1, 1],
+        )
+
+    def test_backup_and_restore_commands(self):
+        out = StringIO()
+        call_command('backup_pharmacy', output_dir=self.root, stdout=out)
+        path = find_backups(self.root)[0]
+        Customer.objects.all().delete()
+
+        call_command('restore_pharmacy', path, workers=1, stdout=out)
+        self.assertTrue(Customer.objects.filter(phone='555-1001').exists())
+
+
+class LoadDataTests(TestCase):
+
+    def generate(self, **options):
+        defaults = {'medicines': 30, 'customers': 20, 'cashiers': 2, 'sales': 60,
+                    'days': 7, 'seed': 7, 'workers': 1, 'batch_size': 25}
+        defaults.update(options)
+        call_command('generate_load_data', stdout=StringIO(), **defaults)
+        return list(
+            Sale.objects.order_by('id')
+            .values_list('created_at', 'final_amount', 'payment_method')
+        )
+
+    def test_generates_sales_in_id_order(self):
+        sales = self.generate()
+        self.assertEqual(len(sales), 60)
+        self.assertEqual(Product.objects.count(), 30)
+        self.assertGreaterEqual(Medicine.objects.count(), 30)
+        self.assertTrue(SaleItem.objects.exists())
+        times = [created_at for created_at, _, _ in sales]
+        self.assertEqual(times, sorted(times))
+
+    def test_same_seed_gives_same_sales(self):
+        first = self.generate()
+        SaleItem.objects.all().delete()
+        Sale.objects.all().delete()
+        Product.objects.all().delete()
+        Customer.objects.all().delete()
+        second = self.generate()
+        self.assertEqual([row[1:] for row in first], [row[1:] for row in second])
+
+
+class QueryBudgetTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        seed_dataset('small')
+        cls.user = User.objects.create_user('benchmark')
+
+    def setUp(self):
+        cache.clear()
+        receipt_cache.clear()
+
+    def test_views_stay_within_query_budgets(self):
+        results = run_scenarios(self.user, build_scenarios(), iterations=2)
+        self.assertEqual(check_budgets(results, load_budgets()), [])
+
+    def test_check_budgets_reports_regressions(self):
+        results = {'dashboard': {'queries': 9}, 'new_view': {'queries': 1}}
+        self.assertEqual(check_budgets(results, {'dashboard': 6}), [
+            'dashboard: 9 queries, budget is 6',
+            'new_view: no query budget',
+        ])
+
+
+class MetricsTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.cashier = User.objects.create_user('cashier', password='secret')
+        cls.admin = User.objects.create_user('admin', password='secret', is_staff=True)
+
+    def setUp(self):
+        registry.reset()
+
+    def test_requests_are_recorded_per_view(self):
+        self.client.force_login(self.cashier)
+        self.client.get(reverse('pharmacy:dashboard'))
+        self.client.get(reverse('pharmacy:dashboard'))
+
+        stats = registry.collect()['pharmacy:dashboard']
+        self.assertEqual(stats.statuses, {200: 2})
+        self.assertEqual(stats.latency.count, 2)
+        self.assertGreater(stats.queries.sum, 0)
+        self.assertGreater(stats.size.sum, 0)
+
+    def test_metrics_endpoint_is_staff_only(self):
+        self.client.force_login(self.cashier)
+        self.client.get(reverse('pharmacy:dashboard'))
+        response = self.client.get(reverse('pharmacy:metrics'))
+        self.assertEqual(response.status_code, 302)
+
+        self.client.force_login(self.admin)
+        response = self.client.get(reverse('pharmacy:metrics'))
+        self.assertEqual(response.status_code, 200)
+        body = response.content.decode()
+        self.assertIn('pharmacy_http_requests_total{view="pharmacy:dashboard",status="200"} 1', body)
+        self.assertIn('pharmacy_http_request_duration_seconds_bucket{view="pharmacy:dashboard",le="+Inf"} 1', body)
+
+    def test_shards_of_finished_threads_are_kept(self):
+        metrics = MetricsRegistry()
+
+        def serve():
+            for _ in range(100):
+                metrics.record('pharmacy:dashboard', 200, 0.01, 512, 3, 0.001)
+
+        threads = [threading.Thread(target=serve) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        metrics.record('pharmacy:dashboard', 500, 0.2, None, 1, 0.0)
+
+        stats = metrics.collect()['pharmacy:dashboard']
+        self.assertEqual(stats.statuses, {200: 400, 500: 1})
+        self.assertEqual(stats.queries.sum, 1201)
+        self.assertEqual(stats.size.count, 400)
+        self.assertEqual(len(metrics._shards), 1)
+
+
+class SQLiteTuningTests(TestCase):
+
+    def pragma(self, name):
+        with connection.cursor() as cursor:
+            cursor.execute(f'PRAGMA {name}')
+            return cursor.fetchone()[0]
+
+    def test_connection_is_tuned(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('SQLite only')
+        self.assertEqual(self.pragma('busy_timeout'), 5000)
+        self.assertEqual(self.pragma('synchronous'), 1)
+        self.assertEqual(self.pragma('cache_size'), -20000)
+
+    def test_environment_overrides(self):
+        pragmas = sqlite_pragmas({'PHARMACY_SQLITE_BUSY_TIMEOUT': '250',
+                                  'PHARMACY_SQLITE_MMAP_SIZE': ''})
+        self.assertEqual(pragmas['busy_timeout'], '250')
+        self.assertNotIn('mmap_size', pragmas)
+        self.assertEqual(sqlite_pragmas({'PHARMACY_SQLITE_TUNING': 'off'}), {})
+        self.assertEqual(sqlite_pragmas({}, journal_mode='delete')['journal_mode'], 'delete')
+
+    def test_invalid_pragma_value_is_rejected(self):
+        with self.assertRaises(ImproperlyConfigured):
+            apply_pragmas(connection, {'busy_timeout': '1; DROP TABLE pharmacy_sale'})
+
+
+class SQLiteTransactionTests(TransactionTestCase):
+
+    def begins(self, atomic):
+        with CaptureQueriesContext(connection) as queries, atomic():
+            Sale.objects.exists()
+        return [query['sql'] for query in queries if query['sql'].startswith('BEGIN')]
+
+    def test_writes_begin_immediate_and_backups_deferred(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('SQLite only')
+        self.assertEqual(self.begins(transaction.atomic), ['BEGIN IMMEDIATE'])
+        self.assertEqual(self.begins(read_transaction), ['BEGIN'])
+        self.assertEqual(connection.transaction_mode, 'IMMEDIATE')
+
+
+class ReceiptTests(PharmacyTestMixin, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.cashier = User.objects.create_user('cashier', password='secret')
+        supplier = cls.make_supplier()
+        cls.medicines = [
+            cls.make_medicine(supplier, name=f'Medicine {i}', batch_number=f'R{i:03d}')
+            for i in range(5)
+        ]
+
+    def setUp(self):
+        receipt_cache.clear()
+        self.client.force_login(self.cashier)
+
+    def checkout(self):
+        return process_checkout(self.cashier, [
+            {'product_id': medicine.product_id, 'quantity': 1} for medicine in self.medicines
+        ])
+
+    def test_receipt_is_rendered_with_two_queries(self):
+        sale = self.checkout()
+        url = reverse('pharmacy:print_receipt', args=[sale.id])
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertContains(response, 'Medicine 4')
+        # Session and user, the sale with customer and cashier, the items with their medicines.
+        self.assertEqual(len(queries), 4)
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.get(url).content, response.content)
+        self.assertEqual(len(queries), 2)
+
+    def test_checkout_warms_the_cache(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            sale = self.checkout()
+        with self.assertNumQueries(0):
+            html = receipt_cache.get(sale.id)
+        self.assertIn('Medicine 0', html)
+
+    def test_editing_a_sale_drops_its_receipt(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            sale = self.checkout()
+        with self.captureOnCommitCallbacks(execute=True):
+            sale.payment_method = 'card'
+            sale.save()
+        self.assertIsNone(receipt_cache.get(sale.id))
+
+    def test_disk_tier_is_size_bounded(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            receipts = ReceiptCache(directory=tmp, max_bytes=1000, memory_size=1)
+            for sale_id in range(10):
+                receipts.set(sale_id, 'x' * 300)
+            self.assertLessEqual(receipts._scan_size(), 1000)
+            self.assertEqual(receipts.get(9), 'x' * 300)
+            # Served from disk once the memory tier is dropped.
+            receipts.memory.invalidate()
+            self.assertEqual(receipts.get(9), 'x' * 300)
+
+
+class GroupCommitTests(PharmacyTestMixin, TransactionTestCase):
+    """The writer thread needs committed data, so these tests do not run in a transaction."""
+
+    def setUp(self):
+        self.cashier = User.objects.create_user('cashier', password='secret')
+        supplier = self.make_supplier()
+        self.medicines = [
+            self.make_medicine(supplier, name=f'Medicine {i}', stock=10, price='2.00',
+                               batch_number=f'G{i:03d}')
+            for i in range(3)
+        ]
+        self.writer = CheckoutWriter()
+        self.addCleanup(self.writer.stop)
+
+    def order(self, medicine, quantity):
+        return Order(self.cashier, parse_cart([{'product_id': medicine.product_id, 'quantity': quantity}]))
+
+    def test_group_is_written_in_order_and_failures_stay_alone(self):
+        orders = [self.order(self.medicines[0], 6), self.order(self.medicines[0], 6),
+                  self.order(self.medicines[1], 1), self.order(self.medicines[0], 4)]
+        active_index()
+        with transaction.atomic(), CaptureQueriesContext(connection) as queries:
+            results = record_sales(orders)
+        # Promotions version, batches, shortage names, sales, items, the two
+        # rollups and the stock update.
+        self.assertEqual(len(queries), 8)
+
+        self.assertIsInstance(results[1], CheckoutError)
+        self.assertEqual(results[1].errors[0]['error'], 'Only 4 of Medicine 0 in stock')
+        self.assertEqual([sale.final_amount for sale in results[::2]], [Decimal('12.00'), Decimal('2.00')])
+        self.assertEqual(results[3].items.get().quantity, 4)
+        self.medicines[0].refresh_from_db()
+        self.assertEqual(self.medicines[0].stock_quantity, 0)
+
+    def test_writer_resolves_each_caller(self):
+        futures = [
+            self.writer.submit(self.cashier, [{'product_id': medicine.product_id, 'quantity': 3}])
+            for medicine in self.medicines
+        ]
+        futures.append(self.writer.submit(self.cashier, [{'product_id': self.medicines[0].product_id,
+                                                          'quantity': 8}]))
+        sales = [future.result(timeout=10) for future in futures[:3]]
+        self.assertEqual(Sale.objects.count(), 3)
+        self.assertEqual({sale.pk for sale in sales}, set(Sale.objects.values_list('pk', flat=True)))
+        with self.assertRaises(CheckoutError):
+            futures[3].result(timeout=10)
+
+        with self.assertRaises(CheckoutError):
+            self.writer.submit(self.cashier, [])
+
+    async def test_async_create_sale_view(self):
+        self.addCleanup(checkout_writer.stop)
+        await self.async_client.aforce_login(self.cashier)
+        response = await self.async_client.post(
+            reverse('pharmacy:create_sale_async'),
+            data={'items': [{'product_id': self.medicines[2].product_id, 'quantity': 2}]},
+            content_type='application/json',
+        )
+        data = response.json()
+        self.assertTrue(data['success'])
+        self.assertEqual(await Sale.objects.filter(pk=data['sale_id']).acount(), 1)
+
+    def test_create_sale_page_posts_to_configured_path(self):
+        self.client.force_login(self.cashier)
+        with override_settings(CHECKOUT_GROUP_COMMIT=True):
+            response = self.client.get(reverse('pharmacy:create_sale'))
+        self.assertContains(response, reverse('pharmacy:create_sale_async'))
+
+
+class CatalogSyncTests(PharmacyTestMixin, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.cashier = User.objects.create_user('cashier', password='secret')
+        supplier = cls.make_supplier()
+        cls.medicines = [
+            cls.make_medicine(supplier, name=f'Medicine {i}', stock=10, price='2.00',
+                              batch_number=f'C{i:03d}')
+            for i in range(4)
+        ]
+        # Settle the catalog well before the watermark the tests sync from.
+        two_days_ago = timezone.now() - timedelta(days=2)
+        Product.objects.update(updated_at=two_days_ago)
+        Medicine.objects.update(updated_at=two_days_ago)
+
+    def setUp(self):
+        self.client.force_login(self.cashier)
+
+    def sync(self, since=None, etag=None):
+        headers = {'If-None-Match': etag} if etag else {}
+        return self.client.get(reverse('pharmacy:catalog_sync'), {'since': since} if since else {},
+                               headers=headers)
+
+    def test_full_then_delta_then_not_modified(self):
+        response = self.sync()
+        data = response.json()
+        self.assertTrue(data['full'])
+        self.assertEqual(len(data['products']), 4)
+        self.assertEqual(data['products'][0], {
+            'id': self.medicines[0].product_id, 'name': 'Medicine 0', 'generic_name': 'Acetaminophen',
+            'manufacturer': 'PharmaCorp', 'price': '2.00', 'stock': 10,
+        })
+
+        process_checkout(self.cashier, [{'product_id': self.medicines[1].product_id, 'quantity': 3}])
+        response = self.sync(data['watermark'])
+        delta = response.json()
+        self.assertFalse(delta['full'])
+        self.assertEqual([(p['id'], p['stock']) for p in delta['products']],
+                         [(self.medicines[1].product_id, 7)])
+
+        response = self.sync(data['watermark'], etag=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_deletes_and_expiries_are_sent(self):
+        watermark = catalog_delta()['watermark']
+        self.medicines[0].product.delete()
+        self.medicines[1].delete()
+        delta = catalog_delta(datetime.fromisoformat(watermark))
+        self.assertEqual(delta['deleted'], [self.medicines[0].product_id])
+        self.assertEqual([(p['id'], p['stock'], p['price']) for p in delta['products']],
+                         [(self.medicines[1].product_id, 0, None)])
+        self.assertEqual(CatalogTombstone.objects.count(), 3)
+
+        Medicine.objects.filter(pk=self.medicines[2].pk).update(
+            expiry_date=date.today() - timedelta(days=1), updated_at=timezone.now() - timedelta(days=3),
+        )
+        delta = catalog_delta(timezone.now() - timedelta(days=2))
+        self.assertIn((self.medicines[2].product_id, 0), [(p['id'], p['stock']) for p in delta['products']])
+
+    def test_old_or_invalid_watermark(self):
+        self.assertTrue(catalog_delta(timezone.now() - timedelta(days=90))['full'])
+        self.assertEqual(self.sync('yesterday').status_code, 400)
+
+
+class SalesRollupTests(PharmacyTestMixin, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.cashier = User.objects.create_user('rollup_cashier')
+        cls.supplier = cls.make_supplier()
+        cls.medicines = [
+            cls.make_medicine(cls.supplier, name=f'Rollup {i}', price='4.00', batch_number=f'R{i}',
+                              category=category)
+            for i, category in enumerate(['tablet', 'syrup'])
+        ]
+
+    def rollups(self):
+        return (
+            list(DailyMedicineSales.objects.order_by('medicine')
+                 .values_list('date', 'medicine', 'quantity', 'revenue', 'cost')),
+            list(DailyCashierSales.objects.order_by('payment_method')
+                 .values_list('date', 'cashier', 'payment_method', 'sale_count', 'quantity',
+                              'revenue', 'cost')),
+        )
+
+    def test_checkout_adds_to_rollups(self):
+        first, second = self.medicines
+        process_checkout(self.cashier, [{'product_id': first.product_id, 'quantity': 2}])
+        process_checkout(self.cashier, [{'product_id': first.product_id, 'quantity': 1},
+                                        {'product_id': second.product_id, 'quantity': 3}],
+                         discount=50, payment_method='card')
+
+        today = timezone.localdate()
+        medicine_rows, cashier_rows = self.rollups()
+        self.assertEqual(medicine_rows, [
+            (today, first.id, 3, Decimal('12.00'), Decimal('15.00')),
+            (today, second.id, 3, Decimal('12.00'), Decimal('15.00')),
+        ])
+        self.assertEqual(cashier_rows, [
+            (today, self.cashier.id, 'card', 1, 4, Decimal('8.00'), Decimal('20.00')),
+            (today, self.cashier.id, 'cash', 1, 2, Decimal('8.00'), Decimal('10.00')),
+        ])
+
+    def test_rebuild_matches_incremental_rollups(self):
+        process_checkout(self.cashier, [{'product_id': self.medicines[0].product_id, 'quantity': 2}])
+        sale = Sale.objects.create(cashier=self.cashier, total_amount=4, final_amount=4)
+        SaleItem.objects.create(sale=sale, medicine=self.medicines[1], quantity=1,
+                                unit_price=Decimal('4.00'), total_price=Decimal('4.00'))
+        incremental = self.rollups()
+
+        DailyCashierSales.objects.update(sale_count=0)
+        call_command('rebuild_rollups', stdout=StringIO())
+        self.assertEqual(self.rollups(), incremental)
+
+    def test_report_reads_rollups(self):
+        for _ in range(3):
+            process_checkout(self.cashier, [{'product_id': self.medicines[1].product_id, 'quantity': 1}])
+        self.client.force_login(self.cashier)
+
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.get(reverse('pharmacy:sales_report'))
+        self.assertFalse(any('pharmacy_saleitem' in q['sql'] for q in captured.captured_queries))
+        self.assertEqual(response.context['totals']['sale_count'], 3)
+        self.assertEqual([(c['name'], c['quantity']) for c in response.context['categories']],
+                         [('Syrup', 3)])
+        self.assertEqual(response.context['products'][0]['revenue'], Decimal('12.00'))
+
+
+class StockAlertTests(PharmacyTestMixin, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.cashier = User.objects.create_user('alert_cashier')
+        supplier = cls.make_supplier()
+        cls.plenty = cls.make_medicine(supplier, name='Plenty', stock=100)
+        cls.scarce = cls.make_medicine(supplier, name='Scarce', stock=11, minimum_stock=10)
+        cls.later = cls.make_medicine(supplier, name='Later', stock=100,
+                                      expiry_date=date.today() + timedelta(days=32))
+        Medicine.objects.update(updated_at=timezone.now() - timedelta(days=1))
+
+    def open_alerts(self):
+        return sorted(StockAlert.objects.filter(resolved_at__isnull=True).values_list('medicine', 'kind'))
+
+    def test_scan_follows_stock_changes(self):
+        self.assertEqual(scan_alerts().checked, 3)
+        self.assertEqual(self.open_alerts(), [])
+        self.assertEqual(scan_alerts().checked, 0)
+
+        process_checkout(self.cashier, [{'product_id': self.scarce.product_id, 'quantity': 5}])
+        run = scan_alerts()
+        self.assertEqual((run.checked, run.opened), (1, 1))
+        self.assertEqual(self.open_alerts(), [(self.scarce.id, StockAlert.LOW_STOCK)])
+
+        self.scarce.refresh_from_db()
+        self.scarce.stock_quantity = 50
+        self.scarce.save(update_fields=['stock_quantity'])
+        self.assertEqual(scan_alerts().resolved, 1)
+        self.assertEqual(self.open_alerts(), [])
+
+    def test_scan_picks_up_expiry_horizon_by_date(self):
+        scan_alerts()
+        run = scan_alerts(now=timezone.now() + timedelta(days=3))
+        self.assertEqual(run.checked, 1)
+        self.assertEqual(self.open_alerts(), [(self.later.id, StockAlert.EXPIRING)])
+
+        run = scan_alerts(now=timezone.now() + timedelta(days=400))
+        self.assertEqual(run.checked, 3)
+        self.assertEqual(run.resolved, 1)
+        self.assertEqual(
+            self.open_alerts(),
+            sorted((m.id, StockAlert.EXPIRED) for m in (self.plenty, self.scarce, self.later)),
+        )
+
+    def test_scan_alerts_command(self):
+        out = StringIO()
+        call_command('scan_alerts', stdout=out)
+        self.assertIn('Checked 3 batches', out.getvalue())
+
+
+class StockImportTests(PharmacyTestMixin, TestCase):
+
+    HEADER = 'name,batch_number,quantity,purchase_price,selling_price,expiry_date,category\n'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('importer', password='secret')
+        cls.supplier = cls.make_supplier()
+        cls.medicine = cls.make_medicine(cls.supplier, stock=20)
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.dir = tmp.name
+        settings = override_settings(IMPORT_DIR=self.dir)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def write_csv(self, *lines):
+        path = f'{self.dir}/stock.csv'
+        with open(path, 'w') as f:
+            f.write(self.HEADER + ''.join(line + '\n' for line in lines))
+        return path
+
+    def test_import_creates_and_updates_batches(self):
+        path = self.write_csv(
+            'Paracetamol 500mg,PAR001,5,,9.00,,',
+            'Paracetamol 500mg,PAR002,30,4.00,8.00,2030-01-31,',
+            'Cough Syrup,CS1,3,2.00,6.50,2030-06-30,syrup',
+            'Paracetamol 500mg,PAR001,2,,,,',
+            'Cough Syrup,CS2,3,2.00,6.50,,syrup',
+            'Cough Syrup,CS3,x,2.00,6.50,2030-06-30,syrup',
+        )
+        # Leaves needs_reorder stale; the import recomputes it.
+        Medicine.objects.filter(pk=self.medicine.pk).update(minimum_stock=30)
+        out = StringIO()
+        call_command('import_stock', path, supplier='MediCore', chunk_size=4, stdout=out)
+
+        self.medicine.refresh_from_db()
+        self.assertEqual(self.medicine.stock_quantity, 27)
+        self.assertEqual(self.medicine.selling_price, Decimal('9.00'))
+        self.assertEqual(self.medicine.purchase_price, Decimal('5.00'))
+        self.assertTrue(self.medicine.needs_reorder)
+        new = Medicine.objects.get(product=self.medicine.product, batch_number='PAR002')
+        self.assertEqual((new.stock_quantity, new.expiry_date, new.supplier), (30, date(2030, 1, 31), self.supplier))
+        syrup = Medicine.objects.get(product__name='Cough Syrup')
+        self.assertEqual((syrup.product.category, syrup.stock_quantity, syrup.needs_reorder), ('syrup', 3, True))
+
+        job = ImportJob.objects.get()
+        self.assertEqual((job.status, job.lines_done, job.created, job.updated, job.skipped),
+                         (ImportJob.DONE, 6, 2, 1, 2))
+        self.assertEqual([error['line'] for error in job.line_errors], [7, 6])
+        self.assertIn('4 lines: 2 new batches, 1 updated, 0 skipped', out.getvalue())
+        self.assertIn('Line 6: New batch needs expiry_date', out.getvalue())
+
+    def test_failed_import_resumes_after_last_chunk(self):
+        path = self.write_csv(*['Paracetamol 500mg,PAR001,1,,,,'] * 5)
+        job = ImportJob.objects.create(path=path)
+        calls = []
+
+        def fail_second_chunk(rows, *args, **kwargs):
+            calls.append(rows)
+            if len(calls) == 2:
+                raise RuntimeError('disk full')
+            return import_chunk(rows, *args, **kwargs)
+
+        with patch('pharmacy.imports.import_chunk', fail_second_chunk):
+            with self.assertRaises(StockImportError):
+                run_import(job, chunk_size=2)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.lines_done, job.error), (ImportJob.FAILED, 2, 'disk full'))
+        self.medicine.refresh_from_db()
+        self.assertEqual(self.medicine.stock_quantity, 22)
+
+        run_import(job, chunk_size=2)
+        self.medicine.refresh_from_db()
+        self.assertEqual(self.medicine.stock_quantity, 25)
+        self.assertEqual((job.status, job.lines_done, job.updated), (ImportJob.DONE, 5, 3))
+
+    def test_upload_view(self):
+        self.client.login(username='importer', password='secret')
+        upload = SimpleUploadedFile('delivery.csv', (self.HEADER + 'Paracetamol 500mg,PAR001,10,,,,\n').encode())
+        response = self.client.post(reverse('pharmacy:import_stock'), {'file': upload})
+        self.assertRedirects(response, reverse('pharmacy:import_stock'))
+
+        job = ImportJob.objects.get()
+        self.assertEqual((job.original_name, job.created_by, job.status), ('delivery.csv', self.user, ImportJob.DONE))
+        self.assertTrue(job.path.startswith(self.dir))
+        self.medicine.refresh_from_db()
+        self.assertEqual(self.medicine.stock_quantity, 30)
+        self.assertContains(self.client.get(reverse('pharmacy:import_stock')), 'delivery.csv')
+
+
+class AdminQueryTests(PharmacyTestMixin, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('boss', password='secret')
+        cls.supplier = cls.make_supplier()
+        cls.medicine = cls.make_medicine(cls.supplier, stock=1000)
+        cls.add_sales(2)
+
+    @classmethod
+    def add_sales(cls, count):
+        customer = Customer.objects.create(name='Alice', phone=f'555-{Customer.objects.count():04}')
+        cashier = User.objects.create_user(f'cashier{User.objects.count()}')
+        for _ in range(count):
+            sale = Sale.objects.create(cashier=cashier, customer=customer,
+                                       total_amount=Decimal('8.50'), final_amount=Decimal('8.50'))
+            SaleItem.objects.create(sale=sale, medicine=cls.medicine, quantity=1,
+                                    unit_price=Decimal('8.50'), total_price=Decimal('8.50'))
+        cls.make_medicine(cls.supplier, name=f'Extra {Medicine.objects.count()}')
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_changelists_run_a_fixed_number_of_queries(self):
+        urls = [
+            reverse('admin:pharmacy_sale_changelist'),
+            reverse('admin:pharmacy_saleitem_changelist'),
+            reverse('admin:pharmacy_saleitem_changelist') + '?q=Paracetamol',
+            reverse('admin:pharmacy_medicine_changelist'),
+            reverse('admin:pharmacy_product_changelist'),
+        ]
+        before = [self.count_queries(url) for url in urls]
+        self.add_sales(10)
+        self.assertEqual([self.count_queries(url) for url in urls], before)
+
+    def test_item_search_matches_product_or_sale(self):
+        sale = Sale.objects.order_by('id').first()
+        url = reverse('admin:pharmacy_saleitem_changelist')
+        response = self.client.get(url, {'q': 'paracetamol'})
+        self.assertEqual(response.context['cl'].result_count, 2)
+        response = self.client.get(url, {'q': str(sale.id)})
+        self.assertEqual([item.sale_id for item in response.context['cl'].result_list], [sale.id])
+
+    def test_indexed_dates_match_distinct_dates(self):
+        self.add_sales(6)
+        start = timezone.now() - timedelta(days=400)
+        for i, sale in enumerate(Sale.objects.order_by('id')):
+            Sale.objects.filter(pk=sale.pk).update(created_at=start + timedelta(days=45 * i))
+        sales = IndexedDatesQuerySet(Sale)
+        for kind in ('year', 'month', 'day'):
+            self.assertEqual(list(sales.datetimes('created_at', kind)),
+                             list(Sale.objects.datetimes('created_at', kind)))
+        self.assertEqual(list(IndexedDatesQuerySet(Medicine).dates('expiry_date', 'month', 'DESC')),
+                         list(Medicine.objects.dates('expiry_date', 'month', 'DESC')))
+
+
+class BranchTests(PharmacyTestMixin, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.cashier = User.objects.create_user('cashier', password='secret')
+        cls.north = Branch.objects.create(code='north', name='North')
+        supplier = cls.make_supplier()
+        cls.main_batch = cls.make_medicine(supplier, stock=10, batch_number='MAIN')
+        cls.north_batch = cls.make_medicine(supplier, stock=3, batch_number='NORTH', branch=cls.north)
+        cls.make_medicine(supplier, name='Paracetamol Syrup', stock=8, batch_number='MAINONLY')
+
+    def setUp(self):
+        forget_branches()
+        self.addCleanup(forget_branches)
+        typeahead_cache.invalidate()
+
+    def test_checkout_sells_the_branch_stock(self):
+        product_id = self.main_batch.product_id
+        with override_settings(PHARMACY_BRANCH='north'):
+            self.assertEqual(search_products('paracetamol')[0].stock, 3)
+            sale = process_checkout(self.cashier, [{'product_id': product_id, 'quantity': 2}])
+            self.assertEqual((sale.branch, sale.items.get().medicine), (self.north, self.north_batch))
+            with self.assertRaises(CheckoutError):
+                process_checkout(self.cashier, [{'product_id': product_id, 'quantity': 2}])
+
+        sale = process_checkout(self.cashier, [{'product_id': product_id, 'quantity': 5}])
+        self.assertEqual((sale.branch, sale.items.get().medicine), (None, self.main_batch))
+
+        self.client.force_login(self.cashier)
+        response = self.client.get(reverse('pharmacy:sales_history'), {'branch': self.north.id})
+        self.assertEqual(response.context['totals']['sale_count'], 1)
+
+    def test_search_and_typeahead_offer_the_branch_stock_only(self):
+        self.client.force_login(self.cashier)
+        with override_settings(PHARMACY_BRANCH='north'):
+            products = search_products('paracetamol', in_stock=True)
+            self.assertEqual([(product.id, product.stock) for product in products],
+                             [(self.north_batch.product_id, 3)])
+            response = self.client.get(reverse('pharmacy:medicine_typeahead'), {'q': 'parac'})
+            self.assertEqual([result['id'] for result in response.json()['results']],
+                             [self.north_batch.product_id])
+        self.assertEqual(len(search_products('paracetamol', in_stock=True)), 2)
+
+    def test_stock_and_sales_figures_are_the_branch_s(self):
+        cache.clear()
+        scan_alerts()
+        process_checkout(self.cashier, [{'product_id': self.main_batch.product_id, 'quantity': 2}])
+        main = get_dashboard_stats()
+        with override_settings(PHARMACY_BRANCH='north'):
+            north = get_dashboard_stats()
+            statistics = collect_statistics()
+        self.assertEqual((main['total_medicines'], north['total_medicines']), (2, 2))
+        self.assertEqual([m.batch_number for m in main['low_stock_medicines']], ['MAIN', 'MAINONLY'])
+        self.assertEqual(north['low_stock_medicines'], [self.north_batch])
+        self.assertEqual((main['today_sales'], north['today_sales']), (1, 0))
+        self.assertEqual(statistics['medicines']['batches'], 1)
+        self.assertEqual(statistics['medicines']['inventory_value'], Decimal('25.50'))
+        self.assertEqual(statistics['sales']['total'], 0)
+
+    def test_new_branch_is_created_on_first_use(self):
+        with override_settings(PHARMACY_BRANCH='south'):
+            branch = current_branch()
+            self.assertEqual((branch.code, branch.name), ('south', 'south'))
+            with self.assertNumQueries(0):
+                current_branch()
+
+
+class ReplicaTests(PharmacyTestMixin, TransactionTestCase):
+    """The replica is a second SQLite file, brought up to date by copying the primary."""
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        self.cashier = User.objects.create_user('cashier', password='secret')
+        self.medicine = self.make_medicine(self.make_supplier())
+        settings = override_settings(PHARMACY_READ_REPLICAS=['replica'], PHARMACY_REPLICA_MAX_LAG=60)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def sell(self):
+        return process_checkout(self.cashier, [{'product_id': self.medicine.product_id, 'quantity': 1}])
+
+    def test_reporting_reads_use_an_up_to_date_replica(self):
+        self.assertEqual(reporting_database(), 'default')
+        self.sell()
+        call_command('refresh_replicas', stdout=StringIO())
+        self.assertEqual(reporting_database(), 'replica')
+
+        # Within the allowed lag the replica is still used, and misses the new sale.
+        self.sell()
+        with reads_from(reporting_database()):
+            self.assertEqual(Sale.objects.count(), 1)
+        out = StringIO()
+        call_command('manage_pharmacy', action='stats', json=True, stdout=out)
+        self.assertEqual(json.loads(out.getvalue())['sales']['total'], 1)
+
+        # Too far behind, everything reads the primary.
+        Sale.objects.filter(pk=self.sell().pk).update(created_at=timezone.now() + timedelta(minutes=5))
+        self.assertEqual(reporting_database(), 'default')
+
+    def test_sales_history_reads_primary_after_a_write(self):
+        self.client.force_login(self.cashier)
+        self.sell()
+        call_command('refresh_replicas', stdout=StringIO())
+        response = self.client.post(
+            reverse('pharmacy:create_sale'),
+            data=json.dumps({'items': [{'product_id': self.medicine.product_id, 'quantity': 1}]}),
+            content_type='application/json',
+        )
+        self.assertIn(PIN_COOKIE, response.cookies)
+        response = self.client.get(reverse('pharmacy:sales_history'))
+        self.assertEqual(response.context['totals']['sale_count'], 2)
+
+        self.client.cookies.pop(PIN_COOKIE)
+        response = self.client.get(reverse('pharmacy:sales_history'))
+        self.assertEqual(response.context['totals']['sale_count'], 1)
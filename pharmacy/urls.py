@@ -8,7 +8,17 @@ urlpatterns = [
     path('add-medicine/', views.add_medicine, name='add_medicine'),
     path('search-medicine/', views.search_medicine, name='search_medicine'),
     path('create-sale/', views.create_sale, name='create_sale'),
+    path('create-sale/async/', views.create_sale_async, name='create_sale_async'),
     path('receipt/<int:sale_id>/', views.print_receipt, name='print_receipt'),
     path('sales-history/', views.sales_history, name='sales_history'),
+    path('sales-history/export/<str:fmt>/', views.export_sales, name='export_sales'),
+    path('reports/sales/', views.sales_report, name='sales_report'),
+    path('imports/', views.import_stock, name='import_stock'),
+    path('imports/<int:job_id>/resume/', views.resume_import, name='resume_import'),
     path('api/medicine/<int:medicine_id>/', views.get_medicine_details, name='medicine_details'),
+    path('api/medicines/', views.medicine_details_batch, name='medicine_details_batch'),
+    path('api/medicines/search/', views.medicine_typeahead, name='medicine_typeahead'),
+    path('api/customers/', views.customer_lookup, name='customer_lookup'),
+    path('api/catalog/sync/', views.catalog_sync, name='catalog_sync'),
+    path('metrics', views.metrics, name='metrics'),
 ]
\ No newline at end of file
@@ -1,48 +1,52 @@
+from django.conf import settings
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
-from django.http import JsonResponse, HttpResponse
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import Http404, JsonResponse, HttpResponse, StreamingHttpResponse
+from django.urls import reverse
+from django.utils.cache import get_conditional_response, patch_cache_control, set_response_etag
+from django.utils.dateparse import parse_datetime
+from django.utils.http import http_date
 from django.contrib import messages
-from django.db.models import Q, Sum, Count
+from django.db.models import Count, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
 from django.utils import timezone
-from decimal import Decimal
+from datetime import timedelta
 import json
 
-from .models import Medicine, Customer, Sale, SaleItem, Supplier
-from .forms import MedicineForm, CustomerForm, SaleForm, SupplierForm, MedicineSearchForm
+from .models import ImportJob, Product, Sale, SaleItem
+from .forms import (
+    MedicineForm, CustomerForm, MedicineSearchForm, SalesHistoryFilterForm,
+    SalesReportForm, StockImportForm,
+)
+from .branches import current_branch
+from .checkout import CheckoutError, process_checkout
+from .customers import CUSTOMER_LOOKUP_LIMIT, CUSTOMER_LOOKUP_MAX_LIMIT, customer_data, lookup as lookup_customers
+from .exports import FORMATS as EXPORT_FORMATS, export_lines, filter_sales
+from .imports import StockImportError, run_import, save_upload
+from .search import (
+    SEARCH_RESULT_LIMIT, TYPEAHEAD_LIMIT, TYPEAHEAD_MAX_LIMIT, search_products, typeahead, with_stock,
+)
+from .medicines import details as medicine_details, parse_ids as parse_medicine_ids, product_details
+from .metrics import render as render_metrics
+from .pagination import keyset_page
+from .receipts import receipt_html
+from .routers import replica_reads, request_database
+from . import rollups
+from .stats import get_dashboard_stats
+from .sync import catalog_delta
+from .writer import checkout_writer
 
 @login_required
 def dashboard(request):
-    # Statistics for dashboard
-    total_medicines = Medicine.objects.count()
-    low_stock_count = Medicine.objects.filter(stock_quantity__lte=models.F('minimum_stock')).count()
-    expired_count = Medicine.objects.filter(expiry_date__lt=timezone.now().date()).count()
-    today_sales = Sale.objects.filter(created_at__date=timezone.now().date()).count()
-    today_revenue = Sale.objects.filter(
-        created_at__date=timezone.now().date()
-    ).aggregate(total=Sum('final_amount'))['total'] or 0
-
-    low_stock_medicines = Medicine.objects.filter(
-        stock_quantity__lte=models.F('minimum_stock')
-    )[:5]
-    
-    recent_sales = Sale.objects.order_by('-created_at')[:5]
-
-    context = {
-        'total_medicines': total_medicines,
-        'low_stock_count': low_stock_count,
-        'expired_count': expired_count,
-        'today_sales': today_sales,
-        'today_revenue': today_revenue,
-        'low_stock_medicines': low_stock_medicines,
-        'recent_sales': recent_sales,
-    }
-    return render(request, 'pharmacy/dashboard.html', context)
+    return render(request, 'pharmacy/dashboard.html', get_dashboard_stats())
 
 @login_required
 def add_medicine(request):
     if request.method == 'POST':
         form = MedicineForm(request.POST)
         if form.is_valid():
+            form.instance.branch = current_branch()
             form.save()
             messages.success(request, 'Medicine added successfully!')
             return redirect('pharmacy:add_medicine')
@@ -54,25 +58,24 @@ def add_medicine(request):
 @login_required
 def search_medicine(request):
     form = MedicineSearchForm()
-    medicines = Medicine.objects.all()
-    
-    if request.GET.get('query'):
-        query = request.GET.get('query')
-        medicines = medicines.filter(
-            Q(name__icontains=query) |
-            Q(generic_name__icontains=query) |
-            Q(manufacturer__icontains=query)
-        )
-    
-    if request.GET.get('category'):
-        category = request.GET.get('category')
-        medicines = medicines.filter(category=category)
-    
+    query = request.GET.get('query', '').strip()
+    category = request.GET.get('category', '')
+
+    if query:
+        products = search_products(query, category=category or None)
+    else:
+        products = Product.objects.order_by('name')
+        if category:
+            products = products.filter(category=category)
+        products = list(with_stock(products[:SEARCH_RESULT_LIMIT]))
+
     context = {
         'form': form,
-        'medicines': medicines,
-        'query': request.GET.get('query', ''),
-        'selected_category': request.GET.get('category', ''),
+        'products': products,
+        'query': query,
+        'selected_category': category,
+        'result_limit': SEARCH_RESULT_LIMIT,
+        'is_truncated': len(products) >= SEARCH_RESULT_LIMIT,
     }
     return render(request, 'pharmacy/search_medicine.html', context)
 
@@ -81,88 +84,276 @@ def create_sale(request):
     if request.method == 'POST':
         try:
             data = json.loads(request.body)
-            items = data.get('items', [])
-            customer_id = data.get('customer_id')
-            discount = Decimal(str(data.get('discount', 0)))
-            tax = Decimal(str(data.get('tax', 0)))
-            payment_method = data.get('payment_method', 'cash')
-
-            if not items:
-                return JsonResponse({'success': False, 'error': 'No items in cart'})
-
-            # Calculate total
-            total_amount = Decimal('0')
-            for item in items:
-                total_amount += Decimal(str(item['total']))
-
-            # Calculate final amount
-            discount_amount = (total_amount * discount) / 100
-            tax_amount = ((total_amount - discount_amount) * tax) / 100
-            final_amount = total_amount - discount_amount + tax_amount
-
-            # Create sale
-            customer = None
-            if customer_id:
-                customer = Customer.objects.get(id=customer_id)
-
-            sale = Sale.objects.create(
-                customer=customer,
-                cashier=request.user,
-                total_amount=total_amount,
-                discount=discount,
-                tax=tax,
-                final_amount=final_amount,
-                payment_method=payment_method
+        except ValueError:
+            return JsonResponse({'success': False, 'error': 'Invalid request body'}, status=400)
+        if not isinstance(data, dict):
+            return JsonResponse({'success': False, 'error': 'Invalid request body'}, status=400)
+
+        try:
+            sale = process_checkout(
+                request.user,
+                data.get('items', []),
+                customer_id=data.get('customer_id'),
+                discount=data.get('discount', 0),
+                tax=data.get('tax', 0),
+                payment_method=data.get('payment_method', 'cash'),
             )
+        except CheckoutError as e:
+            return JsonResponse({'success': False, 'error': str(e), 'errors': e.errors})
 
-            # Create sale items
-            for item in items:
-                medicine = Medicine.objects.get(id=item['medicine_id'])
-                SaleItem.objects.create(
-                    sale=sale,
-                    medicine=medicine,
-                    quantity=item['quantity'],
-                    unit_price=Decimal(str(item['price'])),
-                    total_price=Decimal(str(item['total']))
-                )
-
-            return JsonResponse({
-                'success': True,
-                'sale_id': sale.id,
-                'message': 'Sale completed successfully!'
-            })
-
-        except Exception as e:
-            return JsonResponse({'success': False, 'error': str(e)})
-
-    # GET request - show create sale page
-    customers = Customer.objects.all()
-    medicines = Medicine.objects.filter(stock_quantity__gt=0)
-    
+        return JsonResponse({
+            'success': True,
+            'sale_id': sale.id,
+            'message': 'Sale completed successfully!'
+        })
+
+    # GET request - show create sale page, medicines and customers are fetched as the cashier types
     context = {
-        'customers': customers,
-        'medicines': medicines,
+        'checkout_url': reverse(
+            'pharmacy:create_sale_async' if settings.CHECKOUT_GROUP_COMMIT else 'pharmacy:create_sale'
+        ),
     }
     return render(request, 'pharmacy/create_sale.html', context)
 
+@login_required
+async def create_sale_async(request):
+    if request.method != 'POST':
+        return JsonResponse({'success': False, 'error': 'POST required'}, status=405)
+    try:
+        data = json.loads(request.body)
+    except ValueError:
+        return JsonResponse({'success': False, 'error': 'Invalid request body'}, status=400)
+    if not isinstance(data, dict):
+        return JsonResponse({'success': False, 'error': 'Invalid request body'}, status=400)
+
+    try:
+        sale = await checkout_writer.checkout(
+            await request.auser(),
+            data.get('items', []),
+            customer_id=data.get('customer_id'),
+            discount=data.get('discount', 0),
+            tax=data.get('tax', 0),
+            payment_method=data.get('payment_method', 'cash'),
+        )
+    except CheckoutError as e:
+        return JsonResponse({'success': False, 'error': str(e), 'errors': e.errors})
+
+    return JsonResponse({
+        'success': True,
+        'sale_id': sale.id,
+        'message': 'Sale completed successfully!'
+    })
+
 @login_required
 def print_receipt(request, sale_id):
-    sale = get_object_or_404(Sale, id=sale_id)
-    context = {'sale': sale}
-    return render(request, 'pharmacy/receipt.html', context)
+    return HttpResponse(receipt_html(sale_id))
+
+SALES_HISTORY_PAGE_SIZE = 50
+
+def _filtered_sales(form, sales):
+    if form.is_valid():
+        sales = filter_sales(
+            sales,
+            start=form.cleaned_data['date_from'],
+            end=form.cleaned_data['date_to'],
+            cashier=form.cleaned_data['cashier'],
+            payment_method=form.cleaned_data['payment_method'],
+            branch=form.cleaned_data['branch'],
+        )
+    return sales
 
 @login_required
+@replica_reads
 def sales_history(request):
-    sales = Sale.objects.order_by('-created_at')
-    return render(request, 'pharmacy/sales_history.html', {'sales': sales})
+    form = SalesHistoryFilterForm(request.GET or None)
+    sales = _filtered_sales(form, Sale.objects.all())
+
+    totals = sales.aggregate(
+        sale_count=Count('id'),
+        total_amount=Sum('total_amount'),
+        final_amount=Sum('final_amount'),
+    )
+
+    # A correlated count per row keeps the page a walk along
+    # sale_created_id_idx; Count('items') would group the whole table.
+    item_count = (
+        SaleItem.objects.filter(sale=OuterRef('pk')).order_by()
+        .values('sale').annotate(count=Count('*')).values('count')
+    )
+    page, next_cursor = keyset_page(
+        sales.select_related('customer', 'cashier')
+        .annotate(item_count=Coalesce(Subquery(item_count), 0)),
+        cursor=request.GET.get('cursor'),
+        page_size=SALES_HISTORY_PAGE_SIZE,
+    )
+
+    filters = request.GET.copy()
+    filters.pop('cursor', None)
+
+    context = {
+        'form': form,
+        'sales': page,
+        'totals': totals,
+        'next_cursor': next_cursor,
+        'is_first_page': not request.GET.get('cursor'),
+        'filter_query': filters.urlencode(),
+    }
+    return render(request, 'pharmacy/sales_history.html', context)
 
 @login_required
-def get_medicine_details(request, medicine_id):
-    medicine = get_object_or_404(Medicine, id=medicine_id)
-    data = {
-        'id': medicine.id,
-        'name': medicine.name,
-        'price': str(medicine.selling_price),
-        'stock': medicine.stock_quantity,
+def export_sales(request, fmt):
+    if fmt not in EXPORT_FORMATS:
+        raise Http404('Unknown export format')
+    form = SalesHistoryFilterForm(request.GET or None)
+    if request.GET and not form.is_valid():
+        return JsonResponse({'errors': form.errors}, status=400)
+    # The rows are read as the response streams, after the view returns, so
+    # the queryset names its database rather than relying on replica_reads.
+    sales = Sale.objects.using(request_database(request))
+    response = StreamingHttpResponse(
+        export_lines(_filtered_sales(form, sales), fmt), content_type=EXPORT_FORMATS[fmt]
+    )
+    response['Content-Disposition'] = f'attachment; filename="sales.{fmt}"'
+    # Let a proxy pass chunks on as they come instead of buffering the export.
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+SALES_REPORT_DAYS = 30
+
+@login_required
+@replica_reads
+def sales_report(request):
+    form = SalesReportForm(request.GET or None)
+    end = timezone.localdate()
+    start = end - timedelta(days=SALES_REPORT_DAYS - 1)
+    if form.is_valid():
+        start = form.cleaned_data['date_from'] or start
+        end = form.cleaned_data['date_to'] or end
+
+    days = rollups.daily_totals(start, end)
+    context = {
+        'form': form,
+        'start': start,
+        'end': end,
+        'days': days,
+        'totals': {
+            field: sum(day[field] for day in days)
+            for field in ('sale_count', 'quantity', 'revenue', 'cost')
+        },
+        'categories': rollups.category_totals(start, end),
+        'products': rollups.product_totals(start, end),
+        'cashiers': rollups.cashier_totals(start, end),
     }
-    return JsonResponse(data)
\ No newline at end of file
+    return render(request, 'pharmacy/sales_report.html', context)
+
+RECENT_IMPORTS = 10
+
+def _run_import(request, job):
+    try:
+        run_import(job)
+    except StockImportError as e:
+        messages.warning(request, f'Import #{job.pk} stopped after {job.lines_done} lines: {e}')
+        return
+    messages.success(
+        request,
+        f'Import #{job.pk} done: {job.created} new batches, {job.updated} updated, {job.skipped} skipped.'
+    )
+
+@login_required
+def import_stock(request):
+    if request.method == 'POST':
+        form = StockImportForm(request.POST, request.FILES)
+        if form.is_valid():
+            job = save_upload(
+                form.cleaned_data['file'],
+                supplier=form.cleaned_data['supplier'],
+                created_by=request.user,
+            )
+            _run_import(request, job)
+            return redirect('pharmacy:import_stock')
+    else:
+        form = StockImportForm()
+
+    jobs = ImportJob.objects.select_related('supplier', 'created_by').order_by('-created_at')[:RECENT_IMPORTS]
+    return render(request, 'pharmacy/import_stock.html', {'form': form, 'jobs': jobs})
+
+@login_required
+def resume_import(request, job_id):
+    job = get_object_or_404(ImportJob, id=job_id)
+    if request.method == 'POST' and job.status == ImportJob.FAILED:
+        _run_import(request, job)
+    return redirect('pharmacy:import_stock')
+
+def _conditional_json(request, data, etag, last_modified):
+    response = JsonResponse(data)
+    response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified.timestamp())
+    patch_cache_control(response, private=True, no_cache=True)
+    return get_conditional_response(
+        request, etag=etag, last_modified=last_modified and int(last_modified.timestamp()),
+        response=response,
+    )
+
+@login_required
+def get_medicine_details(request, medicine_id):
+    found, _, etag, last_modified = medicine_details([medicine_id])
+    if medicine_id not in found:
+        raise Http404('No medicine matches the given query.')
+    return _conditional_json(request, found[medicine_id], etag, last_modified)
+
+@login_required
+def medicine_details_batch(request):
+    try:
+        ids = parse_medicine_ids(request.GET.get('ids', ''))
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    found, missing, etag, last_modified = product_details(ids)
+    data = {'products': list(found.values()), 'missing': missing}
+    return _conditional_json(request, data, etag, last_modified)
+
+@login_required
+def customer_lookup(request):
+    if request.method == 'POST':
+        try:
+            data = json.loads(request.body)
+        except ValueError:
+            return JsonResponse({'success': False, 'error': 'Invalid request body'}, status=400)
+        form = CustomerForm(data)
+        if not form.is_valid():
+            return JsonResponse({'success': False, 'errors': form.errors}, status=400)
+        return JsonResponse({'success': True, 'customer': customer_data(form.save())}, status=201)
+
+    query = request.GET.get('q', '').strip()
+    try:
+        limit = min(int(request.GET.get('limit', CUSTOMER_LOOKUP_LIMIT)), CUSTOMER_LOOKUP_MAX_LIMIT)
+    except ValueError:
+        limit = CUSTOMER_LOOKUP_LIMIT
+    return JsonResponse({'results': lookup_customers(query, limit=max(limit, 1))})
+
+@login_required
+def catalog_sync(request):
+    since = request.GET.get('since')
+    if since:
+        since = parse_datetime(since)
+        if since is None or timezone.is_naive(since):
+            return JsonResponse({'error': 'since must be a timestamp with a time zone'}, status=400)
+    response = JsonResponse(catalog_delta(since or None))
+    patch_cache_control(response, private=True, no_cache=True)
+    set_response_etag(response)
+    return get_conditional_response(request, etag=response['ETag'], response=response)
+
+@login_required
+def medicine_typeahead(request):
+    query = request.GET.get('q', '').strip()
+    try:
+        limit = min(int(request.GET.get('limit', TYPEAHEAD_LIMIT)), TYPEAHEAD_MAX_LIMIT)
+    except ValueError:
+        limit = TYPEAHEAD_LIMIT
+    results = typeahead(query, limit=max(limit, 1)) if query else []
+    return JsonResponse({'results': results})
+
+@staff_member_required
+def metrics(request):
+    return HttpResponse(render_metrics(),
+                        content_type='text/plain; version=0.0.4; charset=utf-8')
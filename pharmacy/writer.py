@@ -0,0 +1,133 @@
+"""Group-commit checkout writer for the async (ASGI) checkout path.
+
+SQLite has a single writer, so concurrent checkouts take turns on the
+database lock and every one of them pays for its own transaction. Here the
+request only validates the cart; the order is handed to one background
+thread that owns the writes. While it commits one group, new orders queue
+up, and the next transaction takes all of them at once (up to
+``CHECKOUT_GROUP_SIZE``) through ``checkout.record_sales``, which reads
+the stock, inserts the sales and decrements stock with a handful of
+queries for the whole group. A cart that cannot be sold fails alone, and
+every caller gets its own sale or error only after the group has
+committed.
+
+The ORM is synchronous, so the writer is a thread rather than an asyncio
+task; ``checkout`` is the awaitable interface for async views. The POS
+posts here when ``CHECKOUT_GROUP_COMMIT`` is on and the project is served
+through ``pharmacy_management.asgi`` by an ASGI server such as uvicorn.
+"""
+import asyncio
+import atexit
+import queue
+import threading
+from concurrent.futures import Future
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+
+from .checkout import make_order, record_sales
+
+DEFAULT_GROUP_SIZE = 50
+
+_STOP = object()
+
+
+class CheckoutWriter:
+    """Single background thread committing queued checkouts in groups."""
+
+    def __init__(self, group_size=None):
+        self._group_size = group_size
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._exit_registered = False
+        self.groups = 0
+        self.sales = 0
+
+    @property
+    def group_size(self):
+        if self._group_size is not None:
+            return self._group_size
+        return getattr(settings, 'CHECKOUT_GROUP_SIZE', DEFAULT_GROUP_SIZE)
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, name='checkout-writer', daemon=True)
+            self._thread.start()
+            if not self._exit_registered:
+                atexit.register(self.stop)
+                self._exit_registered = True
+
+    def stop(self, timeout=None):
+        """Commit what is queued, then stop the thread."""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None and thread.is_alive():
+            self._queue.put(_STOP)
+            thread.join(timeout)
+
+    def submit(self, cashier, items, **kwargs):
+        """Validate a checkout and queue it; returns a ``Future`` of the sale.
+
+        Takes the arguments of ``process_checkout``. Invalid carts raise
+        ``CheckoutError`` here, before anything is queued.
+        """
+        order = make_order(cashier, items, **kwargs)
+        future = Future()
+        self.start()
+        self._queue.put((order, future))
+        return future
+
+    async def checkout(self, cashier, items, **kwargs):
+        """Awaitable ``process_checkout``: the committed sale, or ``CheckoutError``."""
+        return await asyncio.wrap_future(self.submit(cashier, items, **kwargs))
+
+    def _next_group(self, first):
+        group = [first]
+        while len(group) < self.group_size:
+            try:
+                job = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if job is _STOP:
+                # Let the outer loop see it once this group is written.
+                self._queue.put(_STOP)
+                break
+            group.append(job)
+        return group
+
+    def _run(self):
+        try:
+            while True:
+                job = self._queue.get()
+                if job is _STOP:
+                    return
+                self._commit(self._next_group(job))
+        finally:
+            connections.close_all()
+
+    def _commit(self, group):
+        try:
+            with transaction.atomic():
+                results = record_sales([order for order, _ in group])
+        except Exception as e:
+            # The group did not commit: nothing in it was sold.
+            for _, future in group:
+                future.set_exception(e)
+            return
+        finally:
+            # A dropped or failed connection must not poison the next group.
+            connections[DEFAULT_DB_ALIAS].close_if_unusable_or_obsolete()
+
+        self.groups += 1
+        for (_, future), result in zip(group, results):
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                self.sales += 1
+                future.set_result(result)
+
+
+checkout_writer = CheckoutWriter()
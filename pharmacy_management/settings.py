@@ -18,6 +18,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'pharmacy.middleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -25,6 +26,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'pharmacy.middleware.PrimaryPinMiddleware',
 ]
 
 ROOT_URLCONF = 'pharmacy_management.urls'
@@ -45,12 +47,80 @@ TEMPLATES = [
     },
 ]
 
+# The branch this server sells for, by code, see pharmacy/branches.py. A
+# branch listed in PHARMACY_BRANCH_DATABASES keeps its sales and stock in a
+# database file of its own; the others share db.sqlite3. E.g.
+# PHARMACY_BRANCH_DATABASES=north=/srv/pharmacy/north.sqlite3,south=/srv/pharmacy/south.sqlite3
+PHARMACY_BRANCH = os.environ.get('PHARMACY_BRANCH', '')
+PHARMACY_BRANCH_DATABASES = dict(
+    entry.split('=', 1) for entry in os.environ.get('PHARMACY_BRANCH_DATABASES', '').split(',') if entry
+)
+PRIMARY_DATABASE = Path(PHARMACY_BRANCH_DATABASES.get(PHARMACY_BRANCH, BASE_DIR / 'db.sqlite3'))
+# Sale and job ids are only unique within one database, so the receipts,
+# uploads and cache entries named by them are kept apart per database.
+DATABASE_NAMESPACE = PHARMACY_BRANCH if PHARMACY_BRANCH in PHARMACY_BRANCH_DATABASES else ''
+DATABASE_FILES_DIR = BASE_DIR / 'branches' / DATABASE_NAMESPACE if DATABASE_NAMESPACE else BASE_DIR
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'NAME': PRIMARY_DATABASE,
+        # Keep connections open between requests; pragmas from pharmacy/db.py
+        # are then applied once per connection instead of once per request.
+        'CONN_MAX_AGE': int(os.environ.get('PHARMACY_CONN_MAX_AGE', 600)),
+        'CONN_HEALTH_CHECKS': True,
+        # Transactions take the write lock when they begin, see pharmacy/db.py.
+        'OPTIONS': {'transaction_mode': 'IMMEDIATE'},
+    },
+    # Stand-in read replica, a copy of the primary that
+    # `manage.py refresh_replicas` brings up to date. Tests get a file of
+    # their own.
+    'replica': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': PRIMARY_DATABASE.with_suffix('.replica.sqlite3'),
+        'CONN_MAX_AGE': int(os.environ.get('PHARMACY_CONN_MAX_AGE', 600)),
+        'CONN_HEALTH_CHECKS': True,
+        'TEST': {'NAME': BASE_DIR / 'test_db.replica.sqlite3'},
+    },
+}
+DATABASE_ROUTERS = ['pharmacy.routers.ReplicaRouter']
+# db.sqlite3 in the checkout is tracked by git: WAL mode would rewrite its
+# header and leave -wal and -shm files beside it, so during development it
+# keeps SQLite's rollback journal.
+if DEBUG and PRIMARY_DATABASE == BASE_DIR / 'db.sqlite3':
+    DATABASES['default']['SQLITE_JOURNAL_MODE'] = 'delete'
+
+# Replicas the reporting pages and commands read from, see pharmacy/routers.py,
+# e.g. PHARMACY_READ_REPLICAS=replica. A replica further behind than
+# PHARMACY_REPLICA_MAX_LAG seconds is skipped, and a client that has just
+# written reads the primary for PHARMACY_REPLICA_PIN_SECONDS.
+PHARMACY_READ_REPLICAS = [alias for alias in os.environ.get('PHARMACY_READ_REPLICAS', '').split(',') if alias]
+PHARMACY_REPLICA_MAX_LAG = int(os.environ.get('PHARMACY_REPLICA_MAX_LAG', 60))
+PHARMACY_REPLICA_PIN_SECONDS = 10
+
+# The dashboard figures and the invalidation counters of the in-process
+# caches (pharmacy/cache.py) live here. The local-memory default is per
+# process: with more than one worker, use a shared backend such as Redis or
+# Memcached, or a write in one worker goes unseen by the others.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'pharmacy',
+        'KEY_PREFIX': DATABASE_NAMESPACE,
     }
 }
 
+# Under ASGI the POS can post sales to the group-commit writer instead, see
+# pharmacy/writer.py.
+CHECKOUT_GROUP_COMMIT = os.environ.get('PHARMACY_CHECKOUT_GROUP_COMMIT', '').lower() in ('1', 'on', 'true', 'yes')
+CHECKOUT_GROUP_SIZE = int(os.environ.get('PHARMACY_CHECKOUT_GROUP_SIZE', 50))
+
+# Rendered receipts, see pharmacy/receipts.py.
+RECEIPT_CACHE_DIR = DATABASE_FILES_DIR / 'receipt_cache'
+RECEIPT_CACHE_MAX_BYTES = 64 * 1024 * 1024
+
+# Uploaded stock import files, see pharmacy/imports.py.
+IMPORT_DIR = DATABASE_FILES_DIR / 'imports'
+
 STATIC_URL = '/static/'
 STATICFILES_DIRS = [BASE_DIR / 'static']
\ No newline at end of file